@@ -0,0 +1,127 @@
+"""Admission control for expensive work.
+
+``ConcurrencyLimit`` runs a fixed number of operations at once and lets a
+bounded number more wait for a slot; work beyond that, or work that waits
+too long, is refused with ``Saturated`` and a suggested retry delay.
+``TokenBucket`` rate-limits each client separately. Both keep counters for
+the admin statistics and hold state per worker process.
+"""
+import asyncio
+import math
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+# Weight of the latest duration in the running average
+DURATION_SMOOTHING = 0.2
+
+class Saturated(Exception):
+    """Raised when work is refused; retry_after is in whole seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class ConcurrencyLimit:
+    def __init__(self, limit, max_queue, queue_timeout=30.0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.rejected = Counter()
+        self.avg_seconds = None
+        self._slots = asyncio.Semaphore(limit)
+
+    def retry_after(self):
+        """Rough seconds until a new request would get a slot"""
+        per_operation = self.avg_seconds or 5.0
+        return max(1, math.ceil(per_operation * (self.waiting + 1) / self.limit))
+
+    def reject(self, reason):
+        """Count a refusal and return the Saturated to raise"""
+        self.rejected[reason] += 1
+        return Saturated(reason, self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.active >= self.limit and self.waiting >= self.max_queue:
+            raise self.reject('queue_full')
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self.reject('queue_timeout')
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+            duration = time.monotonic() - start
+            if self.avg_seconds is None:
+                self.avg_seconds = duration
+            else:
+                self.avg_seconds += DURATION_SMOOTHING * (duration - self.avg_seconds)
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'queue_depth': self.waiting,
+            'max_queue_depth': self.max_waiting,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'avg_seconds': round(self.avg_seconds, 3) if self.avg_seconds is not None else None,
+        }
+
+class TokenBucket:
+    """Per-client token buckets refilling at rate tokens per second up to burst.
+
+    A rate of 0 disables limiting. Idle clients are forgotten once more than
+    max_clients are tracked.
+    """
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.rejected = 0
+        # client -> (tokens, monotonic time they were counted)
+        self._buckets = {}
+
+    def take(self, client):
+        """Spend one of client's tokens; returns 0, or the seconds until one is available"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        tokens, counted = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - counted) * self.rate)
+        if tokens >= 1:
+            self._buckets[client] = (tokens - 1, now)
+            if len(self._buckets) > self.max_clients:
+                self._forget_idle(now)
+            return 0
+        self._buckets[client] = (tokens, now)
+        self.rejected += 1
+        return (1 - tokens) / self.rate
+
+    def _forget_idle(self, now):
+        # A bucket idle this long is full again, the same as a new one
+        refill_seconds = self.burst / self.rate
+        self._buckets = {
+            client: bucket for client, bucket in self._buckets.items()
+            if now - bucket[1] < refill_seconds
+        }
+
+    def stats(self):
+        return {'clients': len(self._buckets), 'rejected': self.rejected}
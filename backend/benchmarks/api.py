@@ -0,0 +1,371 @@
+"""Latency and throughput of the API routes against a seeded catalogue.
+
+Each catalogue size runs in a fresh interpreter: a throwaway database is
+seeded with that many products (deterministically, from --seed), the app is
+started in-process, and every route is driven by --concurrency clients for
+--requests requests after a warm-up. The database is a local mongod given by
+--mongo-url, or an in-process mongomock one without it; mongomock numbers
+are only comparable with other mongomock runs.
+
+    cd backend && python benchmarks/api.py --sizes 100,10000 --output run.json
+    python benchmarks/api.py --sizes 100,10000 --compare run.json
+
+Routes measured: list (a page of published products), list_category (a page
+of one category), detail, write (PUT of a product, which also reloads the
+catalogue snapshot) and pdf (a catalogue of --pdf-products products picked
+at random each time, so every build misses the PDF cache).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+IMAGE_MIXES = ('none', 'small', 'large', 'mixed')
+# Edge length in pixels of the generated upload images
+IMAGE_SIZES = {'small': 600, 'large': 2400}
+# Distinct images per size; products share them
+IMAGES_PER_SIZE = 8
+# Refused at once, so a failed fetch costs no timeout
+BROKEN_IMAGE_URL = 'http://127.0.0.1:9/missing.jpg'
+
+SEED_BATCH = 5000
+CATEGORIES = 20
+PAGE_SIZE = 50
+
+# p50 slowdown beyond which --compare flags a route
+REGRESSION_THRESHOLD = 0.10
+
+DESCRIPTION = (
+    "**{name}** is a multifunction copier for busy offices.\n\n"
+    "- Prints, copies and scans up to *{speed} pages per minute*\n"
+    "- Duplex printing and a __50-sheet__ document feeder\n"
+    "- Network and mobile printing\n\n"
+    "Model {i}: reliable output with low running costs."
+)
+
+def write_images(directory, mix, rng):
+    """Generate the upload images of mix; returns size name -> filenames"""
+    from PIL import Image
+
+    files = {}
+    for size_name, edge in IMAGE_SIZES.items():
+        if mix not in (size_name, 'mixed'):
+            continue
+        files[size_name] = []
+        for n in range(IMAGES_PER_SIZE):
+            name = f"bench_{size_name}_{n}.jpg"
+            # Noise compresses like a photo rather than a flat colour
+            pixels = rng.randbytes(edge // 8 * edge // 8 * 3)
+            image = Image.frombytes('RGB', (edge // 8, edge // 8), pixels).resize((edge, edge))
+            image.save(directory / name, 'JPEG', quality=85)
+            files[size_name].append(name)
+    return files
+
+def product_images(i, mix, files, base_url, rng):
+    if mix == 'none':
+        return []
+    if mix != 'mixed':
+        return [f"{base_url}/uploads/{rng.choice(files[mix])}"]
+    # Mostly small, some large and multi-image products, a few broken links
+    kind = i % 10
+    if kind < 5:
+        names = [rng.choice(files['small'])]
+    elif kind < 7:
+        names = rng.sample(files['small'], 3)
+    elif kind < 9:
+        names = [rng.choice(files['large'])]
+    else:
+        return [BROKEN_IMAGE_URL]
+    return [f"{base_url}/uploads/{name}" for name in names]
+
+def catalogue_documents(size, mix, files, base_url, rng):
+    epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    categories = [{
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'name': f"Category {n}",
+        'description': None,
+        'created_at': epoch,
+    } for n in range(CATEGORIES)]
+
+    def products():
+        for i in range(size):
+            created = epoch + timedelta(minutes=i)
+            yield {
+                'id': str(uuid.UUID(int=rng.getrandbits(128))),
+                'name': f"Copier {i:06d}",
+                'description': DESCRIPTION.format(name=f"Copier {i:06d}", speed=20 + i % 60, i=i),
+                'price': round(rng.uniform(100, 5000), 2),
+                'category_id': categories[i % CATEGORIES]['id'],
+                'images': product_images(i, mix, files, base_url, rng),
+                'image_variants': {},
+                'youtube_link': None,
+                # One in ten is a draft, as in a catalogue being edited
+                'status': 'draft' if i % 10 == 9 else 'published',
+                'created_at': created,
+                'updated_at': created,
+            }
+
+    return categories, products()
+
+async def seed(db, size, mix, files, base_url, rng):
+    categories, products = catalogue_documents(size, mix, files, base_url, rng)
+    await db.categories.insert_many(categories)
+    await db.settings.insert_one({
+        'id': 'settings', 'whatsapp_number': '+910000000000',
+        'company_logo': '',
+    })
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) == SEED_BATCH:
+            await db.products.insert_many(batch)
+            batch = []
+    if batch:
+        await db.products.insert_many(batch)
+
+def summarize(latencies, elapsed, errors):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'p50_ms': round(statistics.median(ordered) * 1000, 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 2),
+    }
+
+async def drive(http, make_request, requests, concurrency, warmup):
+    """Send requests from concurrency clients; returns (latencies, seconds, errors)"""
+    for _ in range(warmup):
+        await make_request(http)
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await make_request(http)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start, errors
+
+def route_requests(server, rng, args, token):
+    """route -> (requests to send, async function sending one)"""
+    snapshot = server.catalogue.current
+    published = [p['id'] for p in snapshot.published]
+    categories = list(snapshot.category_names)
+    headers = {'Authorization': f"Bearer {token}"}
+
+    async def list_page(http):
+        return await http.get('/api/products', params={'status': 'published', 'limit': PAGE_SIZE})
+
+    async def list_category(http):
+        return await http.get('/api/products', params={
+            'status': 'published', 'category_id': rng.choice(categories),
+            'sort': '-created_at', 'limit': PAGE_SIZE,
+        })
+
+    async def detail(http):
+        return await http.get(f"/api/products/{rng.choice(published)}")
+
+    async def write(http):
+        product = rng.choice(snapshot.published)
+        return await http.put(f"/api/products/{product['id']}", headers=headers, json={
+            'name': product['name'],
+            'description': product['description'],
+            'price': round(rng.uniform(100, 5000), 2),
+            'category_id': product['category_id'],
+            'images': product['images'],
+            'status': 'published',
+        })
+
+    async def pdf(http):
+        ids = rng.sample(published, min(args.pdf_products, len(published)))
+        return await http.post('/api/generate-pdf', json={'product_ids': ids})
+
+    return {
+        'list': (args.requests, list_page),
+        'list_category': (args.requests, list_category),
+        'detail': (args.requests, detail),
+        'write': (args.write_requests, write),
+        'pdf': (args.pdf_requests, pdf),
+    }
+
+async def run_size(args):
+    """Seed one catalogue size, start the app and measure every route"""
+    workdir = Path(tempfile.mkdtemp(prefix='uc-cat-bench-'))
+    database = f"benchmark_{args.size}_{uuid.uuid4().hex[:8]}"
+    os.environ.update({
+        'MONGO_URL': args.mongo_url or 'mongodb://localhost:27017',
+        'DB_NAME': database,
+        'PDF_CACHE_DIR': str(workdir / 'pdf_cache'),
+        'PDF_JOBS_DIR': str(workdir / 'pdf_jobs'),
+        'PDF_PREBUILT_DIR': str(workdir / 'pdf_prebuilt'),
+        'PDF_SPILL_DIR': str(workdir),
+        # Keep the prebuilt catalogue scheduler and rate limiter out of the numbers
+        'PDF_PREBUILT_DEBOUNCE': '1e9',
+        'PDF_RATE_LIMIT': '0',
+        'PDF_RENDER_WORKERS': str(args.render_workers),
+    })
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, str(BACKEND_DIR))
+    import httpx
+    import server
+
+    if args.mongo_url is None:
+        from mongomock_motor import AsyncMongoMockClient
+        server.client = AsyncMongoMockClient(tz_aware=True)
+        server.db = server.client[database]
+        server.catalogue.db = server.db
+        server.pdf_jobs.db = server.db
+
+    rng = random.Random(args.seed)
+    uploads = workdir / 'uploads'
+    uploads.mkdir()
+    # Read by the PDF image prefetcher, which is created on the first build
+    server.UPLOADS_DIR = uploads
+    files = write_images(uploads, args.images, rng)
+
+    start = time.perf_counter()
+    await seed(server.db, args.size, args.images, files, server.BASE_URL, rng)
+    seed_seconds = time.perf_counter() - start
+
+    results = {}
+    await server.app.router.startup()
+    try:
+        token = server.create_access_token({'sub': os.environ.get('ADMIN_USERNAME', 'admin')})
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as http:
+            for route, (requests, make_request) in route_requests(server, rng, args, token).items():
+                if route not in args.routes or requests <= 0:
+                    continue
+                latencies, elapsed, errors = await drive(
+                    http, make_request, requests, args.concurrency, args.warmup
+                )
+                results[route] = summarize(latencies, elapsed, errors)
+    finally:
+        await server.client.drop_database(database)
+        await server.app.router.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'products': args.size, 'seed_seconds': round(seed_seconds, 2), 'routes': results}
+
+def child_command(args, size):
+    command = [
+        sys.executable, __file__, '--size', str(size), '--seed', str(args.seed),
+        '--images', args.images, '--requests', str(args.requests),
+        '--write-requests', str(args.write_requests), '--pdf-requests', str(args.pdf_requests),
+        '--pdf-products', str(args.pdf_products), '--concurrency', str(args.concurrency),
+        '--warmup', str(args.warmup), '--render-workers', str(args.render_workers),
+        '--routes', ','.join(args.routes),
+    ]
+    if args.mongo_url:
+        command += ['--mongo-url', args.mongo_url]
+    return command
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(run, baseline=None):
+    print(f"{'products':>9} {'route':<14} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7}"
+          + ('  p50 vs baseline' if baseline else ''))
+    previous = {
+        (size['products'], route): stats
+        for size in (baseline or {}).get('sizes', []) for route, stats in size['routes'].items()
+    }
+    for size in run['sizes']:
+        for route, stats in size['routes'].items():
+            line = (f"{size['products']:>9} {route:<14} {stats['p50_ms']:>9.2f} "
+                    f"{stats['p99_ms']:>9.2f} {stats['throughput_rps']:>9.1f} {stats['errors']:>7}")
+            before = previous.get((size['products'], route))
+            if before:
+                change = stats['p50_ms'] / before['p50_ms'] - 1
+                line += f"  {change:+.0%}" + ('  REGRESSION' if change > REGRESSION_THRESHOLD else '')
+            print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='100,10000,100000',
+                        help="comma-separated catalogue sizes (default: %(default)s)")
+    parser.add_argument('--images', choices=IMAGE_MIXES, default='mixed',
+                        help="product images: none, small or large uploads, or a mix with broken links")
+    parser.add_argument('--mongo-url', help="local mongod to use; mongomock when omitted")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200, help="per read route")
+    parser.add_argument('--write-requests', type=int, default=50)
+    parser.add_argument('--pdf-requests', type=int, default=10)
+    parser.add_argument('--pdf-products', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--render-workers', type=int, default=2)
+    parser.add_argument('--routes', default='list,list_category,detail,write,pdf')
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.routes = args.routes.split(',')
+
+    if args.size is not None:
+        print(json.dumps(asyncio.run(run_size(args))))
+        return
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    sizes = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        print(f"benchmarking {size} products...", file=sys.stderr)
+        output = subprocess.run(
+            child_command(args, size), cwd=BACKEND_DIR, capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            sys.exit(f"{size} products failed:\n{output.stderr}")
+        sizes.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    run = {
+        'started_at': started_at,
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'database': 'mongod' if args.mongo_url else 'mongomock',
+        'settings': {
+            key: getattr(args, key) for key in (
+                'images', 'seed', 'requests', 'write_requests', 'pdf_requests',
+                'pdf_products', 'concurrency', 'warmup', 'render_workers',
+            )
+        },
+        'sizes': sizes,
+    }
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+    print_report(run, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(run, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""CPU cost per request of the catalogue read routes, with and without the
+fast JSON path (FAST_JSON_RESPONSES).
+
+The routes are served from an in-memory snapshot of synthetic products, so
+no MongoDB server is needed and the numbers isolate validation and encoding.
+
+    cd backend && python benchmarks/serialization.py --products 1000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from catalogue_snapshot import CatalogueSnapshot  # noqa: E402
+
+def synthetic_catalogue(count):
+    now = datetime.now(timezone.utc)
+    categories = [
+        {'id': str(uuid.uuid4()), 'name': f'Category {i}', 'description': None, 'created_at': now}
+        for i in range(10)
+    ]
+    products = []
+    for i in range(count):
+        image = f"{server.BASE_URL}/uploads/{uuid.uuid4().hex}.jpg"
+        products.append({
+            'id': str(uuid.uuid4()),
+            'name': f'Product {i}',
+            'description': f'Description of product {i} ' * 4,
+            'price': 10.0 + i,
+            'category_id': categories[i % len(categories)]['id'],
+            'images': [image],
+            'image_variants': {image: {
+                name: {'url': image, 'width': width, 'height': width, 'bytes': width * 40}
+                for name, width in (('thumb', 200), ('card', 600), ('print', 1600))
+            }},
+            'youtube_link': None,
+            'status': 'published',
+            'created_at': now - timedelta(minutes=i),
+            'updated_at': now - timedelta(minutes=i),
+        })
+    settings = {'id': 'settings', 'whatsapp_number': '', 'company_logo': ''}
+    return CatalogueSnapshot({}, categories, settings, products)
+
+def cpu_per_request(client, url, requests):
+    client.get(url)  # warm up
+    start = time.process_time()
+    for _ in range(requests):
+        response = client.get(url)
+        assert response.status_code == 200, response.text
+    return (time.process_time() - start) / requests * 1000
+
+def main():
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    snapshot = synthetic_catalogue(args.products)
+    server.catalogue.current = snapshot
+    routes = {
+        'list': '/api/products?status=published',
+        'list (card images)': '/api/products?status=published&image_variant=card',
+        'detail': f"/api/products/{snapshot.published[0]['id']}",
+        'categories': '/api/categories',
+    }
+
+    # Without the context manager no startup hooks run, so MongoDB is never contacted
+    client = TestClient(server.app)
+    print(f"{args.products} products, {args.requests} requests per route, CPU ms per request")
+    print(f"{'route':<20} {'validating':>11} {'fast':>9} {'saved':>7}")
+    for name, url in routes.items():
+        server.FAST_JSON_RESPONSES = False
+        slow = cpu_per_request(client, url, args.requests)
+        server.FAST_JSON_RESPONSES = True
+        fast = cpu_per_request(client, url, args.requests)
+        print(f"{name:<20} {slow:>11.3f} {fast:>9.3f} {1 - fast / slow:>7.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Import time and resident memory of a fresh API worker.
+
+Each run starts a new interpreter, imports ``server`` the way uvicorn does,
+then loads the PDF engine as the first catalogue build would. The medians
+show what a worker that only serves the CRUD API pays, and what the PDF
+engine adds once it is needed.
+
+    cd backend && python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Third-party packages only the PDF engine and image processing need
+HEAVY_PACKAGES = ('reportlab', 'PIL', 'httpx')
+
+PROBE = """
+import json, os, sys, time
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def loaded():
+    return sorted(name for name in %(heavy)r if name in sys.modules)
+
+result = {}
+start = time.perf_counter()
+import server
+result['server'] = {'seconds': time.perf_counter() - start, 'rss_kb': rss_kb(), 'loaded': loaded()}
+start = time.perf_counter()
+import pdf_renderer, pdf_images, PIL.Image
+result['pdf_engine'] = {'seconds': time.perf_counter() - start, 'rss_kb': rss_kb(), 'loaded': loaded()}
+print(json.dumps(result))
+"""
+
+def probe():
+    env = {
+        'MONGO_URL': 'mongodb://localhost:27017',
+        'DB_NAME': 'benchmark',
+        **os.environ,
+    }
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE % {'heavy': HEAVY_PACKAGES}],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help="print the raw measurements")
+    args = parser.parse_args()
+
+    runs = [probe() for _ in range(args.runs)]
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return
+
+    print(f"median of {args.runs} fresh interpreters")
+    print(f"{'stage':<22} {'import ms':>10} {'RSS MiB':>9}  heavy packages loaded")
+    for stage, label in (('server', 'import server'), ('pdf_engine', '+ first PDF build')):
+        seconds = statistics.median(run[stage]['seconds'] for run in runs)
+        rss = statistics.median(run[stage]['rss_kb'] for run in runs)
+        loaded = ', '.join(runs[-1][stage]['loaded']) or '-'
+        print(f"{label:<22} {seconds * 1000:>10.1f} {rss / 1024:>9.1f}  {loaded}")
+
+if __name__ == '__main__':
+    main()
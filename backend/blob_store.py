@@ -0,0 +1,124 @@
+"""Content-addressed image storage under the uploads directory.
+
+Blobs are named by the SHA-256 of their bytes (``blobs/<sha256><ext>``), so the
+same image stored from several products or from the settings logo is kept on
+disk once and always maps to the same URL. Uploads are streamed in through
+``BlobWriter``, which hashes the bytes as they are written.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+
+BLOBS_DIRNAME = 'blobs'
+
+MIME_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+# Leading bytes of each accepted image format -> extension
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+]
+
+DATA_URI_RE = re.compile(r'^data:(?P<mime>[\w/+.-]+);base64,(?P<data>.*)$', re.DOTALL)
+
+class InvalidDataURI(ValueError):
+    """Raised for data URIs that are malformed or not a supported image type"""
+
+def is_data_uri(value):
+    return isinstance(value, str) and value.startswith('data:')
+
+def decode_data_uri(uri):
+    """Return (bytes, extension) for a base64 image data URI"""
+    match = DATA_URI_RE.match(uri)
+    if not match:
+        raise InvalidDataURI("Only base64 data URIs are supported")
+    ext = MIME_EXTENSIONS.get(match.group('mime').lower())
+    if ext is None:
+        raise InvalidDataURI(f"Unsupported image type: {match.group('mime')}")
+    try:
+        data = base64.b64decode(match.group('data'), validate=True)
+    except binascii.Error:
+        raise InvalidDataURI("Invalid base64 image data")
+    return data, ext
+
+def sniff_image_type(head):
+    """Return the extension matching the magic bytes at the start of a file, or None"""
+    # WebP is a RIFF container: "RIFF" <size> "WEBP"
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+class BlobWriter:
+    """Streams one blob to a temporary file, hashing it on the way in"""
+
+    def __init__(self, store, ext):
+        self.store = store
+        self.ext = ext
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._tmp_path = store.directory / f".upload.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """Move the data into place and return (filename, created) like BlobStore.put"""
+        self._file.close()
+        filename = self.store.filename_for(self._hash.hexdigest(), self.ext)
+        path = self.store.uploads_dir / filename
+        if path.exists():
+            self._tmp_path.unlink()
+            return filename, False
+        os.replace(self._tmp_path, path)
+        return filename, True
+
+    def abort(self):
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+class BlobStore:
+    def __init__(self, uploads_dir):
+        self.uploads_dir = Path(uploads_dir)
+        self.directory = self.uploads_dir / BLOBS_DIRNAME
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def filename_for(self, digest, ext):
+        """Blob filename relative to the uploads directory"""
+        return f"{BLOBS_DIRNAME}/{digest}{ext}"
+
+    def put(self, data, ext):
+        """Store data and return (filename, created); existing blobs are not rewritten"""
+        digest = hashlib.sha256(data).hexdigest()
+        filename = self.filename_for(digest, ext)
+        path = self.uploads_dir / filename
+        if path.exists():
+            return filename, False
+        tmp_path = self.directory / f".{digest}.{os.getpid()}.tmp"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return filename, True
+
+    def writer(self, ext):
+        return BlobWriter(self, ext)
+
+    def put_data_uri(self, uri):
+        data, ext = decode_data_uri(uri)
+        return self.put(data, ext)
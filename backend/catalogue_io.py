@@ -0,0 +1,111 @@
+"""Catalogue export and import formats.
+
+Products and categories are exchanged as NDJSON (one JSON document per line)
+or CSV with a fixed column set. List fields such as ``images`` are stored in
+CSV cells as JSON. Both directions work one document at a time so exports and
+imports run in constant memory whatever the catalogue size.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+FILE_EXTENSIONS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}
+
+FIELDS = {
+    'products': [
+        'id', 'name', 'description', 'price', 'category_id', 'images',
+        'youtube_link', 'status', 'created_at', 'updated_at',
+    ],
+    'categories': ['id', 'name', 'description', 'created_at'],
+}
+
+# Columns holding lists, JSON-encoded in CSV cells
+JSON_COLUMNS = {'images'}
+
+class ImportRowError(ValueError):
+    """A row that could not be parsed"""
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def ndjson_line(doc):
+    return json.dumps(doc, default=_json_default, ensure_ascii=False) + '\n'
+
+def csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+def csv_header(collection):
+    return csv_line(FIELDS[collection])
+
+def csv_row(collection, doc):
+    values = []
+    for field in FIELDS[collection]:
+        value = doc.get(field)
+        if field in JSON_COLUMNS:
+            value = json.dumps(value or [])
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        values.append('' if value is None else value)
+    return csv_line(values)
+
+def format_for_filename(filename):
+    for ext, fmt in FILE_EXTENSIONS.items():
+        if (filename or '').lower().endswith(ext):
+            return fmt
+    return None
+
+def _ndjson_rows(text):
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            doc = json.loads(line)
+        except ValueError as e:
+            yield line_number, ImportRowError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(doc, dict):
+            yield line_number, ImportRowError("Each line must be a JSON object")
+            continue
+        yield line_number, doc
+
+def _csv_rows(text):
+    reader = csv.DictReader(text)
+    for row in reader:
+        # line_num is the reader's position after the row, which may span lines
+        line_number = reader.line_num
+        doc = {}
+        try:
+            for field, value in row.items():
+                if field is None or value is None or value == '':
+                    continue
+                doc[field] = json.loads(value) if field in JSON_COLUMNS else value
+        except ValueError as e:
+            yield line_number, ImportRowError(f"Invalid JSON in list column: {e}")
+            continue
+        yield line_number, doc
+
+def read_rows(binary_file, file_format):
+    """Yield (line number, document or ImportRowError) from an uploaded file, lazily"""
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        return _csv_rows(text)
+    return _ndjson_rows(text)
+
+def next_batch(rows, size):
+    """Pull up to size rows; blocking, so call it off the event loop"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            break
+    return batch
@@ -0,0 +1,300 @@
+"""In-memory snapshot of the public catalogue.
+
+Categories, settings and published products (with their search index) are
+loaded into one immutable ``CatalogueSnapshot`` that read routes serve without
+touching MongoDB. Every change builds a new snapshot and swaps the single
+reference, so a request always sees one consistent version of the catalogue.
+
+A snapshot records the ``versions`` counters (see ``bump_versions`` in
+server.py) its contents cover. A write that moves a counter by exactly one
+is applied to the current snapshot on its own: changed products are re-read
+by id, categories and settings are small enough to re-read whole. Anything
+else, such as a gap left by a write not seen yet, re-reads the collection.
+All changes go through one lock, so a snapshot is never replaced by one
+built from older data, and snapshots are built off the event loop.
+
+Each worker applies its own writes as it makes them and follows the other
+workers' through a MongoDB change stream on the catalogue collections.
+Standalone servers have no change streams; there the worker polls the
+``versions`` counters instead and reloads the whole catalogue when another
+worker changed it.
+"""
+import asyncio
+import bisect
+import logging
+from types import MappingProxyType
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ('categories', 'products', 'settings', 'versions')
+
+def catalogue_order(product):
+    """Sort key of published products in the snapshot"""
+    return (product['created_at'], product['id'])
+
+def _strip_object_ids(products):
+    """Remove the MongoDB _ids of products; returns _id -> product id"""
+    return {product.pop('_id'): product['id'] for product in products}
+
+class CatalogueSnapshot:
+    """One consistent, read-only view of the catalogue.
+
+    The containers are immutable; the documents inside are shared between
+    requests, so copy one before modifying it. Published products are in
+    catalogue order (oldest first).
+    """
+    __slots__ = (
+        'versions', 'categories', 'category_names', 'categories_by_id',
+        'settings', 'published', 'published_by_id', 'search',
+    )
+
+    def __init__(self, versions, categories, settings, published, search=None):
+        self.versions = MappingProxyType(dict(versions))
+        self.categories = tuple(categories)
+        self.categories_by_id = MappingProxyType({cat['id']: cat for cat in self.categories})
+        self.category_names = MappingProxyType({cat['id']: cat['name'] for cat in self.categories})
+        self.settings = MappingProxyType(dict(settings)) if settings else None
+        self.published = tuple(published)
+        self.published_by_id = MappingProxyType({p['id']: p for p in self.published})
+        self.search = SearchIndex(self.published) if search is None else search
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError("CatalogueSnapshot is immutable")
+        object.__setattr__(self, name, value)
+
+    def with_products(self, versions, categories, settings, products, product_ids):
+        """
+        A snapshot in which the products of product_ids are replaced by
+        products, the current documents of those ids: published ones take
+        their place in catalogue order, the others are dropped.
+        """
+        changed = {p['id']: p for p in products if p.get('status') == 'published'}
+        stale = set(product_ids) | changed.keys()
+        published = [p for p in self.published if p['id'] not in stale]
+        for product in changed.values():
+            bisect.insort(published, product, key=catalogue_order)
+        search = self.search.updated(changed.values(), stale)
+        return CatalogueSnapshot(versions, categories, settings, published, search)
+
+class SnapshotStore:
+    """Holds the current snapshot and keeps it in step with the database"""
+
+    def __init__(self, db, poll_interval=2.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.current = CatalogueSnapshot({}, [], None, [])
+        self.reloads = 0
+        self.updates = 0
+        self.mode = None  # "change-stream" or "polling" once started
+        # Called with each new snapshot after it is swapped in
+        self.listeners = []
+        self._lock = asyncio.Lock()
+        # MongoDB _id -> id of published products, to place delete events
+        self._object_ids = {}
+        # Products changed in the change stream since the last products version
+        self._changed_products = set()
+        self._dirty = asyncio.Event()
+        self._tasks = []
+
+    async def _read_versions(self):
+        docs = await self.db.versions.find({}).to_list(None)
+        return {doc['_id']: doc['version'] for doc in docs}
+
+    async def _read_categories(self):
+        return await self.db.categories.find({}, {"_id": 0}).to_list(None)
+
+    async def _read_settings(self):
+        return await self.db.settings.find_one({"id": "settings"}, {"_id": 0})
+
+    async def _read_published(self):
+        # With their _ids, which change stream delete events carry
+        return await self.db.products.find({"status": "published"}).sort(
+            [('created_at', 1), ('id', 1)]
+        ).to_list(None)
+
+    def _swap(self, snapshot):
+        self.current = snapshot
+        for listener in self.listeners:
+            listener(snapshot)
+
+    async def load(self):
+        """Read the whole catalogue and swap in a new snapshot"""
+        async with self._lock:
+            # Versions first: a write landing mid-load then shows up as a newer
+            # version on the next change rather than as stale data under a new one
+            versions = await self._read_versions()
+            categories = await self._read_categories()
+            settings = await self._read_settings()
+            published = await self._read_published()
+
+            def build():
+                object_ids = _strip_object_ids(published)
+                return object_ids, CatalogueSnapshot(versions, categories, settings, published)
+
+            # Indexing the whole catalogue is CPU-bound; keep it off the event loop
+            self._object_ids, snapshot = await asyncio.to_thread(build)
+            self.reloads += 1
+            self._swap(snapshot)
+            return snapshot
+
+    async def apply(self, versions, product_ids=None):
+        """
+        Bring in the writes that moved collections to versions (name ->
+        version). Versions the snapshot already covers are skipped.
+        product_ids, if given, are the only products the products write
+        touched.
+        """
+        async with self._lock:
+            current = self.current
+            covered = current.versions
+            pending = {name: v for name, v in versions.items() if v > covered.get(name, 0)}
+            if not pending:
+                return current
+            if any(v != covered.get(name, 0) + 1 for name, v in pending.items()):
+                # Another write came first and is not in the snapshot yet
+                fresh = await self._read_versions()
+                pending = {name: fresh.get(name, 0) for name in pending}
+                product_ids = None
+
+            categories = current.categories
+            if 'categories' in pending:
+                categories = await self._read_categories()
+            settings = current.settings
+            if 'settings' in pending:
+                settings = await self._read_settings()
+            versions = {**covered, **pending}
+
+            if 'products' not in pending:
+                build = lambda: (None, CatalogueSnapshot(
+                    versions, categories, settings, current.published, current.search
+                ))
+            elif product_ids is None:
+                published = await self._read_published()
+                build = lambda: (
+                    _strip_object_ids(published),
+                    CatalogueSnapshot(versions, categories, settings, published),
+                )
+            else:
+                products = await self.db.products.find({"id": {"$in": list(product_ids)}}).to_list(None)
+                build = lambda: (
+                    {**self._object_ids, **_strip_object_ids(products)},
+                    current.with_products(versions, categories, settings, products, product_ids),
+                )
+
+            object_ids, snapshot = await asyncio.to_thread(build)
+            if object_ids is not None:
+                self._object_ids = object_ids
+            self.updates += 1
+            self._swap(snapshot)
+            return snapshot
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    async def start(self):
+        await self.load()
+        self._tasks = [
+            asyncio.create_task(self._reloader()),
+            asyncio.create_task(self._watch()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _reloader(self):
+        # Bursts of reload requests collapse into one reload
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self.load()
+            except PyMongoError as e:
+                logger.warning(f"Catalogue snapshot reload failed: {e!r}")
+                self._dirty.set()
+                await asyncio.sleep(self.poll_interval)
+
+    async def _watch(self):
+        pipeline = [{'$match': {'ns.coll': {'$in': list(WATCHED_COLLECTIONS)}}}]
+        while True:
+            try:
+                async with self.db.watch(pipeline, full_document='updateLookup') as stream:
+                    self.mode = 'change-stream'
+                    logger.info("Catalogue snapshot following the change stream")
+                    # Anything written before the stream opened
+                    self._changed_products = set()
+                    self.mark_dirty()
+                    async for change in stream:
+                        await self._follow(change)
+            except OperationFailure as e:
+                # Standalone servers do not support change streams
+                logger.info(f"Change streams unavailable ({e}); polling catalogue versions")
+                break
+            except PyMongoError as e:
+                logger.warning(f"Catalogue change stream interrupted: {e!r}")
+                await asyncio.sleep(self.poll_interval)
+            except Exception as e:
+                logger.warning(f"Cannot follow the change stream ({e!r}); polling catalogue versions")
+                break
+        await self._poll()
+
+    async def _follow(self, change):
+        """
+        Apply one change stream event. Product events are collected until the
+        products version moves, which every catalogue write does after its
+        documents are written.
+        """
+        collection = change['ns']['coll']
+        if collection == 'products':
+            document = change.get('fullDocument')
+            if document and 'id' in document:
+                self._changed_products.add(document['id'])
+            elif change['documentKey']['_id'] in self._object_ids:
+                self._changed_products.add(self._object_ids[change['documentKey']['_id']])
+        elif collection == 'versions':
+            name = change['documentKey']['_id']
+            version = change.get('updateDescription', {}).get('updatedFields', {}).get('version')
+            if version is None:
+                version = (change.get('fullDocument') or {}).get('version')
+            if version is None:
+                self.mark_dirty()
+                return
+            product_ids = None
+            if name == 'products':
+                product_ids, self._changed_products = self._changed_products, set()
+            try:
+                await self.apply({name: version}, product_ids)
+            except PyMongoError as e:
+                logger.warning(f"Applying a catalogue change failed: {e!r}")
+                self.mark_dirty()
+        # Category and settings changes are read when their version moves
+
+    async def _poll(self):
+        self.mode = 'polling'
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                versions = await self._read_versions()
+            except PyMongoError as e:
+                logger.warning(f"Catalogue version poll failed: {e!r}")
+                continue
+            if versions != dict(self.current.versions):
+                self.mark_dirty()
+
+    def stats(self):
+        snapshot = self.current
+        return {
+            'mode': self.mode,
+            'reloads': self.reloads,
+            'updates': self.updates,
+            'versions': dict(snapshot.versions),
+            'categories': len(snapshot.categories),
+            'published_products': len(snapshot.published),
+        }
@@ -0,0 +1,64 @@
+"""Fast JSON responses for documents read from our own database.
+
+FastAPI validates every returned value against the route's response model and
+then encodes it with ``jsonable_encoder`` and the standard json module. For
+catalogue reads that work is redundant: the documents were validated by the
+same models when they were written. ``dump_trusted`` only reduces a document
+to the model's fields and fills in defaults, and ``trusted_response`` encodes
+the result with orjson. Routes keep their ``response_model`` so the OpenAPI
+schema is unchanged.
+"""
+import typing
+from functools import lru_cache
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+# Dates come back from MongoDB as UTC datetimes; encode them the way pydantic does
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC
+
+_MISSING = object()
+
+def _item_model(annotation):
+    """The model of a List[Model] field, else None"""
+    if typing.get_origin(annotation) is list:
+        (item,) = typing.get_args(annotation)
+        if isinstance(item, type) and issubclass(item, BaseModel):
+            return item
+    return None
+
+@lru_cache(maxsize=None)
+def _fields(model):
+    return tuple(
+        (name, field, _item_model(field.annotation))
+        for name, field in model.model_fields.items()
+    )
+
+def dump_trusted(doc, model):
+    """
+    doc reduced to the fields of model, with defaults for missing ones,
+    without validating or converting the values.
+    """
+    out = {}
+    for name, field, item_model in _fields(model):
+        value = doc.get(name, _MISSING)
+        if value is _MISSING:
+            if field.is_required():
+                continue
+            value = field.get_default(call_default_factory=True)
+        elif item_model is not None and value is not None:
+            value = [dump_trusted(item, item_model) for item in value]
+        out[name] = value
+    return out
+
+def trusted_response(content, model, many=False, headers=None):
+    """A JSON response for one trusted document, or a list of them if many"""
+    if many:
+        body = [dump_trusted(doc, model) for doc in content]
+    else:
+        body = dump_trusted(content, model)
+    response = Response(orjson.dumps(body, option=ORJSON_OPTIONS), media_type='application/json')
+    if headers is not None:
+        response.headers.update(headers)
+    return response
@@ -0,0 +1,69 @@
+"""Resized, recompressed derivatives of uploaded images.
+
+Every upload gets a small thumbnail, a card-size WebP for the catalogue grid
+and a print JPEG sized for the 2 x 1.6 inch image slot of the PDF. Derivatives
+live in ``uploads/variants/`` next to the untouched original.
+
+Pillow is imported on the first upload rather than with the module, so API
+workers that only serve reads do not load it.
+"""
+from pathlib import Path
+
+VARIANTS_DIRNAME = 'variants'
+
+# name -> bounding box, output format, file extension, encoder quality
+VARIANTS = {
+    'thumb': {'size': (200, 200), 'format': 'WEBP', 'ext': '.webp', 'quality': 75},
+    'card': {'size': (600, 600), 'format': 'WEBP', 'ext': '.webp', 'quality': 80},
+    # 2 x 1.6 inches at 300 dpi
+    'print': {'size': (600, 480), 'format': 'JPEG', 'ext': '.jpg', 'quality': 85},
+}
+
+def variant_filename(filename, name):
+    return f"{Path(filename).stem}_{name}{VARIANTS[name]['ext']}"
+
+def _prepare(image, fmt):
+    from PIL import Image
+
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel; flatten onto white like the PDF background
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA')
+    return image
+
+def generate_variants(uploads_dir, filename):
+    """Write every derivative of the upload at uploads_dir/filename and return their metadata.
+
+    Returns ``{name: {"filename", "width", "height", "bytes"}}`` where filename
+    is relative to the uploads directory.
+    """
+    from PIL import Image, ImageOps
+
+    uploads_dir = Path(uploads_dir)
+    variants_dir = uploads_dir / VARIANTS_DIRNAME
+    variants_dir.mkdir(exist_ok=True)
+
+    with Image.open(uploads_dir / filename) as source:
+        # Phone photos carry their rotation in EXIF
+        source = ImageOps.exif_transpose(source)
+        source.load()
+
+    result = {}
+    for name, spec in VARIANTS.items():
+        image = source.copy()
+        image.thumbnail(spec['size'], Image.LANCZOS)
+        image = _prepare(image, spec['format'])
+        variant_name = variant_filename(filename, name)
+        target = variants_dir / variant_name
+        image.save(target, spec['format'], quality=spec['quality'], optimize=True)
+        result[name] = {
+            'filename': f"{VARIANTS_DIRNAME}/{variant_name}",
+            'width': image.width,
+            'height': image.height,
+            'bytes': target.stat().st_size,
+        }
+    return result
@@ -0,0 +1,131 @@
+"""The MongoDB index set the API relies on.
+
+``INDEXES`` declares every index per collection; ``ensure_indexes`` creates any
+that are missing at startup, and ``check_route_queries`` runs ``explain()`` on
+the queries the routes issue to report any that would scan a collection or
+sort in memory.
+"""
+import logging
+import time
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+def _sorted_listing(field):
+    """Product listing indexes for one sort field (see get_products)"""
+    return [
+        IndexModel([(field, 1), ('id', 1)]),
+        IndexModel([('status', 1), (field, 1), ('id', 1)]),
+        IndexModel([('status', 1), ('category_id', 1), (field, 1), ('id', 1)]),
+    ]
+
+INDEXES = {
+    'products': [
+        IndexModel([('id', 1)], unique=True),
+        # Category-only listing and the cascade in delete_category
+        IndexModel([('category_id', 1), ('created_at', 1), ('id', 1)]),
+        # Includes the (status, category_id, created_at) listing index; the
+        # created_at prefixes also serve created_after/created_before ranges
+        *_sorted_listing('created_at'),
+        *_sorted_listing('price'),
+        *_sorted_listing('name'),
+    ],
+    'categories': [
+        IndexModel([('id', 1)], unique=True),
+    ],
+    'settings': [
+        IndexModel([('id', 1)], unique=True),
+    ],
+    'images': [
+        IndexModel([('filename', 1)], unique=True),
+    ],
+    'imports': [
+        IndexModel([('id', 1)], unique=True),
+        IndexModel([('started_at', -1)]),
+    ],
+    'pdf_jobs': [
+        IndexModel([('id', 1)], unique=True),
+        # Claiming the oldest job that is queued or lost its worker
+        IndexModel([('status', 1), ('created_at', 1), ('lease_until', 1)]),
+        # Finished jobs are removed once their download expires
+        IndexModel([('expires_at', 1)], expireAfterSeconds=0),
+    ],
+}
+
+# Representative query of each route: (route, collection, filter, sort)
+ROUTE_QUERIES = [
+    ('GET /categories/{id}', 'categories', {'id': 'x'}, None),
+    ('GET /products/{id}', 'products', {'id': 'x'}, None),
+    ('GET /products?category_id', 'products', {'category_id': 'x'}, None),
+    ('GET /products?status', 'products', {'status': 'published'}, None),
+    ('GET /products?status&category_id', 'products', {'status': 'published', 'category_id': 'x'}, None),
+    ('GET /products?limit', 'products', {}, [('created_at', 1), ('id', 1)]),
+    ('GET /products?status&sort=-price&limit', 'products', {'status': 'published'}, [('price', -1), ('id', -1)]),
+    ('GET /products?status&category_id&sort=name&limit', 'products',
+     {'status': 'published', 'category_id': 'x'}, [('name', 1), ('id', 1)]),
+    ('GET /products?created_after&created_before', 'products',
+     {'created_at': {'$gte': 'x', '$lt': 'y'}}, None),
+    ('GET /products?status&created_after&limit', 'products',
+     {'status': 'published', 'created_at': {'$gte': 'x'}}, [('created_at', 1), ('id', 1)]),
+    ('GET /settings', 'settings', {'id': 'settings'}, None),
+    ('POST /generate-pdf', 'products', {'id': {'$in': ['x', 'y']}}, None),
+    ('DELETE /categories/{id}', 'products', {'category_id': 'x'}, None),
+    ('POST /products (image variants)', 'images', {'filename': {'$in': ['x']}}, None),
+    ('GET /imports', 'imports', {}, [('started_at', -1)]),
+    ('GET /pdf-jobs/{id}', 'pdf_jobs', {'id': 'x'}, None),
+    ('PDF job claim', 'pdf_jobs',
+     {'status': {'$in': ['queued', 'running']}, 'lease_until': {'$lte': 'x'}}, [('created_at', 1)]),
+]
+
+async def ensure_indexes(db):
+    """Create any declared index that does not exist yet, logging each build"""
+    for collection, models in INDEXES.items():
+        existing = set((await db[collection].index_information()).keys())
+        missing = [model for model in models if model.document['name'] not in existing]
+        if not missing:
+            logger.info(f"{collection}: all {len(models)} indexes present")
+            continue
+        logger.info(f"{collection}: building {len(missing)} of {len(models)} indexes")
+        for number, model in enumerate(missing, start=1):
+            name = model.document['name']
+            started = time.monotonic()
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                # e.g. duplicate ids blocking a unique index; keep serving
+                logger.error(f"{collection}: could not build index {name}: {e}")
+                continue
+            logger.info(
+                f"{collection}: built index {name} ({number}/{len(missing)}) "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    yield plan.get('stage')
+    if 'inputStage' in plan:
+        yield from _plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+    # Slot-based engine wraps the classic plan
+    if 'queryPlan' in plan:
+        yield from _plan_stages(plan['queryPlan'])
+
+async def check_route_queries(db):
+    """explain() each route query; returns [(route, stages, problems)]"""
+    report = []
+    for route, collection, query, sort in ROUTE_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explained = await cursor.explain()
+        stages = [s for s in _plan_stages(explained['queryPlanner']['winningPlan']) if s]
+        problems = []
+        if 'COLLSCAN' in stages:
+            problems.append('collection scan')
+        if 'SORT' in stages:
+            problems.append('in-memory sort')
+        report.append((route, stages, problems))
+    return report
@@ -0,0 +1,219 @@
+"""Maintenance commands for the catalogue backend.
+
+Run from the backend directory, e.g. ``python manage.py backfill-variants``.
+Commands use the same ``.env`` configuration as the API server.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from blob_store import BLOBS_DIRNAME, InvalidDataURI, is_data_uri
+from image_variants import generate_variants
+from indexes import check_route_queries, ensure_indexes
+from server import (
+    ALLOWED_IMAGE_EXTENSIONS, DATE_FIELDS, UPLOADS_DIR, bump_versions, client, db,
+    resolve_image_variants, store_inline_image
+)
+
+logger = logging.getLogger('manage')
+
+BATCH_SIZE = 500
+
+async def write_batch(collection, batch):
+    """Run one unordered bulk write and return how many documents it modified"""
+    if not batch:
+        return 0
+    result = await collection.bulk_write(batch, ordered=False)
+    return result.modified_count
+
+async def backfill_variants(args):
+    """Create missing derivatives for files in uploads/ and record them on products"""
+    created = 0
+    uploads = [*UPLOADS_DIR.iterdir(), *(UPLOADS_DIR / BLOBS_DIRNAME).glob('*')]
+    for path in sorted(uploads):
+        if not path.is_file() or path.suffix.lower() not in ALLOWED_IMAGE_EXTENSIONS:
+            continue
+        filename = path.relative_to(UPLOADS_DIR).as_posix()
+        if not args.force and await db.images.find_one({"filename": filename}):
+            continue
+        try:
+            variants = await asyncio.to_thread(generate_variants, UPLOADS_DIR, filename)
+        except Exception as e:
+            logger.warning(f"Skipping {filename}: {e!r}")
+            continue
+        await db.images.update_one(
+            {"filename": filename}, {"$set": {"variants": variants}}, upsert=True
+        )
+        created += 1
+    logger.info(f"Created variants for {created} uploads")
+
+    updated = 0
+    batch = []
+    cursor = db.products.find({"images.0": {"$exists": True}}, {"_id": 0, "id": 1, "images": 1})
+    async for product in cursor:
+        variants = await resolve_image_variants(product['images'])
+        batch.append(UpdateOne({"id": product['id']}, {"$set": {"image_variants": variants}}))
+        if len(batch) >= BATCH_SIZE:
+            updated += await write_batch(db.products, batch)
+            batch = []
+    updated += await write_batch(db.products, batch)
+    await bump_versions(['products'])
+    logger.info(f"Recorded variants on {updated} products")
+
+async def migrate_inline_images(args):
+    """Move base64 images out of product and settings documents into the blob store.
+
+    Safe to run against a live server: each document is only rewritten if its
+    images are unchanged since they were read, and the command can be re-run
+    to pick up anything that was skipped.
+    """
+    now = datetime.now(timezone.utc)
+    scanned = migrated = 0
+    batch = []
+    cursor = db.products.find(
+        {"images": {"$regex": "^data:"}}, {"_id": 0, "id": 1, "images": 1}
+    ).batch_size(args.batch_size)
+    async for product in cursor:
+        scanned += 1
+        try:
+            images = [await store_inline_image(image) for image in product['images']]
+        except InvalidDataURI as e:
+            logger.warning(f"Skipping product {product['id']}: {e}")
+            continue
+        batch.append(UpdateOne(
+            {"id": product['id'], "images": product['images']},
+            {"$set": {
+                "images": images,
+                "image_variants": await resolve_image_variants(images),
+                "updated_at": now,
+            }}
+        ))
+        if len(batch) >= args.batch_size:
+            migrated += await write_batch(db.products, batch)
+            logger.info(f"Migrated {migrated} of {scanned} products so far")
+            batch = []
+    migrated += await write_batch(db.products, batch)
+    await bump_versions(['products'])
+    logger.info(f"Migrated {migrated} of {scanned} products with inline images")
+
+    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0, "company_logo": 1})
+    if settings and is_data_uri(settings.get('company_logo')):
+        try:
+            logo_url = await store_inline_image(settings['company_logo'])
+        except InvalidDataURI as e:
+            logger.warning(f"Skipping company logo: {e}")
+        else:
+            await db.settings.update_one(
+                {"id": "settings", "company_logo": settings['company_logo']},
+                {"$set": {"company_logo": logo_url}}
+            )
+            await bump_versions(['settings'])
+            logger.info("Migrated company logo")
+
+def parse_iso_date(value):
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+async def migrate_dates(args):
+    """Convert ISO string dates to BSON datetimes and give products without a status one.
+
+    Safe to run against a live server: each document is only rewritten if
+    the fields still hold the values that were read.
+    """
+    for collection, fields in DATE_FIELDS.items():
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        if collection == 'products':
+            query["$or"].append({"status": {"$exists": False}})
+        projection = {field: 1 for field in fields}
+        projection['status'] = 1
+
+        scanned = migrated = 0
+        batch = []
+        cursor = db[collection].find(query, projection).batch_size(args.batch_size)
+        async for doc in cursor:
+            scanned += 1
+            match = {"_id": doc['_id']}
+            update = {}
+            for field in fields:
+                if not isinstance(doc.get(field), str):
+                    continue
+                try:
+                    update[field] = parse_iso_date(doc[field])
+                except ValueError:
+                    logger.warning(f"Skipping {collection} {doc['_id']} {field}: {doc[field]!r}")
+                    continue
+                match[field] = doc[field]
+            if collection == 'products' and 'status' not in doc:
+                # Products from before drafts existed were all public
+                update['status'] = 'published'
+                match['status'] = {"$exists": False}
+            if update:
+                batch.append(UpdateOne(match, {"$set": update}))
+            if len(batch) >= args.batch_size:
+                migrated += await write_batch(db[collection], batch)
+                logger.info(f"{collection}: migrated {migrated} of {scanned} so far")
+                batch = []
+        migrated += await write_batch(db[collection], batch)
+        await bump_versions([collection])
+        logger.info(f"{collection}: migrated {migrated} of {scanned} documents")
+
+async def check_indexes(args):
+    """Report route queries that are not served by an index"""
+    if args.create:
+        await ensure_indexes(db)
+    report = await check_route_queries(db)
+    uncovered = 0
+    for route, stages, problems in report:
+        if problems:
+            uncovered += 1
+            print(f"NOT COVERED  {route}: {', '.join(problems)} ({' <- '.join(stages)})")
+        else:
+            print(f"ok           {route} ({' <- '.join(stages)})")
+    print(f"{len(report) - uncovered} of {len(report)} route queries use an index")
+    if uncovered:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalogue backend maintenance commands")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill = commands.add_parser(
+        'backfill-variants',
+        help="Create thumbnail/card/print derivatives for existing uploads"
+    )
+    backfill.add_argument('--force', action='store_true', help="Regenerate derivatives that already exist")
+    backfill.set_defaults(func=backfill_variants)
+
+    migrate = commands.add_parser(
+        'migrate-inline-images',
+        help="Move base64 data URI images from Mongo documents into the blob store"
+    )
+    migrate.add_argument('--batch-size', type=int, default=100, help="Documents per bulk write")
+    migrate.set_defaults(func=migrate_inline_images)
+
+    dates = commands.add_parser(
+        'migrate-dates',
+        help="Store created_at/updated_at as native datetimes and default a missing product status"
+    )
+    dates.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Documents per bulk write")
+    dates.set_defaults(func=migrate_dates)
+
+    check = commands.add_parser(
+        'check-indexes',
+        help="explain() every route query and report any that scan a collection or sort in memory"
+    )
+    check.add_argument('--create', action='store_true', help="Ensure the declared indexes first")
+    check.set_defaults(func=check_indexes)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(args.func(args))
+    finally:
+        client.close()
+
+if __name__ == '__main__':
+    main()
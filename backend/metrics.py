@@ -0,0 +1,153 @@
+"""Prometheus metrics for the API.
+
+Everything is collected in-process by ``prometheus_client``: request
+latencies by ``RequestMetrics``, MongoDB command timings by the
+``MongoCommandMetrics`` listener handed to the Motor client, PDF build
+phases and output by ``record_pdf_render``, and the admission control state
+by ``AdmissionCollector`` at scrape time. Each worker process keeps its own
+numbers, so scrape every worker.
+"""
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, disable_created_metrics, generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+
+# Creation timestamps would double the series for no use here
+disable_created_metrics()
+
+# Requests that match no route share one label, so unknown paths cannot
+# create a series each
+UNMATCHED_ROUTE = 'unmatched'
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    "Time from receiving a request until its response body was sent",
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+MONGO_COMMAND_SECONDS = Histogram(
+    'mongodb_command_duration_seconds',
+    "MongoDB command round trips as seen by the driver",
+    ['command', 'collection', 'outcome'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+PDF_PHASE_SECONDS = Histogram(
+    'pdf_build_phase_duration_seconds',
+    "Duration of each phase of catalogue PDF builds that missed the cache",
+    ['phase'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+PDF_BUILDS = Counter('pdf_builds_total', "Catalogue PDF builds by cache status", ['cache'])
+PDF_PAGES = Counter('pdf_pages_total', "Pages of rendered catalogue PDFs")
+PDF_BYTES = Counter('pdf_bytes_total', "Bytes of rendered catalogue PDFs")
+PDF_IMAGE_FAILURES = Counter(
+    'pdf_image_failures_total',
+    "Images left out of catalogue PDFs, by the stage that failed",
+    ['stage'],
+)
+
+def route_label(scope, root_path):
+    """Route template of a handled request, e.g. /api/products/{product_id}"""
+    route = scope.get('route')
+    if route is not None:
+        return scope.get('root_path', '') + route.path
+    # Mounted apps only extend root_path
+    if scope.get('root_path', '') != root_path:
+        return scope['root_path']
+    return UNMATCHED_ROUTE
+
+class RequestMetrics:
+    """ASGI middleware timing every HTTP request by method, route and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        root_path = scope.get('root_path', '')
+        status = 500
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(
+                scope['method'], route_label(scope, root_path), str(status)
+            ).observe(time.perf_counter() - start)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command the driver sends, by command name and collection"""
+
+    def __init__(self):
+        # (connection, request id) -> collection of commands in flight
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # getMore names a cursor; server commands such as ping have no collection
+            collection = event.command.get('collection', '')
+        self._collections[event.connection_id, event.request_id] = collection
+
+    def succeeded(self, event):
+        self._observe(event, 'ok')
+
+    def failed(self, event):
+        self._observe(event, 'error')
+
+    def _observe(self, event, outcome):
+        collection = self._collections.pop((event.connection_id, event.request_id), '')
+        MONGO_COMMAND_SECONDS.labels(event.command_name, collection, outcome).observe(
+            event.duration_micros / 1e6
+        )
+
+def record_pdf_render(stats, size, fetch_failures):
+    """Record the render stats of one catalogue PDF (see render_catalogue_pdf)"""
+    PDF_PHASE_SECONDS.labels('story').observe(stats['story_seconds'])
+    PDF_PHASE_SECONDS.labels('doc_build').observe(stats['build_seconds'])
+    PDF_PAGES.inc(stats['pages'])
+    PDF_BYTES.inc(size)
+    PDF_IMAGE_FAILURES.labels('fetch').inc(fetch_failures)
+    PDF_IMAGE_FAILURES.labels('decode').inc(stats['image_decode_failures'])
+
+class AdmissionCollector:
+    """Reports a ConcurrencyLimit and TokenBucket when scraped"""
+
+    def __init__(self, limit, rate_limiter):
+        self.limit = limit
+        self.rate_limiter = rate_limiter
+
+    def collect(self):
+        active = GaugeMetricFamily('pdf_builds_active', "PDF builds holding an admission slot")
+        active.add_metric([], self.limit.active)
+        queued = GaugeMetricFamily('pdf_builds_queued', "PDF builds waiting for an admission slot")
+        queued.add_metric([], self.limit.waiting)
+        admitted = CounterMetricFamily('pdf_builds_admitted', "PDF builds admitted")
+        admitted.add_metric([], self.limit.admitted)
+        rejected = CounterMetricFamily(
+            'pdf_builds_rejected', "PDF requests refused by admission control", labels=['reason']
+        )
+        for reason, count in self.limit.rejected.items():
+            rejected.add_metric([reason], count)
+        rejected.add_metric(['rate_limited'], self.rate_limiter.rejected)
+        return [active, queued, admitted, rejected]
+
+def register_admission(limit, rate_limiter):
+    REGISTRY.register(AdmissionCollector(limit, rate_limiter))
+
+def exposition():
+    """(body, content type) of the current metrics in the Prometheus text format"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,209 @@
+"""On-disk LRU cache of rendered catalogue PDFs.
+
+Entries are keyed by a hash of everything that shapes the output (see
+``catalogue_cache_key``). Each entry is a ``<key>.pdf`` file plus a
+``<key>.json`` sidecar listing the products and categories it contains, so
+writes to those documents can drop exactly the entries they affect.
+Entries larger than ``stream_min_bytes`` are returned as an open ``PDFFile``
+to stream from rather than read into memory.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from pdf_output import ORPHAN_MIN_AGE_SECONDS, PDFFile, pdf_size, write_pdf
+
+logger = logging.getLogger(__name__)
+
+def catalogue_cache_key(products, category_names, settings, generated_on):
+    """Content address for a catalogue PDF.
+
+    Covers the sorted product ids with each product's last-modified version,
+    the names of the categories in use, a hash of the settings (logo included)
+    and the date printed on the title page.
+    """
+    settings_hash = hashlib.sha256(
+        json.dumps(settings or {}, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    used_categories = {p['category_id'] for p in products}
+    payload = {
+        'products': sorted(
+            [p['id'], str(p.get('updated_at') or p.get('created_at'))] for p in products
+        ),
+        'categories': sorted(
+            [cat_id, category_names.get(cat_id)] for cat_id in used_categories
+        ),
+        'settings': settings_hash,
+        'generated_on': generated_on,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+class PDFCache:
+    """Size-bounded LRU of PDF files with hit/miss counters"""
+
+    def __init__(self, directory, max_bytes, stream_min_bytes=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stream_min_bytes = stream_min_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # key -> {"size", "product_ids", "category_ids"}, least recently used first
+        self._entries = OrderedDict()
+        self._load()
+
+    @property
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self._entries.values())
+
+    def _pdf_path(self, key):
+        return self.directory / f"{key}.pdf"
+
+    def _meta_path(self, key):
+        return self.directory / f"{key}.json"
+
+    def _load(self):
+        """Rebuild the index from disk, oldest access first"""
+        found = []
+        for pdf_path in self.directory.glob('*.pdf'):
+            key = pdf_path.stem
+            try:
+                meta = json.loads(self._meta_path(key).read_text())
+                stat = pdf_path.stat()
+            except (OSError, ValueError):
+                self._remove_files([key])
+                continue
+            found.append((stat.st_mtime, key, {
+                'size': stat.st_size,
+                'product_ids': set(meta['product_ids']),
+                'category_ids': set(meta['category_ids']),
+            }))
+        for _, key, entry in sorted(found):
+            self._entries[key] = entry
+        self._remove_files(self._evict())
+
+        # Temp files of writes interrupted by a crash
+        cutoff = time.time() - ORPHAN_MIN_AGE_SECONDS
+        for tmp_path in self.directory.glob('.*.tmp'):
+            try:
+                if tmp_path.stat().st_mtime < cutoff:
+                    tmp_path.unlink()
+            except OSError:
+                pass
+
+    def _read(self, key):
+        path = self._pdf_path(key)
+        # An open file stays readable even if the entry is evicted meanwhile
+        pdf = PDFFile.open(path)
+        # mtime doubles as the access time when the index is rebuilt
+        os.utime(path)
+        if self.stream_min_bytes is not None and pdf.size > self.stream_min_bytes:
+            return pdf
+        try:
+            return pdf.read()
+        finally:
+            pdf.close()
+
+    def _write(self, key, data, meta):
+        # Sidecar first, PDF last: a visible PDF always has its metadata
+        tmp_path = self.directory / f".{key}.{os.getpid()}.tmp"
+        self._meta_path(key).write_text(json.dumps(meta))
+        write_pdf(data, tmp_path)
+        os.replace(tmp_path, self._pdf_path(key))
+
+    def _remove_files(self, keys):
+        for key in keys:
+            for path in (self._pdf_path(key), self._meta_path(key)):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self):
+        """Drop least recently used entries until within max_bytes; returns their keys"""
+        evicted = []
+        total = self.total_bytes
+        while total > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            total -= entry['size']
+            evicted.append(key)
+        return evicted
+
+    async def get(self, key):
+        """Return the cached PDF (bytes or PDFFile) for key, or None on a miss"""
+        try:
+            data = await asyncio.to_thread(self._read, key)
+        except FileNotFoundError:
+            # Never written, or removed by another worker sharing the directory
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        if key not in self._entries:
+            # Written by another worker; adopt it so invalidation sees it here too
+            try:
+                meta = await asyncio.to_thread(lambda: json.loads(self._meta_path(key).read_text()))
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            self._entries[key] = {
+                'size': pdf_size(data),
+                'product_ids': set(meta['product_ids']),
+                'category_ids': set(meta['category_ids']),
+            }
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    async def put(self, key, data, product_ids, category_ids):
+        """Store a rendered PDF given as bytes or PDFFile"""
+        size = pdf_size(data)
+        if size > self.max_bytes:
+            return
+        meta = {'product_ids': sorted(product_ids), 'category_ids': sorted(category_ids)}
+        try:
+            await asyncio.to_thread(self._write, key, data, meta)
+        except OSError as e:
+            logger.warning(f"Could not write PDF cache entry: {e!r}")
+            return
+        self._entries[key] = {
+            'size': size,
+            'product_ids': set(product_ids),
+            'category_ids': set(category_ids),
+        }
+        self._entries.move_to_end(key)
+        await asyncio.to_thread(self._remove_files, self._evict())
+
+    async def invalidate(self, product_ids=(), category_ids=()):
+        """Drop every entry containing one of the given products or categories"""
+        product_ids, category_ids = set(product_ids), set(category_ids)
+        stale = [
+            key for key, entry in self._entries.items()
+            if entry['product_ids'] & product_ids or entry['category_ids'] & category_ids
+        ]
+        # Out of the index before the files go, so no lookup finds them meanwhile
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        await asyncio.to_thread(self._remove_files, stale)
+
+    async def clear(self):
+        stale = list(self._entries)
+        self._entries.clear()
+        self.invalidations += len(stale)
+        await asyncio.to_thread(self._remove_files, stale)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,108 @@
+"""Image prefetching for catalogue PDFs.
+
+Before layout starts, every image a catalogue needs is collected, deduplicated
+and fetched concurrently. Images under our own ``BASE_URL/uploads/`` are read
+straight from disk; everything else goes through one pooled async HTTP client.
+The result maps each URL to its bytes, or to None when the image could not be
+fetched so the renderer can draw a placeholder instead.
+"""
+import asyncio
+import logging
+from pathlib import Path
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Only the first few images of a product are shown in the PDF
+MAX_IMAGES_PER_PRODUCT = 3
+
+class ImageTooLarge(Exception):
+    """Raised when an image exceeds the configured size limit"""
+
+def collect_image_urls(products, settings):
+    """Return the deduplicated http image URLs a catalogue will embed, in order"""
+    refs = []
+    if settings and settings.get('company_logo'):
+        refs.append(settings['company_logo'])
+    for product in products:
+        refs.extend((product.get('images') or [])[:MAX_IMAGES_PER_PRODUCT])
+    return list(dict.fromkeys(ref for ref in refs if ref.startswith('http')))
+
+class ImageFetcher:
+    """Fetches catalogue images with a concurrency cap, timeouts and size limits"""
+
+    def __init__(self, uploads_dir, base_url, concurrency=8, timeout=10.0, max_bytes=10 * 1024 * 1024):
+        self.uploads_dir = Path(uploads_dir).resolve()
+        self.uploads_prefix = f"{base_url.rstrip('/')}/uploads/"
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def fetch_all(self, urls, progress=None):
+        """
+        Fetch every URL concurrently; failed images map to None. progress, if
+        given, is called with the number of images finished so far.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        finished = 0
+
+        async def fetch_one(url):
+            nonlocal finished
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(self._fetch(url), self.timeout)
+                except Exception as e:
+                    logger.warning(f"Could not fetch image {url}: {e!r}")
+                    return None
+                finally:
+                    finished += 1
+                    if progress is not None:
+                        progress(finished)
+
+        results = await asyncio.gather(*(fetch_one(url) for url in urls))
+        return dict(zip(urls, results))
+
+    async def _fetch(self, url):
+        if url.startswith(self.uploads_prefix):
+            return await asyncio.to_thread(self._read_upload, url[len(self.uploads_prefix):])
+
+        chunks = []
+        size = 0
+        async with self._get_client().stream('GET', url) as response:
+            response.raise_for_status()
+            declared = response.headers.get('content-length')
+            if declared and int(declared) > self.max_bytes:
+                raise ImageTooLarge(f"{declared} bytes")
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ImageTooLarge(f"more than {self.max_bytes} bytes")
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _read_upload(self, name):
+        path = (self.uploads_dir / name).resolve()
+        if self.uploads_dir not in path.parents:
+            raise FileNotFoundError(name)
+        if path.stat().st_size > self.max_bytes:
+            raise ImageTooLarge(f"{path.stat().st_size} bytes")
+        return path.read_bytes()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
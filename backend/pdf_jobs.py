@@ -0,0 +1,305 @@
+"""Asynchronous catalogue PDF jobs.
+
+Large catalogues take longer to build than a proxy will hold a request open,
+so they can be built as jobs instead. A job is a document in ``pdf_jobs``
+that moves through the phases
+
+    fetch   products, settings and category names are gathered
+    images  images are prefetched (``done``/``total`` count them)
+    layout  the render pool lays the catalogue out
+    write   the PDF is stored in the jobs directory
+
+and ends ``completed`` or ``failed``. Clients poll it or follow it as
+Server-Sent Events, then download the PDF until the job expires.
+
+Any worker may run any job. The worker running a job holds a lease on it and
+renews it while it works; a job whose lease ran out, because its worker
+stopped or crashed, is picked up again by whichever worker polls next, so
+jobs survive restarts. Expired jobs are removed by a TTL index, their files
+by ``sweep``.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from pdf_output import ORPHAN_MIN_AGE_SECONDS, write_pdf
+
+logger = logging.getLogger(__name__)
+
+# Share of the overall progress each phase covers
+PHASE_SPANS = {
+    'fetch': (0.0, 0.05),
+    'images': (0.05, 0.5),
+    'layout': (0.5, 0.9),
+    'write': (0.9, 1.0),
+}
+
+FINISHED = ('completed', 'failed')
+
+class JobRetry(Exception):
+    """Raised by a build that cannot run right now; the job is queued again"""
+
+class JobFailed(Exception):
+    """Raised by a build that can never succeed; the message is shown to the client"""
+
+def _now():
+    return datetime.now(timezone.utc)
+
+class JobProgress:
+    """Progress of one running job, reported by the build and flushed to MongoDB"""
+
+    def __init__(self):
+        self.phase = 'fetch'
+        self.done = None
+        self.total = None
+        self.changed = True
+
+    def __call__(self, phase, done=None, total=None):
+        self.phase, self.done, self.total = phase, done, total
+        self.changed = True
+
+    @property
+    def fraction(self):
+        start, end = PHASE_SPANS[self.phase]
+        if self.total:
+            return round(start + (end - start) * min(self.done or 0, self.total) / self.total, 3)
+        return start
+
+    def fields(self):
+        return {'phase': self.phase, 'progress': self.fraction, 'done': self.done, 'total': self.total}
+
+class PDFJobQueue:
+    """Creates, runs and reclaims PDF jobs.
+
+    ``build(product_ids, progress)`` produces the PDF (bytes or PDFFile),
+    calling ``progress(phase, done=None, total=None)`` as it goes. Each worker
+    runs at most ``concurrency`` jobs at a time.
+    """
+
+    def __init__(self, db, directory, build, ttl=3600, concurrency=2, lease_seconds=30,
+                 poll_interval=5.0, max_attempts=3):
+        self.db = db
+        self.directory = Path(directory)
+        self.build = build
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.worker_id = uuid.uuid4().hex
+        self._running = {}
+        self._poller = None
+
+    @property
+    def jobs(self):
+        return self.db.pdf_jobs
+
+    def path(self, job_id):
+        return self.directory / f"{job_id}.pdf"
+
+    def _lease(self):
+        return _now() + timedelta(seconds=self.lease_seconds)
+
+    async def submit(self, product_ids):
+        """Create a job, starting it in this worker if it has capacity"""
+        now = _now()
+        job = {
+            'id': str(uuid.uuid4()),
+            'product_ids': list(product_ids),
+            'status': 'queued',
+            'phase': None,
+            'progress': 0.0,
+            'done': None,
+            'total': None,
+            'error': None,
+            'size': None,
+            'attempts': 0,
+            'worker': None,
+            'lease_until': now,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'expires_at': now + timedelta(seconds=self.ttl),
+        }
+        if len(self._running) < self.concurrency:
+            job.update({
+                'status': 'running', 'phase': 'fetch', 'attempts': 1,
+                'worker': self.worker_id, 'lease_until': self._lease(), 'started_at': now,
+            })
+        await self.jobs.insert_one(dict(job))
+        if job['status'] == 'running':
+            self._start(job)
+        return job
+
+    async def get(self, job_id):
+        """The job, or None if it does not exist or has expired"""
+        job = await self.jobs.find_one({'id': job_id}, {'_id': 0})
+        # The TTL monitor runs only once a minute
+        if job is None or job['expires_at'] <= _now():
+            return None
+        return job
+
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        tasks = list(self._running.values())
+        if self._poller is not None:
+            tasks.append(self._poller)
+            self._poller = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Hand interrupted jobs over at once rather than when their leases run out
+        try:
+            await self.jobs.update_many(
+                {'worker': self.worker_id, 'status': 'running'},
+                {'$set': {'lease_until': _now(), 'worker': None}}
+            )
+        except PyMongoError as e:
+            logger.warning(f"Could not release PDF jobs: {e!r}")
+
+    def _start(self, job):
+        task = asyncio.create_task(self._run(job))
+        self._running[job['id']] = task
+        task.add_done_callback(lambda _: self._running.pop(job['id'], None))
+
+    async def _poll(self):
+        while True:
+            try:
+                while len(self._running) < self.concurrency:
+                    job = await self._claim()
+                    if job is None:
+                        break
+                    self._start(job)
+            except PyMongoError as e:
+                logger.warning(f"PDF job poll failed: {e!r}")
+            await asyncio.to_thread(self.sweep)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _claim(self):
+        """Take over the oldest job that is queued or whose worker went away"""
+        while True:
+            now = _now()
+            job = await self.jobs.find_one_and_update(
+                {'status': {'$in': ['queued', 'running']}, 'lease_until': {'$lte': now}},
+                {
+                    '$set': {
+                        'status': 'running', 'phase': 'fetch', 'progress': 0.0,
+                        'done': None, 'total': None, 'worker': self.worker_id,
+                        'lease_until': self._lease(), 'started_at': now,
+                        'expires_at': now + timedelta(seconds=self.ttl),
+                    },
+                    '$inc': {'attempts': 1},
+                },
+                sort=[('created_at', 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                return None
+            job.pop('_id')
+            if job['attempts'] <= self.max_attempts:
+                return job
+            await self._finish(job['id'], {
+                'status': 'failed',
+                'error': f"Gave up after {self.max_attempts} attempts",
+            })
+
+    async def _update(self, job_id, fields):
+        """Update a job this worker still holds; False once the lease is lost"""
+        result = await self.jobs.update_one(
+            {'id': job_id, 'worker': self.worker_id, 'status': 'running'}, {'$set': fields}
+        )
+        return result.matched_count == 1
+
+    async def _finish(self, job_id, fields):
+        now = _now()
+        await self.jobs.update_one({'id': job_id}, {'$set': {
+            **fields, 'worker': None, 'finished_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl),
+        }})
+
+    async def _report(self, job_id, progress, build):
+        """Flush progress and renew the lease until the build finishes"""
+        interval = min(1.0, self.lease_seconds / 3)
+        last_renewal = 0.0
+        while not build.done():
+            if progress.changed or time.monotonic() - last_renewal > self.lease_seconds / 3:
+                progress.changed = False
+                if not await self._update(job_id, {**progress.fields(), 'lease_until': self._lease()}):
+                    logger.warning(f"PDF job {job_id} was taken over by another worker")
+                    build.cancel()
+                    return
+                last_renewal = time.monotonic()
+            await asyncio.sleep(interval)
+
+    async def _run(self, job):
+        job_id = job['id']
+        progress = JobProgress()
+        build = asyncio.ensure_future(self.build(job['product_ids'], progress))
+        reporter = asyncio.create_task(self._report(job_id, progress, build))
+        try:
+            try:
+                pdf = await build
+            finally:
+                reporter.cancel()
+            progress('write')
+            await self._update(job_id, progress.fields())
+            size = await asyncio.to_thread(self._store, job_id, pdf)
+        except asyncio.CancelledError:
+            build.cancel()
+            raise
+        except JobRetry as e:
+            logger.info(f"PDF job {job_id} deferred: {e}")
+            # A deferral does not count as a failed attempt
+            await self.jobs.update_one({'id': job_id, 'worker': self.worker_id}, {
+                '$set': {
+                    'status': 'queued', 'phase': None, 'progress': 0.0,
+                    'done': None, 'total': None, 'worker': None,
+                    'lease_until': _now() + timedelta(seconds=self.poll_interval),
+                },
+                '$inc': {'attempts': -1},
+            })
+            return
+        except JobFailed as e:
+            await self._finish(job_id, {'status': 'failed', 'error': str(e)})
+            return
+        except Exception as e:
+            logger.error(f"PDF job {job_id} failed: {e!r}")
+            await self._finish(job_id, {'status': 'failed', 'error': "PDF generation failed"})
+            return
+        await self._finish(job_id, {
+            'status': 'completed', 'phase': None, 'progress': 1.0,
+            'done': None, 'total': None, 'size': size,
+        })
+
+    def _store(self, job_id, pdf):
+        tmp_path = self.directory / f".{job_id}.{os.getpid()}.tmp"
+        write_pdf(pdf, tmp_path)
+        os.replace(tmp_path, self.path(job_id))
+        return self.path(job_id).stat().st_size
+
+    def sweep(self):
+        """Remove PDFs of expired jobs and abandoned temp files"""
+        now = time.time()
+        for path in self.directory.glob('*.pdf'):
+            self._remove_older_than(path, now - self.ttl)
+        for path in self.directory.glob('.*.tmp'):
+            self._remove_older_than(path, now - ORPHAN_MIN_AGE_SECONDS)
+
+    def _remove_older_than(self, path, cutoff):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove expired PDF job file {path}: {e!r}")
@@ -0,0 +1,87 @@
+"""Rendered PDFs on their way to the client.
+
+Small catalogues travel as plain bytes. Catalogues larger than the spill
+threshold are written by the render worker to a ``catalogue_*.pdf`` temp file
+instead of being pickled back to the server; the server opens that file and
+unlinks it at once, so the space is returned as soon as the last response
+reading it is finished and nothing is left behind if the server crashes.
+``sweep_spilled`` reclaims files orphaned between the two steps.
+"""
+import logging
+import os
+import tempfile
+import time
+import weakref
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SPILL_PREFIX = 'catalogue_'
+
+# Leave recent files alone: another worker may be about to open them
+ORPHAN_MIN_AGE_SECONDS = 60
+
+class PDFFile:
+    """A PDF held in an open file, read at explicit offsets.
+
+    Several responses can stream the same file concurrently. The descriptor
+    is closed once the last reference is dropped.
+    """
+
+    def __init__(self, fd, size):
+        self.fd = fd
+        self.size = size
+        self._finalizer = weakref.finalize(self, os.close, fd)
+
+    @classmethod
+    def open(cls, path, unlink=False):
+        fd = os.open(path, os.O_RDONLY)
+        if unlink:
+            os.unlink(path)
+        return cls(fd, os.fstat(fd).st_size)
+
+    def read_at(self, offset, size):
+        return os.pread(self.fd, size, offset)
+
+    def read(self):
+        return self.read_at(0, self.size)
+
+    def close(self):
+        self._finalizer()
+
+def pdf_size(pdf):
+    """Size of a rendered PDF given as bytes or PDFFile"""
+    return pdf.size if isinstance(pdf, PDFFile) else len(pdf)
+
+def write_pdf(pdf, path):
+    """Write a PDF given as bytes or PDFFile to path, copying files in chunks"""
+    with open(path, 'wb') as f:
+        if isinstance(pdf, PDFFile):
+            for offset in range(0, pdf.size, 1024 * 1024):
+                f.write(pdf.read_at(offset, 1024 * 1024))
+        else:
+            f.write(pdf)
+
+def spill_pdf(data, directory):
+    """Write data to a new catalogue temp file in directory and return its path"""
+    fd, path = tempfile.mkstemp(prefix=SPILL_PREFIX, suffix='.pdf', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+def sweep_spilled(directory):
+    """Remove orphaned catalogue temp files; returns how many were removed"""
+    removed = 0
+    cutoff = time.time() - ORPHAN_MIN_AGE_SECONDS
+    for path in Path(directory).glob(f'{SPILL_PREFIX}*.pdf'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove orphaned PDF {path}: {e!r}")
+    if removed:
+        logger.info(f"Removed {removed} orphaned catalogue PDFs from {directory}")
+    return removed
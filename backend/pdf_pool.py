@@ -0,0 +1,110 @@
+"""Render pool for catalogue PDFs.
+
+Layout is CPU-bound, so catalogues are rendered by ``pdf_renderer`` in
+worker processes, or in a thread when no workers are configured. This module
+is light to import; the PDF engine itself is loaded by whichever process
+renders first.
+"""
+import asyncio
+import cProfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pdf_output import PDFFile, spill_pdf
+from profiling import dump_profile
+
+def _render_in_worker(spec, spill_dir, spill_threshold, profile=False):
+    """
+    Render spec; returns (PDF, render stats), where PDFs over spill_threshold
+    come back as a temp file path. With profile the render runs under
+    cProfile and the stats carry its data as ``profile``.
+    """
+    # Imported here so the API process only loads ReportLab when it renders
+    # in a thread; pool workers load it on their first job
+    from pdf_renderer import render_catalogue_pdf
+
+    stats = {}
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler per process; renders in threads share it
+            profiler = None
+    try:
+        data = render_catalogue_pdf(spec, stats)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    if profiler is not None:
+        stats['profile'] = dump_profile(profiler)
+    if spill_dir is not None and len(data) > spill_threshold:
+        return spill_pdf(data, spill_dir), stats
+    return data, stats
+
+def _load_engine():
+    """Pool worker initializer: load ReportLab before the first job arrives"""
+    import pdf_renderer  # noqa: F401
+
+class RenderQueueFull(Exception):
+    """Raised when the render pool already holds its maximum number of jobs"""
+
+class RenderPool:
+    """Runs render_catalogue_pdf off the event loop.
+
+    With ``workers`` > 0 renders go to a pool of worker processes; with 0 they
+    run in a thread of the current process. At most ``workers + max_queue``
+    renders are admitted at once, anything beyond that raises RenderQueueFull.
+
+    ``render`` returns the PDF with the render stats of
+    ``render_catalogue_pdf``, plus the cProfile data of profiled renders. The
+    PDF is bytes, or a PDFFile for results larger than ``spill_threshold``
+    when a ``spill_dir`` is given.
+    """
+
+    def __init__(self, workers, max_queue, spill_dir=None, spill_threshold=0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.spill_dir = str(spill_dir) if spill_dir is not None else None
+        self.spill_threshold = spill_threshold
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None and self.workers > 0:
+            # spawn keeps the workers free of the parent's Mongo client threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_load_engine,
+            )
+        return self._executor
+
+    async def render(self, spec, profile=False):
+        if self.pending >= max(self.workers, 1) + self.max_queue:
+            raise RenderQueueFull()
+        self.pending += 1
+        args = (spec, self.spill_dir, self.spill_threshold, profile)
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                result, stats = await asyncio.to_thread(_render_in_worker, *args)
+            else:
+                loop = asyncio.get_running_loop()
+                try:
+                    result, stats = await loop.run_in_executor(executor, _render_in_worker, *args)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM killed); start a fresh pool next time
+                    self._executor = None
+                    raise
+        finally:
+            self.pending -= 1
+        if isinstance(result, str):
+            return PDFFile.open(result, unlink=True), stats
+        return result, stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
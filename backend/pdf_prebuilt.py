@@ -0,0 +1,202 @@
+"""Prebuilt catalogue PDFs.
+
+Most downloads are the whole published catalogue or one category of it, so
+those PDFs are kept rendered in ``directory``: ``all.pdf`` and one
+``<category id>.pdf`` per category with published products, each with a JSON
+sidecar holding the content key it was built from (see
+``catalogue_cache_key``).
+
+Every catalogue snapshot reload marks the set stale. Once writes have
+settled for ``debounce`` seconds the scheduler rebuilds exactly the PDFs
+whose content key changed: a product edit rebuilds its category and the full
+catalogue, a settings change rebuilds everything. It also rechecks every
+``refresh_interval`` seconds, which picks up the date on the title page.
+A PDF rendered without some of its images is kept until a rebuild
+``retry_interval`` seconds later succeeds.
+Workers share the directory; a lock file lets one of them rebuild at a time
+and the others find the PDFs current when their turn comes.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pdf_cache import catalogue_cache_key
+from pdf_output import write_pdf
+
+logger = logging.getLogger(__name__)
+
+ALL = 'all'
+
+def catalogue_scopes(snapshot):
+    """scope -> published products, in catalogue order, for every prebuilt PDF"""
+    scopes = {ALL: list(snapshot.published)}
+    for product in snapshot.published:
+        scopes.setdefault(product['category_id'], []).append(product)
+    return scopes
+
+class PrebuiltCatalogues:
+    """Keeps the prebuilt PDFs in step with the catalogue snapshot.
+
+    ``build(product_ids)`` renders a catalogue exactly as ``/generate-pdf``
+    does, returning (PDF, whether every image made it in), and
+    ``generated_on()`` returns the date it prints on the title page.
+    """
+
+    def __init__(self, directory, catalogue, build, generated_on, debounce=30.0,
+                 refresh_interval=3600.0, retry_interval=60.0):
+        self.directory = Path(directory)
+        self.catalogue = catalogue
+        self.build = build
+        self.generated_on = generated_on
+        self.debounce = debounce
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.rebuilds = 0
+        self._dirty = asyncio.Event()
+        self._task = None
+
+    def path(self, scope):
+        return self.directory / f"{scope}.pdf"
+
+    def _meta_path(self, scope):
+        return self.directory / f"{scope}.json"
+
+    def meta(self, scope):
+        """Sidecar of a built PDF, or None if it has not been built"""
+        try:
+            return json.loads(self._meta_path(scope).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def built(self):
+        """scope -> sidecar for every built PDF"""
+        entries = {}
+        for meta_path in self.directory.glob('*.json'):
+            meta = self.meta(meta_path.stem)
+            if meta is not None:
+                entries[meta_path.stem] = meta
+        return entries
+
+    def incomplete(self):
+        """Scopes whose PDF was built without some of its images"""
+        return [scope for scope, meta in self.built().items() if not meta.get('complete', True)]
+
+    def mark_dirty(self, snapshot=None):
+        self._dirty.set()
+
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.catalogue.listeners.append(self.mark_dirty)
+        # Build whatever is missing or out of date since the last run
+        self.mark_dirty()
+        self._task = asyncio.create_task(self._scheduler())
+
+    async def stop(self):
+        if self.mark_dirty in self.catalogue.listeners:
+            self.catalogue.listeners.remove(self.mark_dirty)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _wait_dirty(self, timeout):
+        """Wait up to timeout seconds to be marked stale; returns whether it was"""
+        # Not wait_for: on Python 3.11 it can swallow a cancellation that
+        # arrives as the event fires, and stop() would then hang
+        try:
+            async with asyncio.timeout(timeout):
+                await self._dirty.wait()
+        except TimeoutError:
+            return False
+        return True
+
+    async def _settle(self):
+        """Wait until nothing has been marked stale for debounce seconds"""
+        while True:
+            self._dirty.clear()
+            if not await self._wait_dirty(self.debounce):
+                return
+
+    async def _scheduler(self):
+        while True:
+            await self._wait_dirty(self.refresh_interval)
+            await self._settle()
+            try:
+                if not await self.rebuild():
+                    # Another worker is rebuilding; check again once it is done
+                    self.mark_dirty()
+                elif self.incomplete():
+                    await asyncio.sleep(self.retry_interval)
+                    self.mark_dirty()
+            except Exception as e:
+                logger.error(f"Rebuilding prebuilt catalogues failed: {e!r}")
+                await asyncio.sleep(self.retry_interval)
+                self.mark_dirty()
+
+    def _lock(self):
+        fd = os.open(self.directory / '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    async def rebuild(self):
+        """
+        Rebuild the PDFs whose contents changed and drop those of categories
+        without published products. Returns False if another worker holds
+        the lock.
+        """
+        lock = await asyncio.to_thread(self._lock)
+        if lock is None:
+            return False
+        try:
+            snapshot = self.catalogue.current
+            scopes = catalogue_scopes(snapshot)
+            settings = dict(snapshot.settings) if snapshot.settings else None
+            generated_on = self.generated_on()
+            for scope, products in scopes.items():
+                key = catalogue_cache_key(products, snapshot.category_names, settings, generated_on)
+                meta = self.meta(scope)
+                if (meta and meta['key'] == key and meta.get('complete', True)
+                        and self.path(scope).exists()):
+                    continue
+                pdf, complete = await self.build([p['id'] for p in products])
+                # An incomplete PDF still beats none; it is replaced on the next retry
+                await asyncio.to_thread(self._store, scope, pdf, {
+                    'key': key,
+                    'complete': complete,
+                    'products': len(products),
+                    'built_at': datetime.now(timezone.utc).isoformat(),
+                })
+                self.rebuilds += 1
+                if complete:
+                    logger.info(f"Rebuilt prebuilt catalogue {scope} ({len(products)} products)")
+                else:
+                    logger.warning(f"Prebuilt catalogue {scope} is missing images; retrying later")
+            for scope in set(self.built()) - set(scopes):
+                await asyncio.to_thread(self._remove, scope)
+        finally:
+            os.close(lock)
+        return True
+
+    def _store(self, scope, pdf, meta):
+        # PDF first, sidecar last: a sidecar always describes the PDF beside it
+        tmp_path = self.directory / f".{scope}.{os.getpid()}.tmp"
+        write_pdf(pdf, tmp_path)
+        meta['size'] = tmp_path.stat().st_size
+        os.replace(tmp_path, self.path(scope))
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self._meta_path(scope))
+
+    def _remove(self, scope):
+        for path in (self._meta_path(scope), self.path(scope)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,424 @@
+"""Catalogue PDF rendering.
+
+Everything in this module works on plain data so that it can run inside a
+worker process: the API gathers products, category names, settings and the
+prefetched image bytes into a render spec, and ``render_catalogue_pdf`` turns
+that spec into PDF bytes without any network access.
+
+This module pulls in ReportLab, so only render workers import it (see
+``pdf_pool``); API workers that never build a catalogue do not pay for it.
+"""
+import base64
+import html
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.platypus.flowables import HRFlowable
+from reportlab.lib.utils import ImageReader
+
+logger = logging.getLogger(__name__)
+
+def format_description_for_pdf(text):
+    """Convert markdown-like formatting to ReportLab XML"""
+    if not text:
+        return ''
+
+    # Escape HTML entities
+    text = html.escape(text)
+
+    # Convert bold: **text** or __text__ to <b>text</b>
+    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
+
+    # Convert italic: *text* or _text_ to <i>text</i>
+    text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<i>\1</i>', text)
+    text = re.sub(r'(?<!_)_(?!_)(.+?)(?<!_)_(?!_)', r'<i>\1</i>', text)
+
+    # Handle bullet points and paragraphs
+    lines = text.split('\n')
+    result = []
+    in_list = False
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            if in_list:
+                result.append('</ul>')
+                in_list = False
+            result.append('<br/>')
+            continue
+
+        # Check for bullet points
+        if re.match(r'^[-*•]\s', line):
+            if not in_list:
+                result.append('<ul>')
+                in_list = True
+            # Remove bullet marker
+            content = re.sub(r'^[-*•]\s', '', line)
+            result.append(f'<li>{content}</li>')
+        else:
+            if in_list:
+                result.append('</ul>')
+                in_list = False
+            result.append(f'{line}<br/>')
+
+    if in_list:
+        result.append('</ul>')
+
+    return ''.join(result)
+
+def _image_bytes(ref, images):
+    """Resolve an image reference to bytes: data URIs inline, URLs from the prefetched map"""
+    if ref.startswith('data:image'):
+        return base64.b64decode(ref.split(',')[1])
+    return images.get(ref)
+
+def _image_flowable(data, width, height):
+    if not data:
+        raise ValueError("image unavailable")
+    # ReportLab decodes lazily; read the header now so bad data fails here
+    ImageReader(BytesIO(data)).getSize()
+    return RLImage(BytesIO(data), width=width, height=height)
+
+def _image_placeholder(width, height):
+    placeholder_style = ParagraphStyle(
+        'ImagePlaceholder',
+        fontName='Helvetica',
+        fontSize=8,
+        textColor=colors.HexColor('#94a3b8'),
+        alignment=TA_CENTER
+    )
+    placeholder = Table([[Paragraph('Image unavailable', placeholder_style)]],
+                        colWidths=[width], rowHeights=[height])
+    placeholder.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#e2e8f0')),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+    return placeholder
+
+# Custom page template with professional header and footer
+def add_header_footer(canvas, doc):
+    canvas.saveState()
+    page_num = canvas.getPageNumber()
+
+    # Header - Modern design with company name
+    canvas.setFillColorRGB(0.13, 0.25, 0.59)  # Professional dark blue
+    canvas.rect(0, doc.height + 1.65*inch, doc.width + 2*inch, 0.5*inch, fill=True)
+
+    canvas.setFillColorRGB(1, 1, 1)  # White text
+    canvas.setFont('Helvetica-Bold', 16)
+    canvas.drawString(0.75*inch, doc.height + 1.85*inch, "UNITED COPIER")
+
+    canvas.setFont('Helvetica', 9)
+    canvas.drawString(0.75*inch, doc.height + 1.70*inch, "Premium Office Solutions")
+
+    # Page number on header (right side)
+    canvas.setFont('Helvetica', 9)
+    canvas.drawRightString(doc.width + 1.25*inch, doc.height + 1.78*inch, f"Page {page_num}")
+
+    # Footer with contact information
+    canvas.setFillColorRGB(0.96, 0.96, 0.96)  # Light gray background
+    canvas.rect(0, 0, doc.width + 2*inch, 0.9*inch, fill=True)
+
+    # Draw a thin line above footer
+    canvas.setStrokeColorRGB(0.13, 0.25, 0.59)
+    canvas.setLineWidth(2)
+    canvas.line(0.75*inch, 0.9*inch, doc.width + 1.25*inch, 0.9*inch)
+
+    # Footer content in three columns
+    canvas.setFillColorRGB(0.2, 0.2, 0.2)
+    canvas.setFont('Helvetica-Bold', 9)
+
+    # Left column - Address
+    canvas.drawString(0.75*inch, 0.60*inch, "Head Office:")
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(0.75*inch, 0.45*inch, "118, Jaora Compound")
+    canvas.drawString(0.75*inch, 0.32*inch, "Indore, Madhya Pradesh")
+
+    # Center column - Contact
+    canvas.setFont('Helvetica-Bold', 9)
+    canvas.drawString(3.2*inch, 0.60*inch, "Contact:")
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(3.2*inch, 0.45*inch, "Phone: 8103349299")
+    canvas.drawString(3.2*inch, 0.32*inch, "All Solutions Under One Roof")
+
+    # Right column - Branches
+    canvas.setFont('Helvetica-Bold', 9)
+    canvas.drawString(5.5*inch, 0.60*inch, "Branch Offices:")
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(5.5*inch, 0.45*inch, "Bhopal")
+    canvas.drawString(5.5*inch, 0.32*inch, "Jabalpur")
+
+    # Copyright
+    canvas.setFont('Helvetica', 7)
+    canvas.setFillColorRGB(0.4, 0.4, 0.4)
+    canvas.drawCentredString(doc.width/2 + inch, 0.15*inch, "© 2025 United Copier. All rights reserved.")
+
+    canvas.restoreState()
+
+def render_catalogue_pdf(spec, stats=None):
+    """Render a catalogue PDF from a plain-data render spec and return its bytes.
+
+    The spec is a dict with ``products`` (product documents), ``category_names``
+    (category id -> name), ``settings`` (the settings document or None) and
+    ``images`` (prefetched image URL -> bytes, None for failed fetches).
+    ``generated_on`` optionally fixes the date printed on the title page.
+
+    If a stats dict is given it receives ``story_seconds`` (building the
+    flowables, image decoding included), ``build_seconds`` (``doc.build``),
+    ``pages`` and ``image_decode_failures``.
+    """
+    stats = {} if stats is None else stats
+    stats['image_decode_failures'] = 0
+    started = time.perf_counter()
+    products = spec['products']
+    category_dict = spec['category_names']
+    settings = spec.get('settings')
+    images = spec.get('images', {})
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                           rightMargin=0.75*inch, leftMargin=0.75*inch,
+                           topMargin=1.4*inch, bottomMargin=1.1*inch)
+
+    story = []
+    styles = getSampleStyleSheet()
+
+    # Professional custom styles
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=32,
+        textColor=colors.HexColor('#1a3a8a'),
+        spaceAfter=6,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold',
+        leading=38
+    )
+
+    subtitle_style = ParagraphStyle(
+        'Subtitle',
+        parent=styles['Normal'],
+        fontSize=14,
+        textColor=colors.HexColor('#4b5563'),
+        spaceAfter=6,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Oblique'
+    )
+
+    date_style = ParagraphStyle(
+        'DateStyle',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#6b7280'),
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+
+    # Add logo if available
+    if settings and settings.get('company_logo'):
+        logo_bytes = None
+        try:
+            logo_bytes = _image_bytes(settings['company_logo'], images)
+            story.append(_image_flowable(logo_bytes, 3*inch, 1.5*inch))
+            story.append(Spacer(1, 0.3*inch))
+        except Exception as e:
+            if logo_bytes:
+                stats['image_decode_failures'] += 1
+            logger.warning(f"Leaving out company logo: {e!r}")
+
+    # Add title page content
+    story.append(Paragraph("PRODUCT CATALOGUE", title_style))
+    story.append(Paragraph("Office Printing Solutions & Services", subtitle_style))
+    generated_on = spec.get('generated_on') or datetime.now(timezone.utc).strftime('%B %d, %Y')
+    story.append(Paragraph(f"Generated on {generated_on}", date_style))
+
+    # Add summary box
+    summary_data = [
+        ['Total Products:', str(len(products))],
+        ['Categories:', str(len(set(p['category_id'] for p in products)))],
+    ]
+    summary_table = Table(summary_data, colWidths=[2.5*inch, 2*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f0f9ff')),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e40af')),
+        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#0f172a')),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 11),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bfdbfe')),
+        ('LEFTPADDING', (0, 0), (-1, -1), 12),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 12),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ]))
+    story.append(summary_table)
+    story.append(Spacer(1, 0.4*inch))
+
+    # Decorative line
+    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#2563eb'),
+                            spaceAfter=0.3*inch, spaceBefore=0.1*inch))
+
+    # Define product-specific styles
+    prod_name_style = ParagraphStyle(
+        'ProductName',
+        parent=styles['Heading2'],
+        fontSize=16,
+        textColor=colors.HexColor('#0f172a'),
+        fontName='Helvetica-Bold',
+        spaceAfter=6,
+        spaceBefore=0,
+        leading=20
+    )
+
+    category_style = ParagraphStyle(
+        'Category',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=colors.HexColor('#6366f1'),
+        fontName='Helvetica-Bold',
+        spaceAfter=8
+    )
+
+    price_style = ParagraphStyle(
+        'Price',
+        parent=styles['Normal'],
+        fontSize=18,
+        textColor=colors.HexColor('#059669'),
+        fontName='Helvetica-Bold',
+        spaceAfter=10,
+        spaceBefore=6
+    )
+
+    desc_style = ParagraphStyle(
+        'Description',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#374151'),
+        alignment=TA_JUSTIFY,
+        spaceAfter=12,
+        leading=14,
+        bulletIndent=10,
+        leftIndent=0
+    )
+
+    # Add products with professional layout
+    for idx, product in enumerate(products):
+        product_content = []
+
+        # Product number badge and name in a table for better layout
+        header_data = [[
+            Paragraph(f'<font size="11" color="#ffffff"><b>#{idx + 1}</b></font>', styles['Normal']),
+            Paragraph(f'<b>{html.escape(product["name"])}</b>', prod_name_style)
+        ]]
+        header_table = Table(header_data, colWidths=[0.5*inch, 6*inch])
+        header_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#2563eb')),
+            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('LEFTPADDING', (0, 0), (0, 0), 8),
+            ('RIGHTPADDING', (0, 0), (0, 0), 8),
+            ('TOPPADDING', (0, 0), (0, 0), 6),
+            ('BOTTOMPADDING', (0, 0), (0, 0), 6),
+            ('LEFTPADDING', (1, 0), (1, 0), 12),
+        ]))
+        product_content.append(header_table)
+        product_content.append(Spacer(1, 0.12*inch))
+
+        # Category and Price in a two-column layout
+        cat_name = category_dict.get(product['category_id'], 'Uncategorized')
+        info_data = [[
+            Paragraph(f'<b>Category:</b> {html.escape(cat_name)}', category_style),
+            Paragraph(f'<b>₹{product["price"]:,.2f}</b>', price_style)
+        ]]
+        info_table = Table(info_data, colWidths=[3.5*inch, 3*inch])
+        info_table.setStyle(TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        product_content.append(info_table)
+
+        # Description with rich formatting
+        formatted_desc = format_description_for_pdf(product.get('description', ''))
+        desc_para = Paragraph(f'<b>Description:</b><br/>{formatted_desc}', desc_style)
+        product_content.append(desc_para)
+        product_content.append(Spacer(1, 0.15*inch))
+
+        # Product images with better layout
+        if product.get('images') and len(product['images']) > 0:
+            images_to_show = product['images'][:3]
+            img_list = []
+
+            for img_data in images_to_show:
+                if not img_data.startswith(('data:image', 'http')):
+                    continue
+                img_bytes = None
+                try:
+                    img_bytes = _image_bytes(img_data, images)
+                    prod_img = _image_flowable(img_bytes, 2*inch, 1.6*inch)
+                except Exception as e:
+                    # Images that failed to fetch are counted by the fetcher
+                    if img_bytes:
+                        stats['image_decode_failures'] += 1
+                    # Keep the slot so a broken image is visible rather than missing
+                    logger.warning(f"Using placeholder for product image: {e!r}")
+                    prod_img = _image_placeholder(2*inch, 1.6*inch)
+                img_list.append(prod_img)
+
+            if img_list:
+                # Add images label
+                product_content.append(Paragraph('<b>Product Images:</b>',
+                    ParagraphStyle('ImageLabel', parent=styles['Normal'], fontSize=9,
+                                   textColor=colors.HexColor('#6b7280'), spaceAfter=6)))
+
+                # Create table for images with borders
+                img_table_data = [img_list]
+                img_table = Table(img_table_data, colWidths=[2.15*inch] * len(img_list))
+                img_table.setStyle(TableStyle([
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8fafc')),
+                    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e1')),
+                    ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
+                    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+                    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+                    ('TOPPADDING', (0, 0), (-1, -1), 8),
+                    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+                ]))
+                product_content.append(img_table)
+                product_content.append(Spacer(1, 0.15*inch))
+
+        # Wrap product in a bordered frame
+        product_frame_data = [[product_content]]
+        product_frame = Table(product_frame_data, colWidths=[6.5*inch])
+        product_frame.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#ffffff')),
+            ('BOX', (0, 0), (-1, -1), 1.5, colors.HexColor('#cbd5e1')),
+            ('LEFTPADDING', (0, 0), (-1, -1), 16),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 16),
+            ('TOPPADDING', (0, 0), (-1, -1), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 16),
+        ]))
+
+        story.append(product_frame)
+        story.append(Spacer(1, 0.25*inch))
+
+    # Build PDF with custom template
+    built = time.perf_counter()
+    stats['story_seconds'] = built - started
+    doc.build(story, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
+    stats['build_seconds'] = time.perf_counter() - built
+    stats['pages'] = doc.page
+    return buffer.getvalue()
@@ -0,0 +1,84 @@
+"""Stored profiles of catalogue PDF renders.
+
+A profiled render runs under cProfile in the process that lays it out. Its
+profile is kept in ``directory`` as ``<id>.prof``, in the format
+``pstats.Stats.dump_stats`` writes, so it opens with pstats, snakeviz and
+similar tools, beside a JSON sidecar describing the build. Only the newest
+``keep`` profiles are kept; workers may share the directory.
+"""
+import io
+import json
+import marshal
+import os
+import pstats
+import re
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROFILE_ID = re.compile(r'[0-9a-f]{32}')
+
+def dump_profile(profiler):
+    """The data of a finished cProfile run, as dump_stats would write it"""
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+class ProfileStore:
+    def __init__(self, directory, keep=50):
+        self.directory = Path(directory)
+        self.keep = keep
+
+    def path(self, profile_id):
+        return self.directory / f"{profile_id}.prof"
+
+    def _meta_path(self, profile_id):
+        return self.directory / f"{profile_id}.json"
+
+    def meta(self, profile_id):
+        """Sidecar of a stored profile, or None if there is no such profile"""
+        if not PROFILE_ID.fullmatch(profile_id):
+            return None
+        try:
+            return json.loads(self._meta_path(profile_id).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, data, meta):
+        """Store profile data with meta; returns the sidecar, including its id"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        meta = {
+            'id': profile_id,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'size': len(data),
+            **meta,
+        }
+        # Profile first, sidecar last: a sidecar always describes the profile beside it
+        tmp_path = self.directory / f".{profile_id}.tmp"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.path(profile_id))
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self._meta_path(profile_id))
+        self._prune()
+        return meta
+
+    def list(self):
+        """Sidecars of the stored profiles, newest first"""
+        profiles = [self.meta(path.stem) for path in self.directory.glob('*.json')]
+        profiles = [meta for meta in profiles if meta is not None]
+        return sorted(profiles, key=lambda meta: meta['created_at'], reverse=True)
+
+    def summary(self, profile_id, limit=40):
+        """The limit functions with the most cumulative time, as pstats prints them"""
+        output = io.StringIO()
+        stats = pstats.Stats(str(self.path(profile_id)), stream=output)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def _prune(self):
+        for meta in self.list()[self.keep:]:
+            for path in (self._meta_path(meta['id']), self.path(meta['id'])):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
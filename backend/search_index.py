@@ -0,0 +1,123 @@
+"""In-process full-text index over product names and descriptions.
+
+Every query word matches whole words and word prefixes, so results update as
+the user types. Results are ranked by a TF-IDF style score where name matches
+weigh more than description matches and whole-word matches more than
+prefixes. An index is immutable; each catalogue snapshot has its own, and a
+write derives the next one with ``updated`` instead of re-indexing everything.
+"""
+import bisect
+import math
+import re
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r'\w+')
+
+FIELD_WEIGHTS = {'name': 3.0, 'description': 1.0}
+PREFIX_WEIGHT = 0.5
+# Bonus for names starting with the query as typed
+NAME_PREFIX_BONUS = 2.0
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+def _term_frequencies(product):
+    """term -> weighted frequency of the term in the indexed fields of product"""
+    frequencies = defaultdict(float)
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(product.get(field)):
+            frequencies[term] += weight
+    return frequencies
+
+class SearchIndex:
+    def __init__(self, products=()):
+        self.products = {}
+        # term -> {product id: weighted term frequency}
+        postings = defaultdict(dict)
+        for product in products:
+            self.products[product['id']] = product
+            for term, frequency in _term_frequencies(product).items():
+                postings[term][product['id']] = frequency
+        self._postings = dict(postings)
+        self._terms = sorted(self._postings)
+
+    def updated(self, products, removed_ids=()):
+        """
+        A new index in which products replace the indexed products of the same
+        ids and the products of removed_ids are dropped. Only the postings of
+        the terms involved are copied; this index is left unchanged.
+        """
+        products = {product['id']: product for product in products}
+        index = SearchIndex()
+        index.products = dict(self.products)
+        index._postings = dict(self._postings)
+        touched = set()
+
+        def postings(term):
+            if term not in touched:
+                touched.add(term)
+                index._postings[term] = dict(index._postings.get(term, ()))
+            return index._postings[term]
+
+        for product_id in {*removed_ids, *products}:
+            old = index.products.pop(product_id, None)
+            if old is not None:
+                for term in _term_frequencies(old):
+                    postings(term).pop(product_id, None)
+        for product_id, product in products.items():
+            index.products[product_id] = product
+            for term, frequency in _term_frequencies(product).items():
+                postings(term)[product_id] = frequency
+
+        emptied = {term for term in touched if not index._postings[term]}
+        for term in emptied:
+            del index._postings[term]
+        terms = [term for term in self._terms if term not in emptied] if emptied else list(self._terms)
+        for term in sorted(touched - emptied - self._postings.keys()):
+            bisect.insort(terms, term)
+        index._terms = terms
+        return index
+
+    def _idf(self, term):
+        return math.log(1 + len(self.products) / len(self._postings[term]))
+
+    def _expand(self, prefix):
+        """Indexed terms starting with prefix"""
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_right(self._terms, prefix + '\uffff')
+        return self._terms[start:end]
+
+    def _term_scores(self, word):
+        scores = defaultdict(float)
+        for term in self._expand(word):
+            weight = self._idf(term) * (1.0 if term == word else PREFIX_WEIGHT)
+            for product_id, frequency in self._postings[term].items():
+                scores[product_id] = max(scores[product_id], frequency * weight)
+        return scores
+
+    def search(self, query, category_id=None, limit=20):
+        """Return up to limit (score, product) pairs matching every word of query, best first"""
+        words = tokenize(query)
+        if not words:
+            return []
+        scores = None
+        for word in dict.fromkeys(words):
+            word_scores = self._term_scores(word)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {pid: score + word_scores[pid] for pid, score in scores.items() if pid in word_scores}
+            if not scores:
+                return []
+
+        typed = query.strip().lower()
+        results = []
+        for product_id, score in scores.items():
+            product = self.products[product_id]
+            if category_id and product.get('category_id') != category_id:
+                continue
+            if product.get('name', '').lower().startswith(typed):
+                score += NAME_PREFIX_BONUS
+            results.append((score, product))
+        results.sort(key=lambda result: (-result[0], result[1].get('name', '')))
+        return results[:limit]
@@ -1,32 +1,50 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Header, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 import os
+import asyncio
+import bisect
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, ValidationError, field_validator
+from typing import Any, Dict, List, Optional, Union
 import uuid
+import json
+import base64
+import hashlib
+import math
+import random
+import csv
+import re
+import tempfile
+import time
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
-import base64
-import shutil
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage, PageBreak, KeepTogether, Frame, PageTemplate
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle, ListStyle
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-from reportlab.platypus.flowables import HRFlowable
-import requests
-from io import BytesIO
-import re
-import html
+from pdf_pool import RenderPool, RenderQueueFull
+from pdf_cache import PDFCache, catalogue_cache_key
+from pdf_output import PDFFile, sweep_spilled
+from pdf_jobs import FINISHED, JobFailed, JobRetry, PDFJobQueue
+from admission import ConcurrencyLimit, Saturated, TokenBucket
+from pdf_prebuilt import ALL as ALL_PRODUCTS, PrebuiltCatalogues, catalogue_scopes
+from image_variants import VARIANTS, generate_variants
+from blob_store import BlobStore, InvalidDataURI, is_data_uri, sniff_image_type
+from indexes import ensure_indexes
+from catalogue_snapshot import SnapshotStore, catalogue_order
+from search_index import SearchIndex, tokenize
+from fast_json import trusted_response
+from profiling import ProfileStore
+from metrics import (
+    PDF_BUILDS, PDF_PHASE_SECONDS, MongoCommandMetrics, RequestMetrics, exposition,
+    record_pdf_render, register_admission,
+)
+import catalogue_io
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -34,12 +52,119 @@ load_dotenv(ROOT_DIR / '.env')
 # Create uploads directory if it doesn't exist
 UPLOADS_DIR = ROOT_DIR / 'uploads'
 UPLOADS_DIR.mkdir(exist_ok=True)
+ALLOWED_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+# Content-addressed store for uploads and images that arrive inline as data URIs
+blob_store = BlobStore(UPLOADS_DIR)
+
+# Largest accepted image upload, and the chunk size it is streamed to disk in
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Room for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Dates are stored as BSON datetimes; read them back as UTC-aware datetimes
+# and time every command for /metrics
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
+# Public base URL, used for uploaded image URLs
+BASE_URL = os.environ.get('BASE_URL', 'http://localhost:8000')
+
+# PDFs larger than the threshold go through a temp file in PDF_SPILL_DIR and
+# are streamed to the client instead of being held in memory
+PDF_SPILL_DIR = Path(os.environ.get('PDF_SPILL_DIR', tempfile.gettempdir()))
+PDF_SPILL_THRESHOLD = int(os.environ.get('PDF_SPILL_THRESHOLD', str(8 * 1024 * 1024)))
+PDF_STREAM_CHUNK_SIZE = 256 * 1024
+
+# The PDF engine (ReportLab layout, image prefetching over httpx) is imported
+# on the first catalogue build, by the render workers or image_fetcher(), so
+# workers that only serve the CRUD API start faster and stay smaller
+
+# PDF rendering pool (0 workers renders in a thread instead of processes)
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', '2'))
+PDF_RENDER_MAX_QUEUE = int(os.environ.get('PDF_RENDER_MAX_QUEUE', '8'))
+render_pool = RenderPool(
+    PDF_RENDER_WORKERS, PDF_RENDER_MAX_QUEUE,
+    spill_dir=PDF_SPILL_DIR, spill_threshold=PDF_SPILL_THRESHOLD
+)
+
+# Image prefetching for PDFs
+PDF_IMAGE_CONCURRENCY = int(os.environ.get('PDF_IMAGE_CONCURRENCY', '8'))
+PDF_IMAGE_TIMEOUT = float(os.environ.get('PDF_IMAGE_TIMEOUT', '10'))
+PDF_IMAGE_MAX_BYTES = int(os.environ.get('PDF_IMAGE_MAX_BYTES', str(10 * 1024 * 1024)))
+_image_fetcher = None
+
+def image_fetcher():
+    """The PDF image prefetcher, created on first use"""
+    global _image_fetcher
+    if _image_fetcher is None:
+        from pdf_images import ImageFetcher
+        _image_fetcher = ImageFetcher(
+            UPLOADS_DIR, BASE_URL,
+            concurrency=PDF_IMAGE_CONCURRENCY,
+            timeout=PDF_IMAGE_TIMEOUT,
+            max_bytes=PDF_IMAGE_MAX_BYTES
+        )
+    return _image_fetcher
+
+# Rendered PDF cache
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', str(ROOT_DIR / 'pdf_cache')))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+pdf_cache = PDFCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, stream_min_bytes=PDF_SPILL_THRESHOLD)
+
+# PDF admission control, per worker: builds running at once, builds allowed
+# to wait for a slot (and for how many seconds), products per PDF, and the
+# PDF requests each client may start per minute with the burst allowed
+PDF_MAX_CONCURRENT_BUILDS = int(os.environ.get('PDF_MAX_CONCURRENT_BUILDS', '4'))
+PDF_MAX_QUEUED_BUILDS = int(os.environ.get('PDF_MAX_QUEUED_BUILDS', '16'))
+PDF_QUEUE_TIMEOUT = float(os.environ.get('PDF_QUEUE_TIMEOUT', '30'))
+PDF_MAX_PRODUCTS = int(os.environ.get('PDF_MAX_PRODUCTS', '500'))
+PDF_RATE_LIMIT = float(os.environ.get('PDF_RATE_LIMIT', '10'))
+PDF_RATE_BURST = int(os.environ.get('PDF_RATE_BURST', '5'))
+pdf_admission = ConcurrencyLimit(
+    PDF_MAX_CONCURRENT_BUILDS, PDF_MAX_QUEUED_BUILDS, queue_timeout=PDF_QUEUE_TIMEOUT
+)
+pdf_rate_limiter = TokenBucket(PDF_RATE_LIMIT / 60, PDF_RATE_BURST)
+register_admission(pdf_admission, pdf_rate_limiter)
+
+# Asynchronous PDF jobs: where finished PDFs are kept, for how many seconds,
+# and how many jobs each worker builds at once
+PDF_JOBS_DIR = Path(os.environ.get('PDF_JOBS_DIR', str(ROOT_DIR / 'pdf_jobs')))
+PDF_JOB_TTL = int(os.environ.get('PDF_JOB_TTL', '3600'))
+PDF_JOB_CONCURRENCY = int(os.environ.get('PDF_JOB_CONCURRENCY', '2'))
+PDF_JOB_EVENT_INTERVAL = 0.5
+PDF_JOB_KEEPALIVE_SECONDS = 15
+
+# Prebuilt full and per-category catalogue PDFs, rebuilt once writes have
+# settled for PDF_PREBUILT_DEBOUNCE seconds
+PDF_PREBUILT_DIR = Path(os.environ.get('PDF_PREBUILT_DIR', str(ROOT_DIR / 'pdf_prebuilt')))
+PDF_PREBUILT_DEBOUNCE = float(os.environ.get('PDF_PREBUILT_DEBOUNCE', '30'))
+
+# Profiles of PDF renders: where they are kept, how many, and the share of
+# all renders profiled without being asked (0.01 profiles about 1 in 100)
+PDF_PROFILE_DIR = Path(os.environ.get('PDF_PROFILE_DIR', str(ROOT_DIR / 'pdf_profiles')))
+PDF_PROFILE_KEEP = int(os.environ.get('PDF_PROFILE_KEEP', '50'))
+PDF_PROFILE_SAMPLE_RATE = float(os.environ.get('PDF_PROFILE_SAMPLE_RATE', '0'))
+profile_store = ProfileStore(PDF_PROFILE_DIR, keep=PDF_PROFILE_KEEP)
+
+# In-memory catalogue snapshot (poll interval is used only without change streams)
+CATALOGUE_POLL_INTERVAL = float(os.environ.get('CATALOGUE_POLL_INTERVAL', '2'))
+catalogue = SnapshotStore(db, poll_interval=CATALOGUE_POLL_INTERVAL)
+
+# Date fields that older versions stored as ISO strings; `manage.py
+# migrate-dates` converts them, and the server refuses to start without it
+DATE_FIELDS = {
+    'products': ('created_at', 'updated_at'),
+    'categories': ('created_at',),
+}
+
+# Read routes skip response model re-validation of database documents and
+# encode with orjson; set to false to go through FastAPI's validating path
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'true').lower() == 'true'
+
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
@@ -52,6 +177,7 @@ app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Define Models
 class AdminLogin(BaseModel):
@@ -73,6 +199,12 @@ class CategoryCreate(BaseModel):
     name: str
     description: Optional[str] = None
 
+class ImageVariant(BaseModel):
+    url: str
+    width: int
+    height: int
+    bytes: int
+
 class Product(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -80,10 +212,17 @@ class Product(BaseModel):
     description: str
     price: float
     category_id: str
-    images: List[str] = []  # URLs or base64
+    images: List[str] = []  # URLs; base64 data URIs are moved to the blob store on write
+    # image URL -> variant name ("thumb", "card", "print") -> derivative
+    image_variants: Dict[str, Dict[str, ImageVariant]] = {}
     youtube_link: Optional[str] = None
     status: str = "draft"  # "draft" or "published"
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: Optional[datetime] = None
+
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_cursor: Optional[str] = None
 
 class ProductCreate(BaseModel):
     name: str
@@ -94,6 +233,49 @@ class ProductCreate(BaseModel):
     youtube_link: Optional[str] = None
     status: str = "draft"  # "draft" or "published"
 
+class ProductBulkUpdate(BaseModel):
+    id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    category_id: Optional[str] = None
+    images: Optional[List[str]] = None
+    youtube_link: Optional[str] = None
+    status: Optional[str] = None
+
+    @field_validator('name', 'description', 'price', 'category_id', 'status', mode='before')
+    @classmethod
+    def not_null(cls, value):
+        # Omit a field to leave it unchanged; products cannot store null in these
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+class ProductBulkRequest(BaseModel):
+    # Items are validated one by one (as ProductCreate and ProductBulkUpdate),
+    # so an invalid item fails alone instead of rejecting the whole request
+    create: List[Any] = []
+    update: List[Any] = []  # only the fields sent are changed
+    delete: List[str] = []  # product ids
+
+def validation_message(error):
+    """One line describing a pydantic ValidationError"""
+    return '; '.join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'item'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+class BulkItemResult(BaseModel):
+    index: int  # position in the request array
+    id: Optional[str] = None
+    ok: bool
+    error: Optional[str] = None
+
+class ProductBulkResult(BaseModel):
+    create: List[BulkItemResult] = []
+    update: List[BulkItemResult] = []
+    delete: List[BulkItemResult] = []
+
 class Settings(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = "settings"
@@ -107,7 +289,123 @@ class SettingsUpdate(BaseModel):
 class PDFRequest(BaseModel):
     product_ids: List[str]
 
+class PrebuiltCatalogue(BaseModel):
+    scope: str  # "all" or a category id
+    name: str
+    products: int
+    size: int
+    built_at: datetime
+    url: str
+
+class PDFJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    status: str  # "queued", "running", "completed" or "failed"
+    phase: Optional[str] = None  # "fetch", "images", "layout" or "write" while running
+    progress: float = 0.0  # 0 to 1 over all phases
+    done: Optional[int] = None  # items finished in the current phase, if counted
+    total: Optional[int] = None
+    error: Optional[str] = None
+    size: Optional[int] = None  # bytes, once completed
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: datetime
+    download_url: Optional[str] = None
+
 # Helper Functions
+class SharedCall:
+    """A call in flight in a SingleFlight, passing its reports on to every caller"""
+
+    def __init__(self):
+        self.task = None
+        self.listeners = []
+        self.last_report = None
+
+    def report(self, *args):
+        self.last_report = args
+        for listener in list(self.listeners):
+            listener(*args)
+
+class SingleFlight:
+    """
+    Runs one call per key at a time; concurrent callers with the same key
+    share its result and its progress reports
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    def _finished(self, key, task):
+        self._calls.pop(key, None)
+        # Mark the exception as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn, progress=None):
+        """
+        Result of fn(report) for key, starting it unless a call is in flight.
+        Everything the call passes to report is passed on to the progress of
+        each caller waiting on it, starting with its latest report.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = SharedCall()
+            call.task = asyncio.ensure_future(fn(call.report))
+            call.task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.coalesced += 1
+            if progress is not None and call.last_report is not None:
+                progress(*call.last_report)
+        if progress is not None:
+            call.listeners.append(progress)
+        try:
+            # A disconnecting caller must not cancel the build the others wait on
+            return await asyncio.shield(call.task)
+        finally:
+            if progress is not None:
+                call.listeners.remove(progress)
+
+class UploadSizeLimit:
+    """
+    ASGI middleware rejecting request bodies over max_bytes on the given
+    paths with 413 as they stream in, before the multipart parser has
+    spooled the whole upload to disk.
+    """
+
+    def __init__(self, app, paths, max_bytes):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        detail = f"Upload exceeds {self.max_bytes} bytes"
+        declared = dict(scope['headers']).get(b'content-length')
+        if declared is not None:
+            if not declared.isdigit():
+                await JSONResponse({"detail": "Invalid Content-Length"}, status_code=400)(scope, receive, send)
+                return
+            if int(declared) > self.max_bytes:
+                await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -125,6 +423,195 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def upload_filename(url):
+    """Return the uploads-relative filename for one of our upload URLs, else None"""
+    prefix = f"{BASE_URL}/uploads/"
+    return url[len(prefix):] if url.startswith(prefix) else None
+
+def variant_urls(variants):
+    """Turn stored derivative metadata into the public form with URLs"""
+    return {
+        name: {
+            'url': f"{BASE_URL}/uploads/{variant['filename']}",
+            'width': variant['width'],
+            'height': variant['height'],
+            'bytes': variant['bytes'],
+        }
+        for name, variant in variants.items()
+    }
+
+async def resolve_image_variants(images):
+    """Look up the recorded derivatives of every uploaded image in images"""
+    filenames = {upload_filename(url): url for url in images if upload_filename(url)}
+    if not filenames:
+        return {}
+    records = await db.images.find({"filename": {"$in": list(filenames)}}, {"_id": 0}).to_list(len(filenames))
+    return {filenames[record['filename']]: variant_urls(record['variants']) for record in records}
+
+async def stored_image_variants(filename):
+    """Variants already recorded for an upload, or None"""
+    record = await db.images.find_one({"filename": filename}, {"_id": 0})
+    return record['variants'] if record else None
+
+async def record_image_variants(filename):
+    """Create the derivatives of an upload and record them; returns {} if the image can't be read"""
+    try:
+        variants = await asyncio.to_thread(generate_variants, UPLOADS_DIR, filename)
+    except Exception as e:
+        logger.warning(f"Could not create variants for {filename}: {e!r}")
+        return {}
+    await db.images.update_one({"filename": filename}, {"$set": {"variants": variants}}, upsert=True)
+    return variants
+
+async def store_inline_image(value):
+    """Move a base64 data URI into the blob store and return its URL; other values pass through"""
+    if not is_data_uri(value):
+        return value
+    filename, created = await asyncio.to_thread(blob_store.put_data_uri, value)
+    if created:
+        await record_image_variants(filename)
+    return f"{BASE_URL}/uploads/{filename}"
+
+async def externalize_images(images):
+    """Replace inline data URIs with blob URLs so documents only hold links"""
+    try:
+        return [await store_inline_image(image) for image in images]
+    except InvalidDataURI as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def pick_image_variant(product, variant):
+    """Swap each image URL for the given derivative where one exists"""
+    variants = product.get('image_variants') or {}
+    product['images'] = [
+        variants.get(url, {}).get(variant, {}).get('url', url) for url in product.get('images', [])
+    ]
+    return product
+
+# Keyset pagination for product listing
+PRODUCT_SORT_FIELDS = ('created_at', 'price', 'name')
+DEFAULT_PAGE_SIZE = 50
+
+def parse_product_sort(sort):
+    """Turn "price" / "-price" into (field, direction)"""
+    field, direction = (sort[1:], -1) if sort.startswith('-') else (sort, 1)
+    if field not in PRODUCT_SORT_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort. Allowed: {', '.join(PRODUCT_SORT_FIELDS)} (prefix with - for descending)"
+        )
+    return field, direction
+
+def encode_cursor(sort, value, last_id):
+    """Opaque cursor pointing just past the (sort value, id) of the last item on a page"""
+    if isinstance(value, datetime):
+        value = {'$date': value.isoformat()}
+    raw = json.dumps({'s': sort, 'v': value, 'id': last_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        value, last_id = data['v'], data['id']
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['$date'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if data.get('s') != sort:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort")
+    return value, last_id
+
+def keyset_filter(field, direction, value, last_id):
+    """Match documents strictly after (value, last_id) in (field, id) order"""
+    op = '$gt' if direction == 1 else '$lt'
+    return {'$or': [{field: {op: value}}, {field: value, 'id': {op: last_id}}]}
+
+def as_utc(value):
+    """Treat naive datetimes from query parameters as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def validate_image_variant(image_variant):
+    if image_variant and image_variant not in VARIANTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid image_variant. Allowed: {', '.join(VARIANTS)}"
+        )
+
+# Catalogue versions: every write bumps a per-collection counter, and the
+# read routes derive their ETags from it
+async def bump_versions(collections):
+    """Bump the versions of collections; returns name -> new version"""
+    docs = await asyncio.gather(*(
+        db.versions.find_one_and_update(
+            {"_id": name}, {"$inc": {"version": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        for name in collections
+    ))
+    return {doc['_id']: doc['version'] for doc in docs}
+
+async def catalogue_changed(collections, product_ids=(), category_ids=()):
+    """
+    Run after every catalogue write: drop affected cached PDFs, bump read
+    versions and apply the write to this worker's snapshot so the writer
+    reads its own write. product_ids, if given, are the only products the
+    write touched; only they are re-read. Other workers pick the change up
+    from the change stream.
+    """
+    if 'settings' in collections:
+        # Logo and company details appear in every catalogue
+        await pdf_cache.clear()
+    else:
+        await pdf_cache.invalidate(product_ids=product_ids, category_ids=category_ids)
+    versions = await bump_versions(collections)
+    await catalogue.apply(versions, product_ids=list(product_ids) or None)
+
+async def read_versions(collections):
+    """Current versions of collections as stored in MongoDB"""
+    docs = await db.versions.find({"_id": {"$in": list(collections)}}).to_list(None)
+    return {doc['_id']: doc['version'] for doc in docs}
+
+async def not_modified(request: Request, response: Response, *collections, fresh=False):
+    """
+    Set a strong ETag and Cache-Control on response. Returns a 304 response
+    when the client's If-None-Match already matches, else None. Routes
+    answered from MongoDB pass fresh=True: the versions are read from the
+    database too, since this worker's snapshot may not have caught up yet.
+    """
+    # Otherwise they come from the snapshot the response is built from, so
+    # a 304 costs no database round trip
+    versions = await read_versions(collections) if fresh else catalogue.current.versions
+    query = sorted(request.query_params.multi_items())
+    digest = hashlib.sha1(json.dumps([request.url.path, query]).encode()).hexdigest()[:16]
+    etag = '"' + '-'.join(f"{name}.{versions.get(name, 0)}" for name in collections) + f'-{digest}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+    if_none_match = request.headers.get('if-none-match', '')
+    candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    if etag in candidates or '*' in candidates:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def fast_json(content, model, response, many=False):
+    """
+    Return trusted database documents from a read route, encoded directly
+    when FAST_JSON_RESPONSES is on. The route's response_model still
+    documents the shape; response carries headers such as the ETag.
+    """
+    if not FAST_JSON_RESPONSES:
+        return content
+    return trusted_response(content, model, many=many, headers=response.headers)
+
+def settings_defaults(exclude=()):
+    """Default settings fields for $setOnInsert; the id comes from the upsert filter"""
+    return {
+        key: value for key, value in Settings().model_dump().items()
+        if key != 'id' and key not in exclude
+    }
+
 # Routes
 @api_router.post("/admin/login", response_model=AdminToken)
 async def admin_login(credentials: AdminLogin):
@@ -145,40 +632,39 @@ async def verify_admin(payload: dict = Depends(verify_token)):
 @api_router.post("/categories", response_model=Category)
 async def create_category(category: CategoryCreate, payload: dict = Depends(verify_token)):
     category_obj = Category(**category.model_dump())
-    doc = category_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.categories.insert_one(doc)
+    await db.categories.insert_one(category_obj.model_dump())
+    await catalogue_changed(['categories'])
     return category_obj
 
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories():
-    categories = await db.categories.find({}, {"_id": 0}).to_list(1000)
-    for cat in categories:
-        if isinstance(cat['created_at'], str):
-            cat['created_at'] = datetime.fromisoformat(cat['created_at'])
-    return categories
+async def get_categories(request: Request, response: Response):
+    cached = await not_modified(request, response, 'categories')
+    if cached:
+        return cached
+    return fast_json(catalogue.current.categories, Category, response, many=True)
 
 @api_router.get("/categories/{category_id}", response_model=Category)
-async def get_category(category_id: str):
-    category = await db.categories.find_one({"id": category_id}, {"_id": 0})
+async def get_category(category_id: str, request: Request, response: Response):
+    cached = await not_modified(request, response, 'categories')
+    if cached:
+        return cached
+    category = catalogue.current.categories_by_id.get(category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    if isinstance(category['created_at'], str):
-        category['created_at'] = datetime.fromisoformat(category['created_at'])
-    return category
+    return fast_json(category, Category, response)
 
 @api_router.put("/categories/{category_id}", response_model=Category)
 async def update_category(category_id: str, category_update: CategoryCreate, payload: dict = Depends(verify_token)):
-    existing = await db.categories.find_one({"id": category_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Category not found")
-    
     update_data = category_update.model_dump(exclude_unset=True)
-    await db.categories.update_one({"id": category_id}, {"$set": update_data})
-    
-    updated = await db.categories.find_one({"id": category_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
+    updated = await db.categories.find_one_and_update(
+        {"id": category_id},
+        {"$set": update_data},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Category not found")
+    await catalogue_changed(['categories'], category_ids=[category_id])
     return updated
 
 @api_router.delete("/categories/{category_id}")
@@ -188,57 +674,201 @@ async def delete_category(category_id: str, payload: dict = Depends(verify_token
         raise HTTPException(status_code=404, detail="Category not found")
     # Also delete products in this category
     await db.products.delete_many({"category_id": category_id})
+    await catalogue_changed(['categories', 'products'], category_ids=[category_id])
     return {"message": "Category deleted successfully"}
 
 # Product Routes
 @api_router.post("/products", response_model=Product)
 async def create_product(product: ProductCreate, payload: dict = Depends(verify_token)):
-    product_obj = Product(**product.model_dump())
-    doc = product_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.products.insert_one(doc)
+    product.images = await externalize_images(product.images)
+    product_obj = Product(
+        **product.model_dump(),
+        image_variants=await resolve_image_variants(product.images)
+    )
+    product_obj.updated_at = product_obj.created_at
+    await db.products.insert_one(product_obj.model_dump())
+    await catalogue_changed(['products'], product_ids=[product_obj.id])
     return product_obj
 
-@api_router.get("/products", response_model=List[Product])
+@api_router.get("/products", response_model=Union[ProductPage, List[Product]])
 async def get_products(
+    request: Request,
+    response: Response,
     category_id: Optional[str] = Query(None),
-    status: Optional[str] = Query(None)  # "draft", "published", or None for all
+    status: Optional[str] = Query(None),  # "draft", "published", or None for all
+    image_variant: Optional[str] = Query(None),  # "thumb", "card", "print", or None for originals
+    sort: Optional[str] = Query(None),  # "created_at", "price" or "name", "-" prefix for descending
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    created_after: Optional[datetime] = Query(None),  # inclusive; naive times are UTC
+    created_before: Optional[datetime] = Query(None)  # exclusive
 ):
+    """
+    List products. With limit or cursor the response is a page
+    {"items": [...], "next_cursor": ...}; pass next_cursor back to get the
+    following page. Without them every matching product is returned, as
+    before; clients should page instead.
+    """
+    validate_image_variant(image_variant)
+    from_snapshot = status == 'published' and sort in (None, 'created_at')
+    cached = await not_modified(request, response, 'products', fresh=not from_snapshot)
+    if cached:
+        return cached
+    paginate = limit is not None or cursor is not None
+    created_after, created_before = as_utc(created_after), as_utc(created_before)
+
+    if from_snapshot:
+        # The public catalogue listing is served from the snapshot, which
+        # keeps it in (created_at, id) order
+        products = [
+            prod for prod in catalogue.current.published
+            if (not category_id or prod['category_id'] == category_id)
+            and (not created_after or prod['created_at'] >= created_after)
+            and (not created_before or prod['created_at'] < created_before)
+        ]
+        next_cursor = None
+        if paginate:
+            if cursor:
+                after = decode_cursor(cursor, 'created_at')
+                products = products[bisect.bisect_right(products, after, key=catalogue_order):]
+            page_size = limit or DEFAULT_PAGE_SIZE
+            if len(products) > page_size:
+                products = products[:page_size]
+                next_cursor = encode_cursor('created_at', *catalogue_order(products[-1]))
+        if image_variant:
+            products = [pick_image_variant(dict(prod), image_variant) for prod in products]
+        if paginate:
+            return fast_json({"items": products, "next_cursor": next_cursor}, ProductPage, response)
+        return fast_json(products, Product, response, many=True)
+
     query = {}
     if category_id:
         query['category_id'] = category_id
     if status:
         query['status'] = status
-    products = await db.products.find(query, {"_id": 0}).to_list(1000)
-    for prod in products:
-        if isinstance(prod['created_at'], str):
-            prod['created_at'] = datetime.fromisoformat(prod['created_at'])
-        # Set default status for existing products without status field
-        if 'status' not in prod:
-            prod['status'] = 'published'
-    return products
+    if created_after or created_before:
+        query['created_at'] = {}
+        if created_after:
+            query['created_at']['$gte'] = created_after
+        if created_before:
+            query['created_at']['$lt'] = created_before
+
+    find = db.products.find(query, {"_id": 0})
+    if paginate or sort:
+        sort = sort or 'created_at'
+        field, direction = parse_product_sort(sort)
+        if cursor:
+            find = db.products.find(
+                {'$and': [query, keyset_filter(field, direction, *decode_cursor(cursor, sort))]},
+                {"_id": 0}
+            )
+        find = find.sort([(field, direction), ('id', direction)])
+
+    next_cursor = None
+    if paginate:
+        page_size = limit or DEFAULT_PAGE_SIZE
+        products = await find.limit(page_size + 1).to_list(page_size + 1)
+        if len(products) > page_size:
+            products = products[:page_size]
+            last = products[-1]
+            next_cursor = encode_cursor(sort, last.get(field), last['id'])
+    else:
+        products = await find.to_list(None)
+
+    if image_variant:
+        for prod in products:
+            pick_image_variant(prod, image_variant)
+    if paginate:
+        return fast_json({"items": products, "next_cursor": next_cursor}, ProductPage, response)
+    return fast_json(products, Product, response, many=True)
+
+SEARCH_MAX_CANDIDATES = 1000
+
+@api_router.get("/products/search", response_model=List[Product])
+async def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1),
+    category_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),  # "draft", "published", or None for all
+    image_variant: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Products whose name or description contain every word of q, as a word
+    or word prefix, best matches first.
+    """
+    validate_image_variant(image_variant)
+    cached = await not_modified(request, response, 'products', fresh=status != 'published')
+    if cached:
+        return cached
+    if not tokenize(q):
+        return []
+
+    if status == 'published':
+        index = catalogue.current.search
+    else:
+        # Drafts are not in the snapshot: narrow down in MongoDB, rank here
+        query = {'$and': [
+            {'$or': [
+                {field: {'$regex': r'\b' + re.escape(word), '$options': 'i'}}
+                for field in ('name', 'description')
+            ]}
+            for word in dict.fromkeys(tokenize(q))
+        ]}
+        if status:
+            query['status'] = status
+        if category_id:
+            query['category_id'] = category_id
+        index = SearchIndex(
+            await db.products.find(query, {"_id": 0}).to_list(SEARCH_MAX_CANDIDATES)
+        )
+
+    products = [product for _, product in index.search(q, category_id=category_id, limit=limit)]
+    if image_variant:
+        products = [pick_image_variant(dict(prod), image_variant) for prod in products]
+    return fast_json(products, Product, response, many=True)
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+async def get_product(
+    product_id: str,
+    request: Request,
+    response: Response,
+    image_variant: Optional[str] = Query(None)
+):
+    validate_image_variant(image_variant)
+    snapshot = catalogue.current
+    cached = await not_modified(
+        request, response, 'products', fresh=product_id not in snapshot.published_by_id
+    )
+    if cached:
+        return cached
+    product = snapshot.published_by_id.get(product_id)
+    if not product:
+        # Drafts are not in the snapshot
+        product = await db.products.find_one({"id": product_id}, {"_id": 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    if isinstance(product['created_at'], str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
-    return product
+    if image_variant:
+        product = pick_image_variant(dict(product), image_variant)
+    return fast_json(product, Product, response)
 
 @api_router.put("/products/{product_id}", response_model=Product)
 async def update_product(product_id: str, product_update: ProductCreate, payload: dict = Depends(verify_token)):
-    existing = await db.products.find_one({"id": product_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
     update_data = product_update.model_dump(exclude_unset=True)
-    await db.products.update_one({"id": product_id}, {"$set": update_data})
-    
-    updated = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
+    update_data['updated_at'] = datetime.now(timezone.utc)
+    if 'images' in update_data:
+        update_data['images'] = await externalize_images(update_data['images'])
+        update_data['image_variants'] = await resolve_image_variants(update_data['images'])
+    updated = await db.products.find_one_and_update(
+        {"id": product_id},
+        {"$set": update_data},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Product not found")
+    await catalogue_changed(['products'], product_ids=[product_id])
     return updated
 
 @api_router.delete("/products/{product_id}")
@@ -246,441 +876,804 @@ async def delete_product(product_id: str, payload: dict = Depends(verify_token))
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await catalogue_changed(['products'], product_ids=[product_id])
     return {"message": "Product deleted successfully"}
 
+BULK_MAX_OPERATIONS = 1000
+
+@api_router.post("/products/bulk", response_model=ProductBulkResult)
+async def bulk_products(bulk: ProductBulkRequest, payload: dict = Depends(verify_token)):
+    """
+    Create, update and delete many products with one unordered bulk_write.
+    Every item gets its own result; a failed item does not stop the others.
+    """
+    total = len(bulk.create) + len(bulk.update) + len(bulk.delete)
+    if total > BULK_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many operations ({total}); at most {BULK_MAX_OPERATIONS} per request"
+        )
+
+    results = {
+        'create': [None] * len(bulk.create),
+        'update': [None] * len(bulk.update),
+        'delete': [None] * len(bulk.delete),
+    }
+
+    def fail(kind, index, product_id, error):
+        results[kind][index] = {"index": index, "id": product_id, "ok": False, "error": error}
+
+    # Images are externalized per item so a bad data URI only fails its item
+    async def item_images(kind, index, product_id, images):
+        try:
+            return [await store_inline_image(image) for image in images]
+        except InvalidDataURI as e:
+            fail(kind, index, product_id, str(e))
+            return None
+
+    creates = []
+    for index, item in enumerate(bulk.create):
+        try:
+            product = ProductCreate.model_validate(item)
+        except ValidationError as e:
+            fail('create', index, None, validation_message(e))
+            continue
+        images = await item_images('create', index, None, product.images)
+        if images is not None:
+            creates.append((index, product, images))
+    updates = []
+    for index, item in enumerate(bulk.update):
+        try:
+            update = ProductBulkUpdate.model_validate(item)
+        except ValidationError as e:
+            item_id = item.get('id') if isinstance(item, dict) else None
+            fail('update', index, item_id if isinstance(item_id, str) else None, validation_message(e))
+            continue
+        images = None
+        if update.images is not None:
+            images = await item_images('update', index, update.id, update.images)
+            if images is None:
+                continue
+        updates.append((index, update, images))
+
+    # One lookup for the variants of every image in the batch
+    batch_images = [url for _, _, images in creates + updates for url in images or []]
+    variants = await resolve_image_variants(batch_images)
+
+    def variants_of(images):
+        return {url: variants[url] for url in images if url in variants}
+
+    ops = []
+    op_items = []  # (kind, index, product id) of each op
+
+    for index, product, images in creates:
+        product_obj = Product(
+            **product.model_dump(exclude={'images'}),
+            images=images,
+            image_variants=variants_of(images)
+        )
+        product_obj.updated_at = product_obj.created_at
+        ops.append(InsertOne(product_obj.model_dump()))
+        op_items.append(('create', index, product_obj.id))
+
+    # Unknown ids are reported without sending a write for them
+    ids = [update.id for _, update, _ in updates] + bulk.delete
+    found = await db.products.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(len(ids))
+    existing = {doc['id'] for doc in found}
+
+    now = datetime.now(timezone.utc)
+    for index, update, images in updates:
+        if update.id not in existing:
+            fail('update', index, update.id, "Product not found")
+            continue
+        update_data = update.model_dump(exclude_unset=True, exclude={'id', 'images'})
+        update_data['updated_at'] = now
+        if images is not None:
+            update_data['images'] = images
+            update_data['image_variants'] = variants_of(images)
+        ops.append(UpdateOne({"id": update.id}, {"$set": update_data}))
+        op_items.append(('update', index, update.id))
+
+    for index, product_id in enumerate(bulk.delete):
+        if product_id not in existing:
+            fail('delete', index, product_id, "Product not found")
+            continue
+        ops.append(DeleteOne({"id": product_id}))
+        op_items.append(('delete', index, product_id))
+
+    errors = {}
+    if ops:
+        try:
+            await db.products.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            errors = {error['index']: error['errmsg'] for error in e.details['writeErrors']}
+
+    changed = []
+    for op_index, (kind, index, product_id) in enumerate(op_items):
+        error = errors.get(op_index)
+        results[kind][index] = {"index": index, "id": product_id, "ok": error is None, "error": error}
+        if error is None:
+            changed.append(product_id)
+    if changed:
+        await catalogue_changed(['products'], product_ids=changed)
+    return results
+
+# Catalogue Import/Export Routes
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_ERRORS = 100  # row errors kept on the import record
+
+IMPORT_MODELS = {'products': Product, 'categories': Category}
+
+def validate_transfer_params(collection, file_format):
+    if collection not in catalogue_io.FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid collection. Allowed: {', '.join(catalogue_io.FIELDS)}"
+        )
+    if file_format not in catalogue_io.FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format. Allowed: {', '.join(catalogue_io.FORMATS)}"
+        )
+
+@api_router.get("/export")
+async def export_catalogue(
+    collection: str = Query('products'),  # "products" or "categories"
+    file_format: str = Query('ndjson', alias='format'),  # "ndjson" or "csv"
+    payload: dict = Depends(verify_token)
+):
+    """Stream every document of a collection straight from the cursor"""
+    validate_transfer_params(collection, file_format)
+
+    async def lines():
+        buffer = [catalogue_io.csv_header(collection)] if file_format == 'csv' else []
+        size = 0
+        async for doc in db[collection].find({}, {"_id": 0, "image_variants": 0}).batch_size(1000):
+            if file_format == 'csv':
+                line = catalogue_io.csv_row(collection, doc)
+            else:
+                line = catalogue_io.ndjson_line(doc)
+            buffer.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield ''.join(buffer).encode()
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer).encode()
+
+    return StreamingResponse(
+        lines(),
+        media_type=catalogue_io.FORMATS[file_format],
+        headers={'Content-Disposition': f'attachment; filename="{collection}.{file_format}"'}
+    )
+
+async def import_documents(collection, rows):
+    """Turn parsed rows into upsert ops; returns (ops, ids, [(line, error)])"""
+    model = IMPORT_MODELS[collection]
+    docs, errors = [], []
+    for line_number, row in rows:
+        if isinstance(row, Exception):
+            errors.append((line_number, str(row)))
+            continue
+        if not row.get('id'):
+            row.pop('id', None)
+        try:
+            # Validated first, so images is known to be a list of strings
+            obj = model(**row)
+            if 'images' in obj.model_fields_set:
+                obj.images = [await store_inline_image(image) for image in obj.images]
+        except (ValueError, TypeError) as e:
+            # pydantic's ValidationError and InvalidDataURI are ValueErrors
+            errors.append((line_number, str(e)))
+            continue
+        doc = obj.model_dump()
+        # Fields the row leaves out get their defaults only in new documents,
+        # so re-importing an export without created_at keeps the original
+        defaults = {field: doc.pop(field) for field in set(doc) - obj.model_fields_set - {'id'}}
+        docs.append((doc, defaults))
+
+    if collection == 'products':
+        # One variant lookup for the whole batch
+        variants = await resolve_image_variants([
+            url for doc, defaults in docs for url in {**defaults, **doc}['images']
+        ])
+        now = datetime.now(timezone.utc)
+        for doc, defaults in docs:
+            for derived in ('image_variants', 'updated_at'):
+                doc.pop(derived, None)
+                defaults.pop(derived, None)
+            # Variants go with the images they describe
+            target = doc if 'images' in doc else defaults
+            target['image_variants'] = {url: variants[url] for url in target['images'] if url in variants}
+            doc['updated_at'] = now
+
+    ops = []
+    for doc, defaults in docs:
+        update = {"$set": doc}
+        if defaults:
+            update["$setOnInsert"] = defaults
+        ops.append(UpdateOne({"id": doc['id']}, update, upsert=True))
+    return ops, [doc['id'] for doc, _ in docs], errors
+
+@api_router.post("/import")
+async def import_catalogue(
+    file: UploadFile = File(...),
+    collection: str = Query('products'),  # "products" or "categories"
+    file_format: Optional[str] = Query(None, alias='format'),  # default: from the file extension
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=5000),
+    payload: dict = Depends(verify_token)
+):
+    """
+    Upsert products or categories by id from an NDJSON or CSV file. The file
+    is parsed incrementally and written in unordered bulk writes of
+    batch_size; progress is recorded on the import, see GET /imports.
+    """
+    file_format = file_format or catalogue_io.format_for_filename(file.filename) or 'ndjson'
+    validate_transfer_params(collection, file_format)
+
+    record = {
+        "id": str(uuid.uuid4()),
+        "collection": collection,
+        "format": file_format,
+        "filename": file.filename,
+        "status": "running",
+        "processed": 0,
+        "upserted": 0,
+        "modified": 0,
+        "failed": 0,
+        "errors": [],
+        "started_at": datetime.now(timezone.utc),
+        "finished_at": None,
+    }
+    await db.imports.insert_one(dict(record))
+
+    rows = catalogue_io.read_rows(file.file, file_format)
+    imported_ids = []
+    try:
+        while True:
+            batch = await asyncio.to_thread(catalogue_io.next_batch, rows, batch_size)
+            if not batch:
+                break
+            ops, ids, errors = await import_documents(collection, batch)
+            if ops:
+                try:
+                    result = await db[collection].bulk_write(ops, ordered=False)
+                    upserted, modified = result.upserted_count, result.modified_count
+                except BulkWriteError as e:
+                    upserted, modified = e.details['nUpserted'], e.details['nModified']
+                    failed_ops = {error['index']: error['errmsg'] for error in e.details['writeErrors']}
+                    errors += [(None, f"{ids[index]}: {message}") for index, message in failed_ops.items()]
+                    ids = [doc_id for index, doc_id in enumerate(ids) if index not in failed_ops]
+                record['upserted'] += upserted
+                record['modified'] += modified
+            imported_ids += ids
+            record['processed'] += len(batch)
+            record['failed'] += len(errors)
+            room = MAX_IMPORT_ERRORS - len(record['errors'])
+            record['errors'] += [{"line": line, "error": error} for line, error in errors[:room]]
+            await db.imports.update_one({"id": record['id']}, {"$set": record})
+            logger.info(f"Import {record['id']}: {record['processed']} rows processed")
+        record['status'] = 'completed'
+    except (UnicodeDecodeError, csv.Error) as e:
+        record['status'] = 'failed'
+        record['errors'].append({"line": None, "error": f"Unreadable file: {e}"})
+    finally:
+        record['finished_at'] = datetime.now(timezone.utc)
+        if record['status'] == 'running':
+            record['status'] = 'failed'
+        await db.imports.update_one({"id": record['id']}, {"$set": record})
+        if imported_ids:
+            if collection == 'products':
+                await catalogue_changed(['products'], product_ids=imported_ids)
+            else:
+                await catalogue_changed(['categories'], category_ids=imported_ids)
+    return record
+
+@api_router.get("/imports")
+async def get_imports(payload: dict = Depends(verify_token)):
+    """Recent imports, newest first; running ones show their progress so far"""
+    return await db.imports.find({}, {"_id": 0}).sort("started_at", -1).to_list(20)
+
+@api_router.get("/imports/{import_id}")
+async def get_import(import_id: str, payload: dict = Depends(verify_token)):
+    record = await db.imports.find_one({"id": import_id}, {"_id": 0})
+    if not record:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return record
+
 # Settings Routes
 @api_router.get("/settings", response_model=Settings)
-async def get_settings():
-    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-    if not settings:
-        # Create default settings
-        default_settings = Settings()
-        await db.settings.insert_one(default_settings.model_dump())
-        return default_settings
-    return settings
+async def get_settings(request: Request, response: Response):
+    cached = await not_modified(request, response, 'settings')
+    if cached:
+        return cached
+    settings = catalogue.current.settings
+    if settings:
+        return fast_json(dict(settings), Settings, response)
+    # Create default settings; an upsert so concurrent first requests
+    # cannot insert duplicate documents
+    result = await db.settings.update_one(
+        {"id": "settings"}, {"$setOnInsert": settings_defaults()}, upsert=True
+    )
+    if result.upserted_id is not None:
+        await catalogue_changed(['settings'])
+        # The ETag set above is for the version before the insert
+        await not_modified(request, response, 'settings')
+    # Another worker may have created them before this snapshot saw it
+    settings = catalogue.current.settings or await db.settings.find_one({"id": "settings"}, {"_id": 0})
+    return fast_json(dict(settings), Settings, response)
 
 @api_router.put("/settings", response_model=Settings)
 async def update_settings(settings_update: SettingsUpdate, payload: dict = Depends(verify_token)):
-    existing = await db.settings.find_one({"id": "settings"})
-    if not existing:
-        # Create if doesn't exist
-        new_settings = Settings(**settings_update.model_dump(exclude_unset=True))
-        await db.settings.insert_one(new_settings.model_dump())
-        return new_settings
+    if settings_update.company_logo:
+        settings_update.company_logo = (await externalize_images([settings_update.company_logo]))[0]
 
     update_data = settings_update.model_dump(exclude_unset=True)
-    await db.settings.update_one({"id": "settings"}, {"$set": update_data})
-
-    updated = await db.settings.find_one({"id": "settings"}, {"_id": 0})
+    # Create if doesn't exist, with defaults for the fields not being set
+    update = {"$setOnInsert": settings_defaults(exclude=update_data)}
+    if update_data:
+        update["$set"] = update_data
+    updated = await db.settings.find_one_and_update(
+        {"id": "settings"},
+        update,
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    await catalogue_changed(['settings'])
     return updated
 
 # Image Upload Route
 @api_router.post("/upload-image")
 async def upload_image(file: UploadFile = File(...), payload: dict = Depends(verify_token)):
     """
-    Upload an image to the server and return its URL
+    Upload an image to the server and return its URL.
+
+    The file is streamed into the content-addressed blob store in chunks off
+    the event loop, hashed on the way in. Uploading an image that is already
+    stored returns the existing URL and variants.
     """
     try:
         # Validate file type
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
         file_ext = Path(file.filename).suffix.lower()
 
-        if file_ext not in allowed_extensions:
+        if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid file type. Allowed: {', '.join(allowed_extensions)}"
+                detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}"
             )
 
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = UPLOADS_DIR / unique_filename
+        # The content decides the type, not the name
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        detected_ext = sniff_image_type(chunk)
+        if detected_ext is None:
+            raise HTTPException(status_code=400, detail="File content is not a JPEG, PNG, GIF or WebP image")
 
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Get the base URL from environment or use default
-        base_url = os.environ.get('BASE_URL', 'http://localhost:8000')
-        image_url = f"{base_url}/uploads/{unique_filename}"
+        writer = await asyncio.to_thread(blob_store.writer, detected_ext)
+        try:
+            while chunk:
+                if writer.size + len(chunk) > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+                await asyncio.to_thread(writer.write, chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            filename, created = await asyncio.to_thread(writer.commit)
+        except BaseException:
+            await asyncio.to_thread(writer.abort)
+            raise
+
+        # Thumbnail, card and print derivatives, made once per distinct image
+        variants = None if created else await stored_image_variants(filename)
+        if variants is None:
+            variants = await record_image_variants(filename)
 
         return {
             "success": True,
-            "url": image_url,
-            "filename": unique_filename
+            "url": f"{BASE_URL}/uploads/{filename}",
+            "filename": filename,
+            "duplicate": not created,
+            "variants": variant_urls(variants)
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error uploading image: {str(e)}")
 
-# Helper function to format description text for PDF
-def format_description_for_pdf(text):
-    """Convert markdown-like formatting to ReportLab XML"""
-    if not text:
-        return ''
-
-    # Escape HTML entities
-    text = html.escape(text)
-
-    # Convert bold: **text** or __text__ to <b>text</b>
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
-
-    # Convert italic: *text* or _text_ to <i>text</i>
-    text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<i>\1</i>', text)
-    text = re.sub(r'(?<!_)_(?!_)(.+?)(?<!_)_(?!_)', r'<i>\1</i>', text)
-
-    # Handle bullet points and paragraphs
-    lines = text.split('\n')
-    result = []
-    in_list = False
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            if in_list:
-                result.append('</ul>')
-                in_list = False
-            result.append('<br/>')
-            continue
-
-        # Check for bullet points
-        if re.match(r'^[-*•]\s', line):
-            if not in_list:
-                result.append('<ul>')
-                in_list = True
-            # Remove bullet marker
-            content = re.sub(r'^[-*•]\s', '', line)
-            result.append(f'<li>{content}</li>')
-        else:
-            if in_list:
-                result.append('</ul>')
-                in_list = False
-            result.append(f'{line}<br/>')
-
-    if in_list:
-        result.append('</ul>')
-
-    return ''.join(result)
-
 # PDF Generation Route
-@api_router.post("/generate-pdf")
-async def generate_pdf(pdf_request: PDFRequest):
-    # Fetch selected products
-    products = await db.products.find({"id": {"$in": pdf_request.product_ids}}, {"_id": 0}).to_list(1000)
+pdf_builds = SingleFlight()
+
+def catalogue_date():
+    """Date printed on the title page of catalogues built now"""
+    return datetime.now(timezone.utc).strftime('%B %d, %Y')
+
+def no_progress(phase, done=None, total=None):
+    pass
+
+async def render_catalogue(products, category_dict, settings, generated_on, progress, profile=None):
+    # Embed the print-sized derivatives rather than full-resolution originals
+    for product in products:
+        pick_image_variant(product, 'print')
+
+    # Prefetch every image concurrently before layout starts
+    from pdf_images import collect_image_urls
+    urls = collect_image_urls(products, settings)
+    progress('images', 0, len(urls))
+    started = time.perf_counter()
+    images = await image_fetcher().fetch_all(
+        urls, progress=lambda done: progress('images', done, len(urls))
+    )
+    fetch_seconds = time.perf_counter() - started
+    PDF_PHASE_SECONDS.labels('image_fetch').observe(fetch_seconds)
+
+    # Layout is CPU-bound, so hand a plain-data spec to the render pool
+    spec = {
+        'products': products,
+        'category_names': category_dict,
+        'settings': settings,
+        'images': images,
+        'generated_on': generated_on,
+    }
+    progress('layout')
+    sampled = profile is None and random.random() < PDF_PROFILE_SAMPLE_RATE
+    try:
+        pdf, stats = await render_pool.render(spec, profile=profile is not None or sampled)
+    except RenderQueueFull:
+        raise pdf_admission.reject('render_queue_full')
+    size = pdf.size if isinstance(pdf, PDFFile) else len(pdf)
+    fetch_failures = sum(data is None for data in images.values())
+    if 'profile' in stats:
+        meta = await asyncio.to_thread(profile_store.save, stats.pop('profile'), {
+            'trigger': 'sampled' if sampled else 'requested',
+            'products': len(products),
+            'images': len(urls),
+            'image_fetch_failures': fetch_failures,
+            'image_decode_failures': stats['image_decode_failures'],
+            'pages': stats['pages'],
+            'bytes': size,
+            # Render phases are slowed down by the profiler
+            'seconds': {
+                'image_fetch': round(fetch_seconds, 3),
+                'story': round(stats['story_seconds'], 3),
+                'doc_build': round(stats['build_seconds'], 3),
+            },
+        })
+        if profile is not None:
+            profile['id'] = meta['id']
+    record_pdf_render(stats, size, fetch_failures=fetch_failures)
+    return pdf, fetch_failures
+
+def check_pdf_size(product_ids):
+    if len(product_ids) > PDF_MAX_PRODUCTS:
+        pdf_admission.rejected['too_many_products'] += 1
+        raise HTTPException(
+            status_code=413,
+            detail=f"A PDF can include at most {PDF_MAX_PRODUCTS} products"
+        )
+
+async def pdf_rate_limit(request: Request):
+    """Dependency limiting how often each client may start a PDF build"""
+    # Behind a reverse proxy, run uvicorn with --proxy-headers so this is the real client
+    client_ip = request.client.host if request.client else 'unknown'
+    wait = pdf_rate_limiter.take(client_ip)
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many PDF requests, please try again shortly",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+
+async def build_catalogue_pdf(product_ids, progress=no_progress, profile=None):
+    """
+    Fetch, cache-check and render the catalogue for product_ids; returns
+    (PDF as bytes or PDFFile, cache status). The status is HIT, MISS, or
+    DEGRADED for a render missing images that could not be fetched, which
+    is not cached so the next request tries again. progress(phase, done, total)
+    is told when the images and layout phases start and how many images
+    have been fetched. Given a profile dict, the build skips the cache, is
+    profiled, and the id of the stored profile is set in profile['id'].
+    """
+    # Published products, settings and category names come from the snapshot;
+    # copies, since the print variants are swapped in below
+    started = time.perf_counter()
+    snapshot = catalogue.current
+    wanted = set(product_ids)
+    products = [dict(snapshot.published_by_id[pid]) for pid in wanted if pid in snapshot.published_by_id]
+    products.sort(key=catalogue_order)
+    drafts = wanted - snapshot.published_by_id.keys()
+    if drafts:
+        products += await db.products.find({"id": {"$in": list(drafts)}}, {"_id": 0}).to_list(len(drafts))
 
     if not products:
         raise HTTPException(status_code=404, detail="No products found")
 
-    # Fetch settings for logo
-    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-
-    # Fetch categories for names
-    categories = await db.categories.find({}, {"_id": 0}).to_list(1000)
-    category_dict = {cat['id']: cat['name'] for cat in categories}
-
-    # Generate PDF
-    pdf_path = f"/tmp/catalogue_{uuid.uuid4()}.pdf"
-
-    # Custom page template with professional header and footer
-    def add_header_footer(canvas, doc):
-        canvas.saveState()
-        page_num = canvas.getPageNumber()
-
-        # Header - Modern design with company name
-        canvas.setFillColorRGB(0.13, 0.25, 0.59)  # Professional dark blue
-        canvas.rect(0, doc.height + 1.65*inch, doc.width + 2*inch, 0.5*inch, fill=True)
-
-        canvas.setFillColorRGB(1, 1, 1)  # White text
-        canvas.setFont('Helvetica-Bold', 16)
-        canvas.drawString(0.75*inch, doc.height + 1.85*inch, "UNITED COPIER")
-
-        canvas.setFont('Helvetica', 9)
-        canvas.drawString(0.75*inch, doc.height + 1.70*inch, "Premium Office Solutions")
-
-        # Page number on header (right side)
-        canvas.setFont('Helvetica', 9)
-        canvas.drawRightString(doc.width + 1.25*inch, doc.height + 1.78*inch, f"Page {page_num}")
-
-        # Footer with contact information
-        canvas.setFillColorRGB(0.96, 0.96, 0.96)  # Light gray background
-        canvas.rect(0, 0, doc.width + 2*inch, 0.9*inch, fill=True)
-
-        # Draw a thin line above footer
-        canvas.setStrokeColorRGB(0.13, 0.25, 0.59)
-        canvas.setLineWidth(2)
-        canvas.line(0.75*inch, 0.9*inch, doc.width + 1.25*inch, 0.9*inch)
-
-        # Footer content in three columns
-        canvas.setFillColorRGB(0.2, 0.2, 0.2)
-        canvas.setFont('Helvetica-Bold', 9)
-
-        # Left column - Address
-        canvas.drawString(0.75*inch, 0.60*inch, "Head Office:")
-        canvas.setFont('Helvetica', 8)
-        canvas.drawString(0.75*inch, 0.45*inch, "118, Jaora Compound")
-        canvas.drawString(0.75*inch, 0.32*inch, "Indore, Madhya Pradesh")
-
-        # Center column - Contact
-        canvas.setFont('Helvetica-Bold', 9)
-        canvas.drawString(3.2*inch, 0.60*inch, "Contact:")
-        canvas.setFont('Helvetica', 8)
-        canvas.drawString(3.2*inch, 0.45*inch, "Phone: 8103349299")
-        canvas.drawString(3.2*inch, 0.32*inch, "All Solutions Under One Roof")
-
-        # Right column - Branches
-        canvas.setFont('Helvetica-Bold', 9)
-        canvas.drawString(5.5*inch, 0.60*inch, "Branch Offices:")
-        canvas.setFont('Helvetica', 8)
-        canvas.drawString(5.5*inch, 0.45*inch, "Bhopal")
-        canvas.drawString(5.5*inch, 0.32*inch, "Jabalpur")
-
-        # Copyright
-        canvas.setFont('Helvetica', 7)
-        canvas.setFillColorRGB(0.4, 0.4, 0.4)
-        canvas.drawCentredString(doc.width/2 + inch, 0.15*inch, "© 2025 United Copier. All rights reserved.")
-
-        canvas.restoreState()
-
-    doc = SimpleDocTemplate(pdf_path, pagesize=A4,
-                           rightMargin=0.75*inch, leftMargin=0.75*inch,
-                           topMargin=1.4*inch, bottomMargin=1.1*inch)
-
-    story = []
-    styles = getSampleStyleSheet()
-
-    # Professional custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=32,
-        textColor=colors.HexColor('#1a3a8a'),
-        spaceAfter=6,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold',
-        leading=38
-    )
+    settings = dict(snapshot.settings) if snapshot.settings else None
+    category_dict = dict(snapshot.category_names)
+    fetched = time.perf_counter()
 
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Normal'],
-        fontSize=14,
-        textColor=colors.HexColor('#4b5563'),
-        spaceAfter=6,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Oblique'
-    )
+    # Serve identical catalogues from the rendered PDF cache
+    generated_on = catalogue_date()
+    cache_key = catalogue_cache_key(products, category_dict, settings, generated_on)
+    pdf = await pdf_cache.get(cache_key) if profile is None else None
+    cache_status = 'HIT'
 
-    date_style = ParagraphStyle(
-        'DateStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#6b7280'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
+    if pdf is None:
+        cache_status = 'MISS'
+        PDF_PHASE_SECONDS.labels('db_fetch').observe(fetched - started)
 
-    # Add logo if available
-    if settings and settings.get('company_logo'):
+        # Image fetching and layout only start once the build is admitted
         try:
-            logo_data = settings['company_logo']
-            if logo_data.startswith('data:image'):
-                logo_data = logo_data.split(',')[1]
-                logo_bytes = base64.b64decode(logo_data)
-                logo_img = RLImage(BytesIO(logo_bytes), width=3*inch, height=1.5*inch)
-            elif logo_data.startswith('http'):
-                response = requests.get(logo_data)
-                logo_img = RLImage(BytesIO(response.content), width=3*inch, height=1.5*inch)
-            else:
-                logo_img = None
+            async with pdf_admission.admit():
+                pdf, fetch_failures = await render_catalogue(
+                    products, category_dict, settings, generated_on, progress, profile
+                )
+        except Saturated as e:
+            raise HTTPException(
+                status_code=503,
+                detail="PDF generator is busy, please try again shortly",
+                headers={"Retry-After": str(e.retry_after)}
+            )
 
-            if logo_img:
-                story.append(logo_img)
-                story.append(Spacer(1, 0.3*inch))
-        except:
-            pass
+        if fetch_failures:
+            cache_status = 'DEGRADED'
+        else:
+            await pdf_cache.put(
+                cache_key, pdf,
+                product_ids=[p['id'] for p in products],
+                category_ids={p['category_id'] for p in products}
+            )
 
-    # Add title page content
-    story.append(Paragraph("PRODUCT CATALOGUE", title_style))
-    story.append(Paragraph("Office Printing Solutions & Services", subtitle_style))
-    story.append(Paragraph(f"Generated on {datetime.now(timezone.utc).strftime('%B %d, %Y')}", date_style))
+    PDF_BUILDS.labels(cache_status.lower()).inc()
+    return pdf, cache_status
 
-    # Add summary box
-    summary_data = [
-        ['Total Products:', str(len(products))],
-        ['Categories:', str(len(set(p['category_id'] for p in products)))],
-    ]
-    summary_table = Table(summary_data, colWidths=[2.5*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f0f9ff')),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e40af')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#0f172a')),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bfdbfe')),
-        ('LEFTPADDING', (0, 0), (-1, -1), 12),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 12),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
-    story.append(summary_table)
-    story.append(Spacer(1, 0.4*inch))
-
-    # Decorative line
-    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#2563eb'),
-                            spaceAfter=0.3*inch, spaceBefore=0.1*inch))
-
-    # Define product-specific styles
-    prod_name_style = ParagraphStyle(
-        'ProductName',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#0f172a'),
-        fontName='Helvetica-Bold',
-        spaceAfter=6,
-        spaceBefore=0,
-        leading=20
-    )
+def pdf_response(pdf, headers):
+    """Response for a rendered PDF; PDFFiles are streamed in chunks with their Content-Length"""
+    if not isinstance(pdf, PDFFile):
+        return Response(content=pdf, media_type='application/pdf', headers=headers)
 
-    category_style = ParagraphStyle(
-        'Category',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#6366f1'),
-        fontName='Helvetica-Bold',
-        spaceAfter=8
+    async def chunks():
+        for offset in range(0, pdf.size, PDF_STREAM_CHUNK_SIZE):
+            yield await asyncio.to_thread(pdf.read_at, offset, PDF_STREAM_CHUNK_SIZE)
+
+    return StreamingResponse(
+        chunks(),
+        media_type='application/pdf',
+        headers={**headers, 'Content-Length': str(pdf.size)}
     )
 
-    price_style = ParagraphStyle(
-        'Price',
-        parent=styles['Normal'],
-        fontSize=18,
-        textColor=colors.HexColor('#059669'),
-        fontName='Helvetica-Bold',
-        spaceAfter=10,
-        spaceBefore=6
+async def pdf_profile_requested(
+    profile: bool = Query(False),
+    x_profile: Optional[str] = Header(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """Dependency: whether an admin asked for this PDF build to be profiled"""
+    if not profile and (x_profile or '').lower() not in ('1', 'true'):
+        return False
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Profiling requires admin authentication")
+    await verify_token(credentials)
+    return True
+
+@api_router.post("/generate-pdf", dependencies=[Depends(pdf_rate_limit)])
+async def generate_pdf(pdf_request: PDFRequest, profile: bool = Depends(pdf_profile_requested)):
+    check_pdf_size(pdf_request.product_ids)
+    request_key = tuple(sorted(set(pdf_request.product_ids)))
+    headers = {'Content-Disposition': 'attachment; filename="United_Copier_Catalogue.pdf"'}
+    if profile:
+        # Profiled builds run on their own, past the cache and other callers
+        profiled = {}
+        pdf, cache_status = await build_catalogue_pdf(list(request_key), profile=profiled)
+        if 'id' in profiled:
+            headers['X-Profile-Id'] = profiled['id']
+    else:
+        # Identical selections in flight at the same time share one build
+        pdf, cache_status = await pdf_builds.do(
+            request_key, lambda report: build_catalogue_pdf(list(request_key), report)
+        )
+
+    return pdf_response(pdf, {**headers, 'X-PDF-Cache': cache_status})
+
+async def build_job_pdf(product_ids, progress):
+    # Shares the build of identical selections with other jobs and requests
+    request_key = tuple(sorted(set(product_ids)))
+    try:
+        pdf, _ = await pdf_builds.do(
+            request_key, lambda report: build_catalogue_pdf(list(request_key), report), progress
+        )
+    except HTTPException as e:
+        if e.status_code == 503:
+            raise JobRetry(e.detail)
+        raise JobFailed(e.detail)
+    return pdf
+
+pdf_jobs = PDFJobQueue(
+    db, PDF_JOBS_DIR, build_job_pdf,
+    ttl=PDF_JOB_TTL, concurrency=PDF_JOB_CONCURRENCY
+)
+
+def pdf_job_view(job):
+    """Public form of a job document"""
+    view = PDFJob(**job)
+    if job['status'] == 'completed':
+        view.download_url = f"{BASE_URL}/api/pdf-jobs/{job['id']}/download"
+    return view
+
+async def find_pdf_job(job_id):
+    job = await pdf_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="PDF job not found")
+    return job
+
+@api_router.post(
+    "/pdf-jobs", response_model=PDFJob, status_code=202, dependencies=[Depends(pdf_rate_limit)]
+)
+async def create_pdf_job(pdf_request: PDFRequest):
+    """
+    Build a catalogue in the background; follow it at GET /pdf-jobs/{id}
+    or /pdf-jobs/{id}/events, then download it.
+    """
+    if not pdf_request.product_ids:
+        raise HTTPException(status_code=400, detail="Select at least one product")
+    check_pdf_size(pdf_request.product_ids)
+    job = await pdf_jobs.submit(list(dict.fromkeys(pdf_request.product_ids)))
+    return pdf_job_view(job)
+
+@api_router.get("/pdf-jobs/{job_id}", response_model=PDFJob)
+async def get_pdf_job(job_id: str):
+    return pdf_job_view(await find_pdf_job(job_id))
+
+@api_router.get("/pdf-jobs/{job_id}/events")
+async def get_pdf_job_events(job_id: str):
+    """The job's state as Server-Sent Events, one per change, until it finishes"""
+    await find_pdf_job(job_id)
+
+    async def events():
+        # Read from MongoDB, since any worker may be running the job
+        last, last_sent = None, asyncio.get_running_loop().time()
+        while True:
+            job = await pdf_jobs.get(job_id)
+            if job is None:
+                yield "event: expired\ndata: {}\n\n"
+                return
+            state = pdf_job_view(job).model_dump_json()
+            now = asyncio.get_running_loop().time()
+            if state != last:
+                yield f"event: {job['status']}\ndata: {state}\n\n"
+                last, last_sent = state, now
+            elif now - last_sent > PDF_JOB_KEEPALIVE_SECONDS:
+                # Comment line so proxies do not close an idle stream
+                yield ": keep-alive\n\n"
+                last_sent = now
+            if job['status'] in FINISHED:
+                return
+            await asyncio.sleep(PDF_JOB_EVENT_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
 
-    desc_style = ParagraphStyle(
-        'Description',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#374151'),
-        alignment=TA_JUSTIFY,
-        spaceAfter=12,
-        leading=14,
-        bulletIndent=10,
-        leftIndent=0
+@api_router.get("/pdf-jobs/{job_id}/download")
+async def download_pdf_job(job_id: str):
+    job = await find_pdf_job(job_id)
+    if job['status'] != 'completed':
+        raise HTTPException(status_code=409, detail=f"PDF job is {job['status']}")
+    try:
+        pdf = await asyncio.to_thread(PDFFile.open, pdf_jobs.path(job_id))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="PDF job not found")
+    return pdf_response(pdf, {
+        'Content-Disposition': 'attachment; filename="United_Copier_Catalogue.pdf"'
+    })
+
+async def build_prebuilt_pdf(product_ids):
+    pdf, cache_status = await build_catalogue_pdf(product_ids)
+    return pdf, cache_status != 'DEGRADED'
+
+prebuilt_catalogues = PrebuiltCatalogues(
+    PDF_PREBUILT_DIR, catalogue, build_prebuilt_pdf, catalogue_date,
+    debounce=PDF_PREBUILT_DEBOUNCE
+)
+
+def prebuilt_name(scope):
+    if scope == ALL_PRODUCTS:
+        return "Full catalogue"
+    return catalogue.current.category_names.get(scope, scope)
+
+@api_router.get("/catalogue-pdfs", response_model=List[PrebuiltCatalogue])
+async def list_prebuilt_catalogues():
+    """The prebuilt catalogue PDFs: the full catalogue and one per category"""
+    built = await asyncio.to_thread(prebuilt_catalogues.built)
+    # Full catalogue first, then categories by name
+    order = sorted(built, key=lambda scope: (scope != ALL_PRODUCTS, prebuilt_name(scope)))
+    return [
+        PrebuiltCatalogue(
+            scope=scope, name=prebuilt_name(scope), products=built[scope]['products'],
+            size=built[scope]['size'], built_at=built[scope]['built_at'],
+            url=f"{BASE_URL}/api/catalogue-pdfs/{scope}"
+        )
+        for scope in order
+    ]
+
+@api_router.get("/catalogue-pdfs/{scope}")
+async def get_prebuilt_catalogue(scope: str):
+    """
+    The published catalogue ("all") or one category's published products as
+    a PDF, laid out like /generate-pdf, served from the prebuilt copy.
+    """
+    headers = {'Content-Disposition': 'attachment; filename="United_Copier_Catalogue.pdf"'}
+    meta = await asyncio.to_thread(prebuilt_catalogues.meta, scope)
+    if meta is not None:
+        try:
+            pdf = await asyncio.to_thread(PDFFile.open, prebuilt_catalogues.path(scope))
+        except FileNotFoundError:
+            pass
+        else:
+            return pdf_response(pdf, {**headers, 'X-Catalogue-Built-At': meta['built_at']})
+
+    if scope not in catalogue_scopes(catalogue.current):
+        raise HTTPException(status_code=404, detail="No products found")
+    # Not built yet. The scheduler was told when the scope appeared, so this
+    # only waits for it; building here would bypass admission control
+    raise HTTPException(
+        status_code=503,
+        detail="This catalogue PDF is being prepared, please try again shortly",
+        headers={"Retry-After": str(max(1, math.ceil(prebuilt_catalogues.debounce)))}
     )
 
-    # Add products with professional layout
-    for idx, product in enumerate(products):
-        product_content = []
-
-        # Product number badge and name in a table for better layout
-        header_data = [[
-            Paragraph(f'<font size="11" color="#ffffff"><b>#{idx + 1}</b></font>', styles['Normal']),
-            Paragraph(f'<b>{html.escape(product["name"])}</b>', prod_name_style)
-        ]]
-        header_table = Table(header_data, colWidths=[0.5*inch, 6*inch])
-        header_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#2563eb')),
-            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (0, 0), 8),
-            ('RIGHTPADDING', (0, 0), (0, 0), 8),
-            ('TOPPADDING', (0, 0), (0, 0), 6),
-            ('BOTTOMPADDING', (0, 0), (0, 0), 6),
-            ('LEFTPADDING', (1, 0), (1, 0), 12),
-        ]))
-        product_content.append(header_table)
-        product_content.append(Spacer(1, 0.12*inch))
-
-        # Category and Price in a two-column layout
-        cat_name = category_dict.get(product['category_id'], 'Uncategorized')
-        info_data = [[
-            Paragraph(f'<b>Category:</b> {html.escape(cat_name)}', category_style),
-            Paragraph(f'<b>₹{product["price"]:,.2f}</b>', price_style)
-        ]]
-        info_table = Table(info_data, colWidths=[3.5*inch, 3*inch])
-        info_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
-        product_content.append(info_table)
-
-        # Description with rich formatting
-        formatted_desc = format_description_for_pdf(product.get('description', ''))
-        desc_para = Paragraph(f'<b>Description:</b><br/>{formatted_desc}', desc_style)
-        product_content.append(desc_para)
-        product_content.append(Spacer(1, 0.15*inch))
-
-        # Product images with better layout
-        if product.get('images') and len(product['images']) > 0:
-            images_to_show = product['images'][:3]
-            img_list = []
-
-            for img_data in images_to_show:
-                try:
-                    if img_data.startswith('data:image'):
-                        img_data = img_data.split(',')[1]
-                        img_bytes = base64.b64decode(img_data)
-                        # Better aspect ratio handling
-                        prod_img = RLImage(BytesIO(img_bytes), width=2*inch, height=1.6*inch)
-                    elif img_data.startswith('http'):
-                        response = requests.get(img_data)
-                        prod_img = RLImage(BytesIO(response.content), width=2*inch, height=1.6*inch)
-                    else:
-                        continue
-                    img_list.append(prod_img)
-                except:
-                    continue
-
-            if img_list:
-                # Add images label
-                product_content.append(Paragraph('<b>Product Images:</b>',
-                    ParagraphStyle('ImageLabel', parent=styles['Normal'], fontSize=9,
-                                   textColor=colors.HexColor('#6b7280'), spaceAfter=6)))
-
-                # Create table for images with borders
-                img_table_data = [img_list]
-                img_table = Table(img_table_data, colWidths=[2.15*inch] * len(img_list))
-                img_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8fafc')),
-                    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e1')),
-                    ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 8),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-                    ('TOPPADDING', (0, 0), (-1, -1), 8),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-                ]))
-                product_content.append(img_table)
-                product_content.append(Spacer(1, 0.15*inch))
-
-        # Wrap product in a bordered frame
-        product_frame_data = [[KeepTogether(product_content)]]
-        product_frame = Table(product_frame_data, colWidths=[6.5*inch])
-        product_frame.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#ffffff')),
-            ('BOX', (0, 0), (-1, -1), 1.5, colors.HexColor('#cbd5e1')),
-            ('LEFTPADDING', (0, 0), (-1, -1), 16),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 16),
-            ('TOPPADDING', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 16),
-        ]))
-
-        story.append(product_frame)
-        story.append(Spacer(1, 0.25*inch))
-
-    # Build PDF with custom template
-    doc.build(story, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
-
-    return FileResponse(pdf_path, media_type='application/pdf', filename='United_Copier_Catalogue.pdf')
+@api_router.get("/admin/pdf-cache")
+async def get_pdf_cache_stats(payload: dict = Depends(verify_token)):
+    return {**pdf_cache.stats(), 'coalesced_builds': pdf_builds.coalesced}
+
+@api_router.get("/admin/pdf-admission")
+async def get_pdf_admission_stats(payload: dict = Depends(verify_token)):
+    return {
+        **pdf_admission.stats(),
+        'render_pool_pending': render_pool.pending,
+        'rate_limited': pdf_rate_limiter.stats(),
+    }
+
+@api_router.get("/admin/profiles")
+async def list_profiles(payload: dict = Depends(verify_token)):
+    return await asyncio.to_thread(profile_store.list)
+
+async def find_profile(profile_id):
+    meta = await asyncio.to_thread(profile_store.meta, profile_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return meta
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, payload: dict = Depends(verify_token)):
+    """The cProfile data of a render, for pstats or snakeviz"""
+    await find_profile(profile_id)
+    try:
+        data = await asyncio.to_thread(profile_store.path(profile_id).read_bytes)
+    except FileNotFoundError:
+        # Pruned since the sidecar was read
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=data, media_type='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename="pdf_render_{profile_id}.prof"'
+    })
+
+@api_router.get("/admin/profiles/{profile_id}/summary")
+async def get_profile_summary(profile_id: str, limit: int = Query(40, ge=1, le=500),
+                              payload: dict = Depends(verify_token)):
+    """The functions with the most cumulative time, as pstats prints them"""
+    await find_profile(profile_id)
+    summary = await asyncio.to_thread(profile_store.summary, profile_id, limit)
+    return Response(content=summary, media_type='text/plain')
+
+@api_router.get("/admin/catalogue-snapshot")
+async def get_catalogue_snapshot_stats(payload: dict = Depends(verify_token)):
+    return catalogue.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = exposition()
+    return Response(content=body, media_type=content_type)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -688,6 +1681,12 @@ app.include_router(api_router)
 # Mount static files for uploads
 app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
 
+app.add_middleware(
+    UploadSizeLimit,
+    paths=['/api/upload-image'],
+    max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -696,6 +1695,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the time of every other middleware is included
+app.add_middleware(RequestMetrics)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -703,6 +1705,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes(db)
+
+@app.on_event("startup")
+async def sweep_orphaned_pdfs():
+    # Older versions left catalogue_<uuid>.pdf files in the system temp dir
+    for directory in {PDF_SPILL_DIR, Path(tempfile.gettempdir())}:
+        await asyncio.to_thread(sweep_spilled, directory)
+
+async def count_string_dates():
+    """Documents per collection still holding ISO string dates"""
+    counts = {}
+    for collection, fields in DATE_FIELDS.items():
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        count = await db[collection].count_documents(query)
+        if count:
+            counts[collection] = count
+    return counts
+
+@app.on_event("startup")
+async def load_catalogue():
+    # The snapshot orders products by created_at, and string dates cannot be
+    # compared with datetimes
+    unmigrated = await count_string_dates()
+    if unmigrated:
+        found = ', '.join(f"{count} {collection}" for collection, count in unmigrated.items())
+        raise RuntimeError(
+            f"String dates found in {found}; run `python manage.py migrate-dates` first"
+        )
+    await catalogue.start()
+
+@app.on_event("startup")
+async def start_pdf_jobs():
+    await pdf_jobs.start()
+    await prebuilt_catalogues.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await prebuilt_catalogues.stop()
+    await pdf_jobs.stop()
+    await catalogue.stop()
+    client.close()
+    render_pool.shutdown()
+    if _image_fetcher is not None:
+        await _image_fetcher.aclose()
\ No newline at end of file
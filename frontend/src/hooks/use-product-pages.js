@@ -0,0 +1,51 @@
+import { useCallback, useEffect, useRef, useState } from 'react';
+import axios from 'axios';
+
+// Products per page; the API serves up to 200
+const PAGE_SIZE = 48;
+
+// Pages through GET /products matching params: the first page on mount and
+// whenever params change, the next one (via next_cursor) on loadMore()
+export function useProductPages(api, params) {
+  const [products, setProducts] = useState([]);
+  const [cursor, setCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
+  // Bumped on every reload so pages of a previous listing are dropped
+  const generation = useRef(0);
+  const query = JSON.stringify(params);
+
+  const fetchPage = useCallback(async (after) => {
+    const requested = generation.current;
+    setLoading(true);
+    try {
+      const response = await axios.get(`${api}/products`, {
+        params: { ...JSON.parse(query), limit: PAGE_SIZE, cursor: after || undefined },
+      });
+      if (requested !== generation.current) return;
+      setProducts(prev => (after ? [...prev, ...response.data.items] : response.data.items));
+      setCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching products:', error);
+    } finally {
+      if (requested === generation.current) setLoading(false);
+    }
+  }, [api, query]);
+
+  const reload = useCallback(() => {
+    generation.current += 1;
+    setCursor(null);
+    return fetchPage(null);
+  }, [fetchPage]);
+
+  useEffect(() => {
+    reload();
+  }, [reload]);
+
+  const loadMore = useCallback(() => {
+    if (cursor && !loading) {
+      fetchPage(cursor);
+    }
+  }, [cursor, loading, fetchPage]);
+
+  return { products, hasMore: Boolean(cursor), loading, loadMore, reload };
+}
@@ -1,7 +1,8 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { API } from '../App';
+import { useProductPages } from '@/hooks/use-product-pages';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Textarea } from '@/components/ui/textarea';
@@ -16,7 +17,6 @@ import { LogOut, Plus, Edit, Trash2, Package, Folder, Settings as SettingsIcon,
 
 const AdminDashboard = () => {
   const [categories, setCategories] = useState([]);
-  const [products, setProducts] = useState([]);
   const [settings, setSettings] = useState(null);
   const [activeTab, setActiveTab] = useState('products');
   const navigate = useNavigate();
@@ -43,10 +43,18 @@ const AdminDashboard = () => {
   // Settings Form
   const [settingsForm, setSettingsForm] = useState({ whatsapp_number: '', company_logo: '' });
 
+  // Products with the status filter, a page at a time; changing the filter
+  // or calling fetchProducts starts over from the first page
+  const productParams = useMemo(() => (
+    statusFilter === 'all' ? {} : { status: statusFilter }
+  ), [statusFilter]);
+  const {
+    products, hasMore, loading: loadingProducts, loadMore, reload: fetchProducts,
+  } = useProductPages(API, productParams);
+
   useEffect(() => {
     verifyToken();
     fetchCategories();
-    fetchProducts();
     fetchSettings();
   }, []);
 
@@ -137,26 +145,6 @@ const AdminDashboard = () => {
     setCategoryDialogOpen(true);
   };
 
-  // Products
-  const fetchProducts = async () => {
-    try {
-      const url = statusFilter === 'all'
-        ? `${API}/products`
-        : `${API}/products?status=${statusFilter}`;
-      const response = await axios.get(url);
-      setProducts(response.data);
-    } catch (error) {
-      console.error('Error fetching products:', error);
-    }
-  };
-
-  // Re-fetch products when status filter changes
-  useEffect(() => {
-    if (activeTab === 'products') {
-      fetchProducts();
-    }
-  }, [statusFilter, activeTab]);
-
   const handleImageUpload = async (e) => {
     const files = Array.from(e.target.files);
 
@@ -606,7 +594,7 @@ const AdminDashboard = () => {
                 <Card key={product.id} className="bg-white border-slate-200" data-testid={`product-item-${product.id}`}>
                   <div className="relative h-40 bg-slate-100">
                     {product.images && product.images.length > 0 ? (
-                      <img src={product.images[0]} alt={product.name} className="w-full h-full object-contain" />
+                      <img src={product.image_variants?.[product.images[0]]?.card?.url || product.images[0]} alt={product.name} loading="lazy" className="w-full h-full object-contain" />
                     ) : (
                       <div className="w-full h-full flex items-center justify-center">
                         <Package className="h-12 w-12 text-slate-300" />
@@ -685,6 +673,14 @@ const AdminDashboard = () => {
                 </Card>
               ))}
             </div>
+
+            {hasMore && (
+              <div className="flex justify-center mt-6">
+                <Button data-testid="load-more-products-btn" variant="outline" onClick={loadMore} disabled={loadingProducts}>
+                  {loadingProducts ? 'Loading...' : 'Load more'}
+                </Button>
+              </div>
+            )}
           </TabsContent>
 
           {/* Categories Tab */}
@@ -1,6 +1,7 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo } from 'react';
 import axios from 'axios';
 import { API } from '../App';
+import { useProductPages } from '@/hooks/use-product-pages';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
@@ -16,7 +17,6 @@ import { useNavigate } from 'react-router-dom';
 
 const HomePage = () => {
   const [categories, setCategories] = useState([]);
-  const [products, setProducts] = useState([]);
   const [filteredProducts, setFilteredProducts] = useState([]);
   const [selectedCategory, setSelectedCategory] = useState('all');
   const [searchQuery, setSearchQuery] = useState('');
@@ -26,14 +26,46 @@ const HomePage = () => {
   const [selectedProductView, setSelectedProductView] = useState(null);
   const navigate = useNavigate();
 
+  // Only published products for public view, filtered by category on the server
+  const productParams = useMemo(() => (
+    selectedCategory === 'all'
+      ? { status: 'published' }
+      : { status: 'published', category_id: selectedCategory }
+  ), [selectedCategory]);
+  const { products, hasMore, loading: loadingProducts, loadMore } = useProductPages(API, productParams);
+
   useEffect(() => {
     fetchCategories();
-    fetchProducts();
     fetchSettings();
   }, []);
 
   useEffect(() => {
-    filterProducts();
+    if (!searchQuery.trim()) {
+      setFilteredProducts(products);
+      return;
+    }
+
+    // Search on the server, debounced while typing
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const params = { q: searchQuery, status: 'published', limit: 100 };
+        if (selectedCategory !== 'all') {
+          params.category_id = selectedCategory;
+        }
+        const response = await axios.get(`${API}/products/search`, { params });
+        if (!cancelled) {
+          setFilteredProducts(response.data);
+        }
+      } catch (error) {
+        console.error('Error searching products:', error);
+      }
+    }, 200);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
   }, [selectedCategory, searchQuery, products]);
 
   const fetchCategories = async () => {
@@ -45,16 +77,6 @@ const HomePage = () => {
     }
   };
 
-  const fetchProducts = async () => {
-    try {
-      // Only fetch published products for public view
-      const response = await axios.get(`${API}/products?status=published`);
-      setProducts(response.data);
-    } catch (error) {
-      console.error('Error fetching products:', error);
-    }
-  };
-
   const fetchSettings = async () => {
     try {
       const response = await axios.get(`${API}/settings`);
@@ -64,23 +86,6 @@ const HomePage = () => {
     }
   };
 
-  const filterProducts = () => {
-    let filtered = products;
-
-    if (selectedCategory !== 'all') {
-      filtered = filtered.filter(p => p.category_id === selectedCategory);
-    }
-
-    if (searchQuery) {
-      filtered = filtered.filter(p =>
-        p.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        p.description.toLowerCase().includes(searchQuery.toLowerCase())
-      );
-    }
-
-    setFilteredProducts(filtered);
-  };
-
   const handleWhatsAppClick = (product) => {
     if (!settings?.whatsapp_number) {
       toast.error('WhatsApp number not configured');
@@ -137,28 +142,37 @@ const HomePage = () => {
       return;
     }
 
+    // Large catalogues take longer than a request may stay open, so the PDF
+    // is built as a background job that we poll until it can be downloaded
+    const toastId = toast.loading('Preparing PDF...');
     try {
-      const response = await axios.post(`${API}/generate-pdf`, {
+      let { data: job } = await axios.post(`${API}/pdf-jobs`, {
         product_ids: selectedProducts
-      }, {
-        responseType: 'blob'
       });
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        ({ data: job } = await axios.get(`${API}/pdf-jobs/${job.id}`));
+        toast.loading(`Preparing PDF... ${Math.round(job.progress * 100)}%`, { id: toastId });
+      }
+      if (job.status !== 'completed') {
+        throw new Error(job.error || 'PDF job failed');
+      }
 
-      const url = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement('a');
-      link.href = url;
+      link.href = job.download_url;
       link.setAttribute('download', 'catalogue.pdf');
       document.body.appendChild(link);
       link.click();
       link.remove();
-      window.URL.revokeObjectURL(url);
 
-      toast.success('PDF downloaded successfully!');
+      toast.success('PDF downloaded successfully!', { id: toastId });
       setPdfDialogOpen(false);
       setSelectedProducts([]);
     } catch (error) {
       console.error('Error generating PDF:', error);
-      toast.error('Failed to generate PDF');
+      // Busy, rate-limited and too-large requests explain themselves
+      const detail = error.response?.data?.detail;
+      toast.error(typeof detail === 'string' ? detail : 'Failed to generate PDF', { id: toastId });
     }
   };
 
@@ -395,8 +409,9 @@ const HomePage = () => {
                 <div className="relative h-56 bg-gradient-to-br from-blue-100 to-purple-100 overflow-hidden group">
                   {product.images && product.images.length > 0 ? (
                     <img
-                      src={product.images[0]}
+                      src={product.image_variants?.[product.images[0]]?.card?.url || product.images[0]}
                       alt={product.name}
+                      loading="lazy"
                       className="w-full h-full object-contain group-hover:scale-105 transition-transform duration-300"
                     />
                   ) : (
@@ -525,6 +540,21 @@ const HomePage = () => {
             ))}
           </div>
         )}
+
+        {/* Further pages of the listing; search results come in one response */}
+        {!searchQuery.trim() && hasMore && (
+          <div className="flex justify-center mt-8">
+            <Button
+              data-testid="load-more-btn"
+              variant="outline"
+              onClick={loadMore}
+              disabled={loadingProducts}
+              className="border-2 border-blue-300 hover:bg-blue-50 hover:border-blue-500"
+            >
+              {loadingProducts ? 'Loading...' : 'Load more'}
+            </Button>
+          </div>
+        )}
       </div>
 
       {/* Footer */}
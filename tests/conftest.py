@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py reads its configuration at import; the client it creates does not
+# connect until used, and file output goes to a scratch directory
+SCRATCH_DIR = Path(tempfile.mkdtemp(prefix='catalogue-tests-'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'catalogue_tests')
+for name in ('PDF_CACHE_DIR', 'PDF_JOBS_DIR', 'PDF_PREBUILT_DIR', 'PDF_PROFILE_DIR'):
+    os.environ.setdefault(name, str(SCRATCH_DIR / name.lower()))
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
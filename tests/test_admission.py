@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from admission import ConcurrencyLimit, Saturated, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+async def test_concurrency_limit_runs_limit_at_once():
+    limit = ConcurrencyLimit(2, max_queue=10)
+    running = peak = 0
+
+    async def work():
+        nonlocal running, peak
+        async with limit.admit():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(work() for _ in range(6)))
+    assert peak == 2
+    assert limit.admitted == 6
+    assert limit.active == 0 and limit.waiting == 0
+
+async def test_concurrency_limit_rejects_when_queue_is_full():
+    limit = ConcurrencyLimit(1, max_queue=1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with limit.admit():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    queued = asyncio.create_task(hold())
+    try:
+        await asyncio.sleep(0.01)
+        assert (limit.active, limit.waiting) == (1, 1)
+
+        with pytest.raises(Saturated) as refused:
+            async with limit.admit():
+                pass
+        assert refused.value.reason == 'queue_full'
+        assert refused.value.retry_after >= 1
+        assert limit.rejected['queue_full'] == 1
+    finally:
+        release.set()
+        await asyncio.gather(holder, queued)
+    assert limit.admitted == 2
+
+async def test_concurrency_limit_times_out_waiting():
+    limit = ConcurrencyLimit(1, max_queue=5, queue_timeout=0.01)
+    release = asyncio.Event()
+
+    async def hold():
+        async with limit.admit():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    try:
+        await asyncio.sleep(0.01)
+        with pytest.raises(Saturated) as refused:
+            async with limit.admit():
+                pass
+        assert refused.value.reason == 'queue_timeout'
+        assert limit.waiting == 0
+    finally:
+        release.set()
+        await holder
+    # The timed out waiter did not keep a slot
+    async with limit.admit():
+        assert limit.active == 1
+
+async def test_concurrency_limit_releases_slot_on_error():
+    limit = ConcurrencyLimit(1, max_queue=0)
+    with pytest.raises(RuntimeError):
+        async with limit.admit():
+            raise RuntimeError
+    async with limit.admit():
+        assert limit.active == 1
+    assert limit.stats()['active'] == 0
+
+def test_token_bucket_allows_burst_then_limits(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('admission.time.monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=3)
+
+    assert [bucket.take('a') for _ in range(3)] == [0, 0, 0]
+    assert bucket.take('a') == pytest.approx(0.5)
+    assert bucket.rejected == 1
+    # Other clients have their own bucket
+    assert bucket.take('b') == 0
+
+    now[0] += 0.5
+    assert bucket.take('a') == 0
+    assert bucket.take('a') > 0
+
+def test_token_bucket_refills_up_to_burst(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('admission.time.monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=1, burst=2)
+    bucket.take('a')
+    bucket.take('a')
+    now[0] += 60
+    assert [bucket.take('a') for _ in range(3)][:2] == [0, 0]
+    assert bucket.rejected == 1
+
+def test_token_bucket_rate_zero_disables_limiting():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.take('a') == 0 for _ in range(100))
+    assert bucket.stats() == {'clients': 0, 'rejected': 0}
+
+def test_token_bucket_forgets_idle_clients(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('admission.time.monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=1, burst=1, max_clients=2)
+    bucket.take('a')
+    bucket.take('b')
+    now[0] += 10
+    bucket.take('c')
+    assert bucket.stats()['clients'] == 1
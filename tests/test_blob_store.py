@@ -0,0 +1,63 @@
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import server
+from blob_store import BlobStore, sniff_image_type
+
+pytestmark = pytest.mark.anyio
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 32
+
+@pytest.mark.parametrize('head, ext', [
+    (JPEG, '.jpg'),
+    (PNG, '.png'),
+    (b'GIF87a' + b'\x00' * 8, '.gif'),
+    (b'GIF89a' + b'\x00' * 8, '.gif'),
+    (b'RIFF\x24\x00\x00\x00WEBPVP8 ', '.webp'),
+])
+def test_sniffs_supported_images(head, ext):
+    assert sniff_image_type(head) == ext
+
+@pytest.mark.parametrize('head', [
+    b'<html><script>alert(1)</script>',
+    b'<svg xmlns="http://www.w3.org/2000/svg"/>',
+    b'RIFF\x24\x00\x00\x00WAVEfmt ',
+    b'%PDF-1.4',
+    b'\x89PN',
+    b'',
+])
+def test_rejects_other_content(head):
+    assert sniff_image_type(head) is None
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    store = BlobStore(tmp_path)
+    monkeypatch.setattr(server, 'blob_store', store)
+
+    async def record_image_variants(filename):
+        return {}
+    async def stored_image_variants(filename):
+        return {}
+    monkeypatch.setattr(server, 'record_image_variants', record_image_variants)
+    monkeypatch.setattr(server, 'stored_image_variants', stored_image_variants)
+    return store
+
+def upload(name, data):
+    return server.upload_image(UploadFile(io.BytesIO(data), filename=name), payload={})
+
+async def test_upload_is_stored_under_its_detected_type(uploads):
+    result = await upload('photo.jpg', PNG)
+    assert result['filename'].startswith('blobs/') and result['filename'].endswith('.png')
+    assert (uploads.uploads_dir / result['filename']).read_bytes() == PNG
+    # The same bytes under another name map to the same blob
+    again = await upload('copy.png', PNG)
+    assert again['filename'] == result['filename'] and again['duplicate']
+
+async def test_upload_with_image_name_but_other_content_is_rejected(uploads):
+    with pytest.raises(HTTPException) as e:
+        await upload('evil.png', b'<html><script>alert(1)</script></html>')
+    assert e.value.status_code == 400
+    assert list(uploads.directory.iterdir()) == []
@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from catalogue_snapshot import SnapshotStore
+
+pytestmark = pytest.mark.anyio
+
+def product(n, status='published', name=None):
+    return {
+        'id': f'p{n}', 'name': name or f'Copier {n}', 'status': status,
+        'created_at': datetime(2025, 1, n, tzinfo=timezone.utc),
+    }
+
+@pytest.fixture
+async def store():
+    db = AsyncMongoMockClient(tz_aware=True)['snapshot_tests']
+    await db.products.insert_many([product(3), product(1), product(2, status='draft')])
+    await db.versions.insert_one({'_id': 'products', 'version': 1})
+    store = SnapshotStore(db)
+    await store.load()
+    return store
+
+async def write(db, *products):
+    for doc in products:
+        await db.products.replace_one({'id': doc['id']}, doc, upsert=True)
+    result = await db.versions.find_one_and_update(
+        {'_id': 'products'}, {'$inc': {'version': 1}}, return_document=True
+    )
+    return result['version']
+
+def ids(snapshot):
+    return [p['id'] for p in snapshot.published]
+
+async def test_load_holds_published_products_in_catalogue_order(store):
+    assert ids(store.current) == ['p1', 'p3']
+    assert store.current.versions == {'products': 1}
+    assert '_id' not in store.current.published_by_id['p1']
+
+async def test_next_version_applies_only_the_changed_products(store):
+    version = await write(store.db, product(2), product(3, status='draft'))
+    # A change outside product_ids is not read in an incremental update
+    await store.db.products.update_one({'id': 'p1'}, {'$set': {'name': 'Unseen'}})
+
+    snapshot = await store.apply({'products': version}, ['p2', 'p3'])
+    assert ids(snapshot) == ['p1', 'p2']
+    assert snapshot.versions == {'products': 2}
+    assert snapshot.published_by_id['p1']['name'] == 'Copier 1'
+    assert [p['id'] for _, p in snapshot.search.search('copier 2')][:1] == ['p2']
+    assert store.reloads == 1 and store.updates == 1
+
+async def test_version_gap_rereads_the_collection(store):
+    await write(store.db, product(2))
+    version = await write(store.db, product(1, name='Renamed'))
+
+    # Only the second write is announced; the first must not be lost
+    snapshot = await store.apply({'products': version}, ['p1'])
+    assert ids(snapshot) == ['p1', 'p2', 'p3']
+    assert snapshot.published_by_id['p1']['name'] == 'Renamed'
+    assert snapshot.versions == {'products': 3}
+
+async def test_covered_versions_are_skipped(store):
+    before = store.current
+    assert await store.apply({'products': 1}, ['p1']) is before
+    assert store.updates == 0
+
+async def test_unpublished_product_is_dropped(store):
+    version = await write(store.db, product(1, status='draft'))
+    snapshot = await store.apply({'products': version}, ['p1'])
+    assert ids(snapshot) == ['p3']
+    assert 'p1' not in snapshot.published_by_id
+    assert all(p['id'] != 'p1' for _, p in snapshot.search.search('copier 1'))
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def db(monkeypatch):
+    db = AsyncMongoMockClient(tz_aware=True)['date_tests']
+    monkeypatch.setattr(server, 'db', db)
+    return db
+
+async def test_counts_documents_with_string_dates(db):
+    now = datetime.now(timezone.utc)
+    await db.products.insert_many([
+        {'id': 'p1', 'created_at': now, 'updated_at': now},
+        {'id': 'p2', 'created_at': now, 'updated_at': '2024-05-01T10:00:00'},
+        {'id': 'p3', 'created_at': '2024-05-01T10:00:00', 'updated_at': '2024-05-01T10:00:00'},
+    ])
+    await db.categories.insert_one({'id': 'c1', 'created_at': now})
+    assert await server.count_string_dates() == {'products': 2}
+
+async def test_startup_refuses_unmigrated_dates(db, monkeypatch):
+    started = []
+    async def start():
+        started.append(True)
+    monkeypatch.setattr(server.catalogue, 'start', start)
+
+    await db.categories.insert_one({'id': 'c1', 'created_at': '2024-05-01T10:00:00'})
+    with pytest.raises(RuntimeError, match='1 categories.*migrate-dates'):
+        await server.load_catalogue()
+    assert not started
+
+    await db.categories.update_one({'id': 'c1'}, {'$set': {'created_at': datetime.now(timezone.utc)}})
+    await server.load_catalogue()
+    assert started
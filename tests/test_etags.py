@@ -0,0 +1,47 @@
+import pytest
+from fastapi import Response
+from mongomock_motor import AsyncMongoMockClient
+from starlette.requests import Request
+
+import server
+from catalogue_snapshot import CatalogueSnapshot
+
+pytestmark = pytest.mark.anyio
+
+def request(path, query='', if_none_match=None):
+    headers = [(b'if-none-match', if_none_match.encode())] if if_none_match else []
+    return Request({
+        'type': 'http', 'method': 'GET', 'path': path,
+        'query_string': query.encode(), 'headers': headers,
+    })
+
+@pytest.fixture
+def stale_snapshot(monkeypatch):
+    """This worker's snapshot is at products version 3; MongoDB is at 5"""
+    db = AsyncMongoMockClient(tz_aware=True)['etag_tests']
+    monkeypatch.setattr(server, 'db', db)
+    monkeypatch.setattr(server.catalogue, 'current', CatalogueSnapshot({'products': 3}, [], None, []))
+    return db
+
+async def etag(path, query='', fresh=False):
+    response = Response()
+    assert await server.not_modified(request(path, query), response, 'products', fresh=fresh) is None
+    return response.headers['etag']
+
+async def test_snapshot_responses_use_the_snapshot_version(stale_snapshot):
+    await stale_snapshot.versions.insert_one({'_id': 'products', 'version': 5})
+    assert (await etag('/api/products', 'status=published')).startswith('"products.3-')
+
+async def test_database_responses_read_the_current_version(stale_snapshot):
+    await stale_snapshot.versions.insert_one({'_id': 'products', 'version': 5})
+    assert (await etag('/api/products', 'status=draft', fresh=True)).startswith('"products.5-')
+
+async def test_matching_etag_gets_304(stale_snapshot):
+    await stale_snapshot.versions.insert_one({'_id': 'products', 'version': 5})
+    tag = await etag('/api/products', 'status=draft', fresh=True)
+    cached = await server.not_modified(
+        request('/api/products', 'status=draft', if_none_match=tag), Response(), 'products', fresh=True
+    )
+    assert cached.status_code == 304
+    # A different query is a different resource
+    assert tag != await etag('/api/products', 'status=published', fresh=True)
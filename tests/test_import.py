@@ -0,0 +1,35 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def no_variants(monkeypatch):
+    async def resolve_image_variants(urls):
+        return {}
+    monkeypatch.setattr(server, 'resolve_image_variants', resolve_image_variants)
+
+def product_row(**fields):
+    return {'id': 'p1', 'name': 'Copier', 'description': 'A3', 'price': 10, 'category_id': 'c1', **fields}
+
+async def test_rows_become_upserts_with_defaults_on_insert():
+    ops, ids, errors = await server.import_documents('products', [(1, product_row())])
+    assert (ids, errors) == (['p1'], [])
+    update = ops[0]._doc
+    assert update['$set']['name'] == 'Copier'
+    # Left out of the row, so existing products keep theirs
+    assert 'created_at' in update['$setOnInsert'] and 'created_at' not in update['$set']
+    assert 'status' in update['$setOnInsert']
+
+async def test_images_given_keep_their_variants_in_set():
+    ops, _, _ = await server.import_documents('products', [(1, product_row(images=['http://x/a.jpg']))])
+    update = ops[0]._doc
+    assert update['$set']['images'] == ['http://x/a.jpg']
+    assert 'image_variants' in update['$set']
+
+@pytest.mark.parametrize('images', ['http://x/a.jpg', ['http://x/a.jpg', 3], {'url': 'http://x/a.jpg'}])
+async def test_images_that_are_not_a_list_of_urls_are_row_errors(images):
+    ops, ids, errors = await server.import_documents('products', [(4, product_row(images=images))])
+    assert ops == [] and ids == []
+    assert [line for line, _ in errors] == [4]
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from fastapi import HTTPException
+
+from server import decode_cursor, encode_cursor, keyset_filter, parse_product_sort
+
+@pytest.mark.parametrize('sort, value', [
+    ('price', 12.5),
+    ('-name', 'Canon iR'),
+    ('created_at', datetime(2025, 1, 22, 10, 30, 15, 123000, tzinfo=timezone.utc)),
+    ('price', None),
+])
+def test_cursor_round_trip(sort, value):
+    cursor = encode_cursor(sort, value, 'product-1')
+    assert '=' not in cursor
+    assert decode_cursor(cursor, sort) == (value, 'product-1')
+
+def test_cursor_is_bound_to_its_sort():
+    cursor = encode_cursor('price', 10, 'product-1')
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, '-price')
+    assert error.value.status_code == 400
+
+@pytest.mark.parametrize('cursor', ['not a cursor', 'e30', '!!!', encode_cursor('price', 1, 'x')[:-4]])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 'price')
+    assert error.value.status_code == 400
+
+def test_keyset_filter_breaks_ties_by_id():
+    assert keyset_filter('price', 1, 10, 'b') == {
+        '$or': [{'price': {'$gt': 10}}, {'price': 10, 'id': {'$gt': 'b'}}]
+    }
+    assert keyset_filter('price', -1, 10, 'b') == {
+        '$or': [{'price': {'$lt': 10}}, {'price': 10, 'id': {'$lt': 'b'}}]
+    }
+
+@pytest.mark.parametrize('sort', ['price', '-price', 'created_at', '-created_at'])
+def test_keyset_pages_visit_every_document_once(sort):
+    products = mongomock.MongoClient().db.products
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    # Few distinct values, so pages split runs of equal sort values
+    products.insert_many([
+        {'id': f'p{i:02}', 'price': i % 3, 'created_at': start + timedelta(days=i % 4)}
+        for i in range(20)
+    ])
+    field, direction = parse_product_sort(sort)
+    seen, cursor = [], None
+    while True:
+        query = keyset_filter(field, direction, *decode_cursor(cursor, sort)) if cursor else {}
+        page = list(products.find(query).sort([(field, direction), ('id', direction)]).limit(3))
+        seen += [doc['id'] for doc in page]
+        if len(page) < 3:
+            break
+        cursor = encode_cursor(sort, page[-1][field], page[-1]['id'])
+    expected = sorted(products.find(), key=lambda doc: (doc[field], doc['id']), reverse=direction == -1)
+    assert seen == [doc['id'] for doc in expected]
@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+from catalogue_snapshot import CatalogueSnapshot
+from pdf_cache import PDFCache
+
+pytestmark = pytest.mark.anyio
+
+def pdf(size, fill=b'x'):
+    return b'%PDF' + fill * (size - 4)
+
+async def test_get_returns_what_put_stored(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=1000)
+    assert await cache.get('a') is None
+    await cache.put('a', pdf(100), product_ids=['p1'], category_ids=['c1'])
+    assert await cache.get('a') == pdf(100)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+async def test_evicts_least_recently_used_over_max_bytes(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=250)
+    await cache.put('a', pdf(100), product_ids=['p1'], category_ids=['c1'])
+    await cache.put('b', pdf(100), product_ids=['p2'], category_ids=['c1'])
+    # Reading a makes b the least recently used
+    await cache.get('a')
+    await cache.put('c', pdf(100), product_ids=['p3'], category_ids=['c1'])
+    assert await cache.get('b') is None
+    assert await cache.get('a') is not None
+    assert await cache.get('c') is not None
+    assert cache.total_bytes == 200
+    assert not (tmp_path / 'b.pdf').exists()
+
+async def test_skips_pdfs_larger_than_the_cache(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=50)
+    await cache.put('a', pdf(100), product_ids=['p1'], category_ids=['c1'])
+    assert cache.stats()['entries'] == 0
+
+async def test_invalidate_drops_entries_with_product_or_category(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=1000)
+    await cache.put('a', pdf(10), product_ids=['p1', 'p2'], category_ids=['c1'])
+    await cache.put('b', pdf(10), product_ids=['p3'], category_ids=['c2'])
+    await cache.put('c', pdf(10), product_ids=['p4'], category_ids=['c3'])
+
+    await cache.invalidate(product_ids=['p2'])
+    assert await cache.get('a') is None
+    await cache.invalidate(category_ids=['c2'])
+    assert await cache.get('b') is None
+    assert await cache.get('c') is not None
+    assert cache.invalidations == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['c.json', 'c.pdf']
+
+async def test_clear_drops_every_entry(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=1000)
+    await cache.put('a', pdf(10), product_ids=['p1'], category_ids=['c1'])
+    await cache.put('b', pdf(10), product_ids=['p2'], category_ids=['c1'])
+
+    await cache.clear()
+    assert cache.stats()['entries'] == 0 and cache.invalidations == 2
+    assert list(tmp_path.iterdir()) == []
+
+async def test_index_is_rebuilt_from_disk(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=1000)
+    await cache.put('a', pdf(10), product_ids=['p1'], category_ids=['c1'])
+    reopened = PDFCache(tmp_path, max_bytes=1000)
+    assert reopened.stats()['entries'] == 1
+    # Invalidation still knows what the entry contains
+    await reopened.invalidate(product_ids=['p1'])
+    assert await reopened.get('a') is None
+
+@pytest.fixture
+def catalogue_build(tmp_path, monkeypatch):
+    """build_catalogue_pdf over one published product, with a stubbed render"""
+    product = {
+        'id': 'p1', 'name': 'Copier', 'description': '', 'price': 1.0, 'category_id': 'c1',
+        'images': ['https://images.example/copier.jpg'], 'image_variants': {},
+        'status': 'published', 'created_at': datetime(2025, 1, 1, tzinfo=timezone.utc),
+    }
+    snapshot = CatalogueSnapshot({}, [{'id': 'c1', 'name': 'Copiers'}], None, [product])
+    monkeypatch.setattr(server.catalogue, 'current', snapshot)
+    cache = PDFCache(tmp_path, max_bytes=10 ** 6)
+    monkeypatch.setattr(server, 'pdf_cache', cache)
+    failures = {'fetch': 0}
+
+    async def render(products, category_dict, settings, generated_on, progress, profile=None):
+        return pdf(100), failures['fetch']
+
+    monkeypatch.setattr(server, 'render_catalogue', render)
+    return cache, failures
+
+async def test_complete_builds_are_cached(catalogue_build):
+    cache, _ = catalogue_build
+    assert (await server.build_catalogue_pdf(['p1']))[1] == 'MISS'
+    assert (await server.build_catalogue_pdf(['p1']))[1] == 'HIT'
+    assert cache.stats()['entries'] == 1
+
+async def test_builds_missing_images_are_not_cached(catalogue_build):
+    cache, failures = catalogue_build
+    failures['fetch'] = 1
+    assert (await server.build_catalogue_pdf(['p1']))[1] == 'DEGRADED'
+    assert cache.stats()['entries'] == 0
+    # Once the images can be fetched again the build is cached
+    failures['fetch'] = 0
+    assert (await server.build_catalogue_pdf(['p1']))[1] == 'MISS'
+    assert (await server.build_catalogue_pdf(['p1']))[1] == 'HIT'
@@ -0,0 +1,130 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from pdf_jobs import JobFailed, JobRetry, PDFJobQueue
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient(tz_aware=True)['job_tests']
+
+def queue(db, tmp_path, build, **kwargs):
+    return PDFJobQueue(db, tmp_path, build, concurrency=1, **kwargs)
+
+async def settle(jobs):
+    await asyncio.gather(*jobs._running.values(), return_exceptions=True)
+
+async def test_submitted_job_runs_to_completion(db, tmp_path):
+    async def build(product_ids, progress):
+        progress('images', 1, 2)
+        return b'%PDF-' + ','.join(product_ids).encode()
+
+    jobs = queue(db, tmp_path, build)
+    job = await jobs.submit(['p1', 'p2'])
+    assert job['status'] == 'running' and job['worker'] == jobs.worker_id
+    await settle(jobs)
+
+    done = await jobs.get(job['id'])
+    assert done['status'] == 'completed' and done['progress'] == 1.0
+    assert done['worker'] is None and done['attempts'] == 1
+    assert jobs.path(job['id']).read_bytes() == b'%PDF-p1,p2'
+
+async def test_jobs_over_capacity_wait_in_the_queue(db, tmp_path):
+    release = asyncio.Event()
+    async def build(product_ids, progress):
+        await release.wait()
+        return b'%PDF-'
+
+    jobs = queue(db, tmp_path, build)
+    first = await jobs.submit(['p1'])
+    second = await jobs.submit(['p2'])
+    assert first['status'] == 'running'
+    assert second['status'] == 'queued' and second['attempts'] == 0
+    release.set()
+    await settle(jobs)
+
+async def test_retry_requeues_without_using_an_attempt(db, tmp_path):
+    async def build(product_ids, progress):
+        raise JobRetry("Too many PDF builds in progress")
+
+    jobs = queue(db, tmp_path, build, poll_interval=60)
+    job = await jobs.submit(['p1'])
+    await settle(jobs)
+
+    retried = await jobs.get(job['id'])
+    assert retried['status'] == 'queued' and retried['attempts'] == 0
+    assert retried['worker'] is None
+    # Not claimable again until the poll interval has passed
+    assert retried['lease_until'] > datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert await jobs._claim() is None
+
+async def test_failed_build_shows_its_message(db, tmp_path):
+    async def build(product_ids, progress):
+        raise JobFailed("No products found")
+
+    jobs = queue(db, tmp_path, build)
+    job = await jobs.submit(['p1'])
+    await settle(jobs)
+    failed = await jobs.get(job['id'])
+    assert failed['status'] == 'failed' and failed['error'] == "No products found"
+
+async def insert_orphan(db, attempts):
+    """A running job whose worker stopped renewing its lease"""
+    now = datetime.now(timezone.utc)
+    await db.pdf_jobs.insert_one({
+        'id': 'j1', 'product_ids': ['p1'], 'status': 'running', 'phase': 'layout',
+        'progress': 0.7, 'done': None, 'total': None, 'error': None, 'size': None,
+        'attempts': attempts, 'worker': 'crashed', 'lease_until': now - timedelta(seconds=1),
+        'created_at': now - timedelta(minutes=1), 'started_at': now - timedelta(minutes=1),
+        'finished_at': None, 'expires_at': now + timedelta(hours=1),
+    })
+
+async def test_expired_lease_is_claimed_by_another_worker(db, tmp_path):
+    await insert_orphan(db, attempts=1)
+    jobs = queue(db, tmp_path, None)
+    job = await jobs._claim()
+    assert job['id'] == 'j1' and job['worker'] == jobs.worker_id
+    assert job['attempts'] == 2 and job['phase'] == 'fetch' and job['progress'] == 0.0
+    # The new lease keeps everyone else off it
+    assert await queue(db, tmp_path, None)._claim() is None
+
+async def test_job_is_given_up_after_max_attempts(db, tmp_path):
+    await insert_orphan(db, attempts=3)
+    jobs = queue(db, tmp_path, None, max_attempts=3)
+    assert await jobs._claim() is None
+    given_up = await jobs.get('j1')
+    assert given_up['status'] == 'failed' and given_up['error'] == "Gave up after 3 attempts"
+
+async def test_build_is_cancelled_when_the_lease_is_lost(db, tmp_path):
+    cancelled = asyncio.Event()
+    async def build(product_ids, progress):
+        try:
+            while True:
+                progress('images', 0, 1)
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    jobs = queue(db, tmp_path, build, lease_seconds=0.3)
+    job = await jobs.submit(['p1'])
+    await db.pdf_jobs.update_one({'id': job['id']}, {'$set': {'worker': 'other'}})
+    await asyncio.wait_for(cancelled.wait(), 2)
+    await settle(jobs)
+    assert (await jobs.get(job['id']))['worker'] == 'other'
+
+async def test_stop_hands_running_jobs_over(db, tmp_path):
+    async def build(product_ids, progress):
+        await asyncio.Event().wait()
+
+    jobs = queue(db, tmp_path, build)
+    await jobs.start()
+    job = await jobs.submit(['p1'])
+    await jobs.stop()
+    released = await jobs.get(job['id'])
+    assert released['status'] == 'running' and released['worker'] is None
+    assert released['lease_until'] <= datetime.now(timezone.utc)
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from catalogue_snapshot import CatalogueSnapshot
+from pdf_prebuilt import PrebuiltCatalogues
+
+pytestmark = pytest.mark.anyio
+
+def snapshot(*names):
+    products = [
+        {'id': f'p{i}', 'name': name, 'category_id': 'c1', 'status': 'published',
+         'created_at': datetime(2025, 1, 1 + i, tzinfo=timezone.utc)}
+        for i, name in enumerate(names)
+    ]
+    return CatalogueSnapshot({}, [{'id': 'c1', 'name': 'Copiers'}], None, products)
+
+class Catalogue:
+    def __init__(self, current):
+        self.current = current
+        self.listeners = []
+
+    def swap(self, current):
+        self.current = current
+        for listener in self.listeners:
+            listener(current)
+
+@pytest.fixture
+def prebuilt(tmp_path):
+    catalogue = Catalogue(snapshot('Copier'))
+    builds = []
+    complete = {'value': True}
+
+    async def build(product_ids):
+        builds.append(sorted(product_ids))
+        return b'%PDF-' + ','.join(product_ids).encode(), complete['value']
+
+    catalogues = PrebuiltCatalogues(
+        tmp_path, catalogue, build, lambda: 'January 01, 2025',
+        debounce=0.05, refresh_interval=3600, retry_interval=0.05
+    )
+    return catalogues, catalogue, builds, complete
+
+async def wait_for_builds(builds, count, seconds=2.0):
+    async with asyncio.timeout(seconds):
+        while len(builds) < count:
+            await asyncio.sleep(0.01)
+
+async def test_builds_full_and_category_pdfs_on_start(prebuilt):
+    catalogues, _, builds, _ = prebuilt
+    await catalogues.start()
+    try:
+        await wait_for_builds(builds, 2)
+    finally:
+        await catalogues.stop()
+    assert set(catalogues.built()) == {'all', 'c1'}
+    assert catalogues.path('all').read_bytes() == b'%PDF-p0'
+
+async def test_bursts_of_writes_rebuild_once_after_debounce(prebuilt):
+    catalogues, catalogue, builds, _ = prebuilt
+    await catalogues.start()
+    try:
+        await wait_for_builds(builds, 2)
+        for i in range(5):
+            catalogue.swap(snapshot('Copier', *[f'Printer {n}' for n in range(i + 1)]))
+            await asyncio.sleep(0.01)
+        # Still settling: nothing rebuilt yet
+        assert len(builds) == 2
+        await wait_for_builds(builds, 4)
+        await asyncio.sleep(0.15)
+    finally:
+        await catalogues.stop()
+    assert len(builds) == 4
+    assert builds[-1] == ['p0', 'p1', 'p2', 'p3', 'p4', 'p5']
+
+async def test_unchanged_contents_are_not_rebuilt(prebuilt):
+    catalogues, _, builds, _ = prebuilt
+    assert await catalogues.rebuild()
+    assert await catalogues.rebuild()
+    assert len(builds) == 2
+
+async def test_incomplete_pdfs_are_rebuilt_later(prebuilt):
+    catalogues, _, builds, complete = prebuilt
+    complete['value'] = False
+    await catalogues.start()
+    try:
+        await wait_for_builds(builds, 2)
+        assert catalogues.incomplete()
+        complete['value'] = True
+        await wait_for_builds(builds, 4)
+        await asyncio.sleep(0.1)
+    finally:
+        await catalogues.stop()
+    assert catalogues.incomplete() == []
+
+async def test_stop_right_after_start_returns(prebuilt):
+    catalogues, *_ = prebuilt
+    await catalogues.start()
+    await asyncio.sleep(0)
+    async with asyncio.timeout(1):
+        await catalogues.stop()
+
+async def test_unbuilt_scope_is_not_built_on_request(monkeypatch, tmp_path):
+    monkeypatch.setattr(server.catalogue, 'current', snapshot('Copier'))
+    monkeypatch.setattr(server.prebuilt_catalogues, 'directory', tmp_path)
+    with pytest.raises(HTTPException) as error:
+        await server.get_prebuilt_catalogue('all')
+    assert error.value.status_code == 503
+    assert int(error.value.headers['Retry-After']) >= 1
+    with pytest.raises(HTTPException) as error:
+        await server.get_prebuilt_catalogue('no-such-category')
+    assert error.value.status_code == 404
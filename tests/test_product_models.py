@@ -0,0 +1,59 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pydantic import ValidationError
+
+import server
+from server import ProductBulkRequest, ProductBulkUpdate
+
+pytestmark = pytest.mark.anyio
+
+def test_bulk_update_keeps_only_fields_sent():
+    update = ProductBulkUpdate(id='p1', price=10)
+    assert update.model_dump(exclude_unset=True) == {'id': 'p1', 'price': 10.0}
+
+@pytest.mark.parametrize('field', ['name', 'description', 'price', 'category_id', 'status'])
+def test_bulk_update_rejects_null_for_required_fields(field):
+    with pytest.raises(ValidationError) as error:
+        ProductBulkUpdate.model_validate({'id': 'p1', field: None})
+    assert error.value.errors()[0]['loc'] == (field,)
+
+def test_bulk_update_may_clear_youtube_link():
+    update = ProductBulkUpdate(id='p1', youtube_link=None)
+    assert update.model_dump(exclude_unset=True) == {'id': 'p1', 'youtube_link': None}
+
+@pytest.fixture
+def products_db(monkeypatch):
+    db = AsyncMongoMockClient(tz_aware=True)['bulk_tests']
+    monkeypatch.setattr(server, 'db', db)
+    changed = []
+
+    async def catalogue_changed(collections, product_ids=(), category_ids=()):
+        changed.extend(product_ids)
+    monkeypatch.setattr(server, 'catalogue_changed', catalogue_changed)
+    return db, changed
+
+async def test_invalid_items_fail_alone(products_db):
+    db, changed = products_db
+    await db.products.insert_one({'id': 'p1', 'name': 'Old', 'price': 1.0})
+    bulk = ProductBulkRequest.model_validate({
+        'create': [
+            {'name': 'New', 'description': '', 'price': 5, 'category_id': 'c1'},
+            {'name': 'No price', 'description': '', 'category_id': 'c1'},
+            'not an object',
+        ],
+        'update': [
+            {'id': 'p1', 'name': 'Renamed', 'price': None},
+            {'id': 'p1', 'name': 'Renamed'},
+        ],
+    })
+    result = await server.bulk_products(bulk, payload={})
+
+    assert [item['ok'] for item in result['create']] == [True, False, False]
+    assert 'price' in result['create'][1]['error']
+    assert [item['ok'] for item in result['update']] == [False, True]
+    assert result['update'][0]['id'] == 'p1' and 'price' in result['update'][0]['error']
+
+    assert await db.products.count_documents({}) == 2
+    assert (await db.products.find_one({'id': 'p1'}))['name'] == 'Renamed'
+    assert (await db.products.find_one({'id': 'p1'}))['price'] == 1.0
+    assert len(changed) == 2
@@ -0,0 +1,41 @@
+import random
+
+from search_index import SearchIndex
+
+WORDS = ['canon', 'copier', 'copiers', 'colour', 'laser', 'printer', 'toner', 'a3', 'a4']
+
+def product(product_id, rng):
+    return {
+        'id': product_id,
+        'name': ' '.join(rng.choices(WORDS, k=3)),
+        'description': ' '.join(rng.choices(WORDS, k=6)),
+    }
+
+def ranked(index, query):
+    return sorted((round(score, 9), p['id']) for score, p in index.search(query, limit=1000))
+
+def test_updated_index_matches_a_rebuilt_one():
+    rng = random.Random(7)
+    products = {f'p{i}': product(f'p{i}', rng) for i in range(30)}
+    index = SearchIndex(products.values())
+    for _ in range(200):
+        changed = [product(f'p{rng.randrange(40)}', rng) for _ in range(rng.randrange(3))]
+        removed = [f'p{rng.randrange(40)}' for _ in range(rng.randrange(2))]
+        removed = [pid for pid in removed if pid not in {p['id'] for p in changed}]
+        index = index.updated(changed, removed)
+        for pid in removed:
+            products.pop(pid, None)
+        products.update((p['id'], p) for p in changed)
+
+        rebuilt = SearchIndex(products.values())
+        assert index._terms == rebuilt._terms
+        for query in ('cop', 'canon laser', 'a', 'toner printer'):
+            assert ranked(index, query) == ranked(rebuilt, query)
+
+def test_updated_leaves_the_original_unchanged():
+    original = SearchIndex([{'id': 'p1', 'name': 'Canon copier', 'description': ''}])
+    updated = original.updated([{'id': 'p1', 'name': 'Laser printer', 'description': ''}])
+    assert [p['id'] for _, p in original.search('canon')] == ['p1']
+    assert original.search('laser') == []
+    assert updated.search('canon') == []
+    assert [p['id'] for _, p in updated.search('laser')] == ['p1']